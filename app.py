@@ -16,6 +16,7 @@ load_dotenv(dotenv_path=env_path)
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 WORKFLOWS_FILE = "workflows.yaml"
+TASKS_PAGE_SIZE = 100
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "IMPOSSIBLE_PASSWORD_SEQUENCE_XYZ")
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
@@ -63,10 +64,53 @@ requests = APIClient()
 
 @st.cache_data(ttl=60)
 def fetch_data(endpoint):
+    """Liste de référence complète (pages suivies via l'en-tête X-Next-Cursor)."""
+    rows, cursor = [], None
     try:
-        resp = requests.get(f"{API_URL}/{endpoint}/", timeout=5)
-        return resp.json() if resp.status_code == 200 else []
-    except: return []
+        while True:
+            params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+            resp = requests.get(f"{API_URL}/{endpoint}/", params=params, timeout=5)
+            if resp.status_code != 200: return rows
+            rows.extend(resp.json())
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor: return rows
+    except: return rows
+
+# Statuts du filtre "En attente" (filtrage côté serveur)
+OPEN_STATUSES = ["Nouveau", "À faire", "A faire", "En cours"]
+
+def _fetch_task_pages(path, active_filter, pages, **params):
+    """`pages` pages de `path` (filtre de statut côté serveur). Retourne (tickets, reste-t-il des pages)."""
+    status = {"Clotures": ["Terminé"], "Attente": OPEN_STATUSES}.get(active_filter)
+    rows, cursor = [], None
+    try:
+        for _ in range(pages):
+            query = {**params, "limit": TASKS_PAGE_SIZE, **({"status": status} if status else {}), **({"cursor": cursor} if cursor else {})}
+            resp = requests.get(f"{API_URL}/{path}", params=query, timeout=5)
+            if resp.status_code != 200: break
+            rows.extend(resp.json())
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor: break
+    except: pass
+    return rows, bool(cursor)
+
+@st.cache_data(ttl=10)
+def fetch_stats():
+    """KPI du dashboard : comptages par statut / priorité / nature / groupe (GET /tasks/stats)."""
+    try:
+        resp = requests.get(f"{API_URL}/tasks/stats", timeout=5)
+        return resp.json() if resp.status_code == 200 else {}
+    except: return {}
+
+@st.cache_data(ttl=60)
+def fetch_tasks(active_filter, pages):
+    """Tickets du plus récent au plus ancien."""
+    return _fetch_task_pages("tasks/", active_filter, pages)
+
+@st.cache_data(ttl=60)
+def search_tasks(text, active_filter, pages):
+    """Recherche plein texte côté serveur (résultats classés par pertinence)."""
+    return _fetch_task_pages("tasks/search", active_filter, pages, q=text)
 
 def init_state():
     """Initialisation du moteur d'état."""
@@ -75,6 +119,7 @@ def init_state():
     if "user_email" not in st.session_state: st.session_state["user_email"] = None
     if "active_filter" not in st.session_state: st.session_state["active_filter"] = "Total"
     if "grid_nonce" not in st.session_state: st.session_state["grid_nonce"] = 0
+    if "task_pages" not in st.session_state: st.session_state["task_pages"] = 1
     
     if not st.session_state.get("token"): return
 
@@ -101,6 +146,10 @@ def init_state():
 
 def cb_set_filter(name):
     st.session_state.active_filter = "Total" if st.session_state.active_filter == name and name != "Total" else name
+    st.session_state.task_pages = 1
+
+def cb_load_more_tasks():
+    st.session_state.task_pages += 1
 
 def cb_create_task():
     if not st.session_state.create_title:
@@ -438,11 +487,12 @@ tabs = st.tabs(["📋 Dashboard", "⚡ Flow Designer", "🗄️ Base de données
 
 with tabs[0]:
     try:
-        tasks = fetch_data("tasks")
-        if tasks:
-            # 1. KPIs
-            df_full = pd.DataFrame(tasks)
-            tot, res = len(df_full), len(df_full[df_full['status'] == 'Terminé'])
+        # Tickets chargés page par page (curseur), filtre de statut appliqué par l'API
+        tasks, more_tasks = fetch_tasks(st.session_state.active_filter, st.session_state.task_pages)
+        stats = fetch_stats()
+        if stats.get("total") or tasks:
+            # 1. KPIs (agrégés en SQL par l'API, sans transfert des tickets)
+            tot, res = stats.get("total", 0), stats.get("closed", 0)
             k1, k2, k3 = st.columns(3)
             with k1: st.button(f"📊 {tot}\nTOTAL", on_click=cb_set_filter, args=("Total",), type="primary" if st.session_state.active_filter == "Total" else "secondary", use_container_width=True)
             with k2: st.button(f"✅ {res}\nCLÔTURÉS", on_click=cb_set_filter, args=("Clotures",), type="primary" if st.session_state.active_filter == "Clotures" else "secondary", use_container_width=True)
@@ -452,16 +502,16 @@ with tabs[0]:
             with st.container(border=True):
                 c_r, c_s = st.columns([1, 4])
                 with c_r: st.button("🔄 ACTUALISER", type="secondary", width='stretch', key="ref_dash")
-                with c_s: search = st.text_input("Recherche", placeholder="Filtrer ID, Titre, Nature, Description...", label_visibility="collapsed", key="search_input")
+                with c_s: search = st.text_input("Recherche", placeholder="Rechercher : ID, Titre, Description, Tags...", label_visibility="collapsed", key="search_input")
 
             # 3. Filtrage Logique
             f_tasks = tasks
-            if st.session_state.active_filter == "Clotures": f_tasks = [t for t in tasks if t['status'] == 'Terminé']
-            elif st.session_state.active_filter == "Attente": f_tasks = [t for t in tasks if t['status'] != 'Terminé']
             
-            if search:
-                q = search.lower()
-                f_tasks = [t for t in f_tasks if any(q in str(v).lower() for v in t.values())]
+            if search.strip():
+                # Recherche plein texte par l'API (index) ; un numéro sélectionne aussi le ticket de cet ID
+                f_tasks, more_tasks = search_tasks(search.strip(), st.session_state.active_filter, st.session_state.task_pages)
+                by_id = [t for t in tasks if search.strip().isdigit() and t['id'] == int(search.strip())]
+                f_tasks = by_id + [t for t in f_tasks if t['id'] not in {b['id'] for b in by_id}]
 
             # 4. Préparation et Rendu de la Grille
             if f_tasks:
@@ -557,6 +607,8 @@ with tabs[0]:
                         if st.session_state.authenticated:
                             b_del.button("🗑️ SUPPRIMER", on_click=cb_delete_task, args=(tid,), type="secondary", key=f"btn_del_task_{tid}")
             else: st.info("Aucun résultat.")
+            if more_tasks:
+                st.button(f"⬇️ CHARGER {TASKS_PAGE_SIZE} TICKETS DE PLUS", on_click=cb_load_more_tasks, type="secondary", key="more_tasks")
     except Exception as e: st.error(f"Erreur d'affichage : {e}")
 
 # --- TAB 1 (0): Dashboard (Implemented above) ---
@@ -928,7 +980,8 @@ with tabs[3]:
             if st.button("VÉRIFIER INTÉGRITÉ RÈGLES", type="secondary"):
                 try:
                     from engine import check_rules_integrity
-                    alerts = check_rules_integrity()
+                    resp = requests.get(f"{API_URL}/workflows/rules", timeout=5)
+                    alerts = check_rules_integrity(rules=resp.json()["rules"] if resp.status_code == 200 else None)
                     if alerts:
                         for a in alerts: st.warning(a)
                     else: st.success("✅ Toutes les règles sont valides.")
@@ -948,4 +1001,16 @@ with tabs[3]:
             logs = requests.get(f"{API_URL}/audit/logs").json()
             if logs: st.dataframe(pd.DataFrame(logs).sort_values('id', ascending=False), width='stretch', hide_index=True)
         except: st.error("Erreur Logs")
+
+        st.subheader("🔎 Traces du Moteur")
+        trace_tid = st.number_input("ID du ticket", min_value=1, step=1, key="trace_task_id")
+        if st.button("AFFICHER LES TRACES", type="secondary"):
+            try:
+                traces = requests.get(f"{API_URL}/tasks/{int(trace_tid)}/traces").json()
+                if traces:
+                    df_tr = pd.DataFrame(traces)
+                    df_tr['ts'] = pd.to_datetime(df_tr['ts'], unit='s')
+                    st.dataframe(df_tr[['ts', 'level', 'event', 'rule', 'message']], width='stretch', hide_index=True)
+                else: st.info("Aucune trace récente pour ce ticket (tampon mémoire de l'API).")
+            except: st.error("Erreur Traces")
     else: st.warning("🔐 Accès Admin requis")
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Vérification locale des jetons Supabase (JWT) pour la dépendance get_user_from_token de main.py.
+
+    - signature et expiration vérifiées sur place : secret partagé (SUPABASE_JWT_SECRET, HS256)
+      ou clés publiques du projet (JWKS, mises en cache par PyJWKClient)
+    - cache LRU borné (AUTH_CACHE_SIZE) des claims validés, chaque entrée expirant au plus tard
+      à l'expiration du jeton (AUTH_CACHE_TTL) : un jeton déjà vu ne coûte qu'une recherche en mémoire
+    - appel distant à GoTrue (auth_client.get_user) uniquement en voie lente : jeton non JWT,
+      aucune clé locale configurée, ou confirmation demandée par AUTH_REMOTE_CHECK=1 (révocation)
+      lors d'un défaut de cache ; un jeton vérifié à distance n'est mis en cache que si son
+      expiration est lisible, et au plus jusqu'à celle-ci
+Les clés du cache sont des empreintes SHA-256 : aucun jeton n'est conservé en clair.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+import jwt
+import metrics
+
+# Configuration (surchargeable par variables d'environnement)
+JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET", "").strip()
+JWKS_URL = os.environ.get("SUPABASE_JWKS_URL", "").strip()
+AUDIENCE = os.environ.get("AUTH_AUDIENCE", "authenticated")
+LEEWAY = float(os.environ.get("AUTH_LEEWAY", "30"))
+CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "300"))
+REMOTE_CHECK = os.environ.get("AUTH_REMOTE_CHECK", "0") == "1"
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+
+STATS = {"hits": 0, "misses": 0, "remote": 0, "rejected": 0}
+
+class AuthError(Exception):
+    """Jeton absent, invalide, expiré ou refusé."""
+
+class NoLocalKey(AuthError):
+    """Aucune clé locale ne permet de vérifier ce jeton (voie distante possible)."""
+
+class TokenCache:
+    """Cache LRU à durée de vie : empreinte du jeton -> (échéance monotone, utilisateur)."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, user, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+_cache = TokenCache()
+_config = {"secret": JWT_SECRET, "jwks_url": JWKS_URL, "jwks_client": None, "keys": None}
+
+def configure(secret=None, jwks_url=None, public_keys=None, supabase_url=None):
+    """
+    Sources de clés : `secret` (HS256), `jwks_url` (déduite de `supabase_url` si absente),
+    ou `public_keys` {kid: clé publique} fournies directement (tests, clés épinglées).
+    """
+    if secret is not None:
+        _config["secret"] = secret
+    if jwks_url is None and supabase_url and not _config["jwks_url"]:
+        jwks_url = f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json"
+    if jwks_url is not None:
+        _config["jwks_url"] = jwks_url
+        _config["jwks_client"] = None
+    if public_keys is not None:
+        _config["keys"] = dict(public_keys)
+    _cache.clear()
+
+def local_verification_enabled():
+    return bool(_config["secret"] or _config["jwks_url"] or _config["keys"])
+
+def _signing_key(token):
+    """Clé de vérification et algorithmes admis pour `token`."""
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.DecodeError:
+        # Jeton opaque : seul le serveur d'authentification peut en juger
+        raise NoLocalKey("Jeton non JWT")
+    algorithm = header.get("alg")
+    if algorithm == "HS256":
+        if not _config["secret"]:
+            raise NoLocalKey("Jeton HS256 sans secret configuré")
+        return _config["secret"], ["HS256"]
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        raise AuthError(f"Algorithme refusé : {algorithm}")
+    keys = _config["keys"]
+    if keys is not None:
+        key = keys.get(header.get("kid"))
+        if key is None:
+            raise AuthError("Clé de signature inconnue")
+        return key, [algorithm]
+    if not _config["jwks_url"]:
+        raise NoLocalKey("Aucune clé publique configurée")
+    client = _config["jwks_client"]
+    if client is None:
+        client = _config["jwks_client"] = jwt.PyJWKClient(_config["jwks_url"], cache_keys=True, lifespan=3600, timeout=5)
+    try:
+        return client.get_signing_key_from_jwt(token).key, [algorithm]
+    except jwt.PyJWKClientError as e:
+        raise NoLocalKey(f"JWKS indisponible : {e}")
+
+def _user_from_claims(claims):
+    return SimpleNamespace(id=claims.get("sub"), email=claims.get("email"), role=claims.get("role"), claims=claims)
+
+def verify_local(token):
+    """
+    Claims du jeton après vérification de la signature, de l'expiration et de l'audience.
+    NoLocalKey si aucune clé locale n'est configurée pour ce jeton.
+    """
+    if not local_verification_enabled():
+        raise NoLocalKey("Vérification locale non configurée")
+    try:
+        key, algorithms = _signing_key(token)
+        return jwt.decode(token, key, algorithms=algorithms, audience=AUDIENCE, leeway=LEEWAY,
+                          options={"require": ["exp", "sub"]})
+    except jwt.PyJWTError as e:
+        raise AuthError(str(e))
+
+def _unverified_exp(token):
+    """Expiration lue sans vérifier la signature (voie distante), None si illisible."""
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError:
+        return None
+    return exp if isinstance(exp, (int, float)) else None
+
+def _remote_user(token, remote):
+    STATS["remote"] += 1
+    metrics.inc("liteflow_auth_tokens_total", ("remote",))
+    try:
+        response = remote(token)
+    except Exception as e:
+        raise AuthError(f"Vérification distante impossible : {e}")
+    user = getattr(response, "user", None) if response else None
+    if user is None:
+        raise AuthError("Jeton refusé par le serveur d'authentification")
+    return user
+
+def verify(token, remote=None):
+    """
+    Utilisateur associé à `token` ; AuthError si le jeton est refusé.
+    `remote` : callable(token) -> réponse GoTrue (voie lente), None si indisponible.
+    """
+    if not token:
+        raise AuthError("Jeton manquant")
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    user = _cache.get(key)
+    if user is not None:
+        STATS["hits"] += 1
+        metrics.inc("liteflow_auth_tokens_total", ("hit",))
+        return user
+    STATS["misses"] += 1
+    metrics.inc("liteflow_auth_tokens_total", ("miss",))
+
+    try:
+        try:
+            claims = verify_local(token)
+        except NoLocalKey:
+            # Voie lente : vérification par GoTrue lorsque aucune clé locale ne s'applique
+            if remote is None:
+                raise
+            user = _remote_user(token, remote)
+            exp = _unverified_exp(token)
+            ttl = min(CACHE_TTL, exp - time.time()) if exp is not None else 0
+        else:
+            user = _user_from_claims(claims)
+            if REMOTE_CHECK and remote is not None:
+                _remote_user(token, remote)
+            ttl = min(CACHE_TTL, claims["exp"] - time.time())
+    except AuthError:
+        STATS["rejected"] += 1
+        metrics.inc("liteflow_auth_tokens_total", ("rejected",))
+        raise
+    _cache.put(key, user, ttl)
+    return user
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Rejeu des workflows sur les tickets ouverts existants (après modification d'une règle).
+
+Les IDs des tâches ouvertes sont découpés en lots traités en parallèle par un
+ProcessPoolExecutor (une connexion / session DB par processus). Un fichier de
+reprise mémorise le plus grand ID dont tous les lots précédents sont terminés, ainsi
+que les lots terminés au-delà : une exécution interrompue reprend là où elle s'était
+arrêtée, sans rejouer aucun lot terminé.
+
+Exemples :
+    python backfill_workflows.py --dry-run
+    python backfill_workflows.py --rule "CRITIQUE" --workers 4 --chunk-size 500
+    python backfill_workflows.py --reset          # ignore le point de reprise
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_CHECKPOINT = "backfill_checkpoint.json"
+TOTAL_KEYS = ("tasks", "matched", "updated", "children", "logs")
+
+# --- PROCESSUS DE TRAVAIL ---
+
+def _init_worker(trace_level):
+    """Chaque processus ouvre ses propres connexions (le pool hérité du parent n'est pas partagé)."""
+    import tracing
+    from database import engine as db_engine, SessionLocal
+    from engine import use_rules_database
+    db_engine.dispose(close=False)
+    tracing.configure(level=trace_level)
+    # Règles actives : version enregistrée dans `workflow_rules` (fichier YAML à défaut)
+    use_rules_database(SessionLocal)
+
+def _select_rules(rule_names):
+    from engine import CompiledRuleSet, get_compiled_rules, load_workflows
+    if not rule_names:
+        return get_compiled_rules()
+    rules = [r for r in load_workflows() if isinstance(r, dict) and r.get('name') in rule_names]
+    return CompiledRuleSet(rules)
+
+def run_chunk(task_ids, dry_run=False, rule_names=None):
+    """Traite un lot de tâches dans une session dédiée et retourne son résumé."""
+    from database import SessionLocal
+    from engine import process_workflow_many
+    db = SessionLocal()
+    try:
+        return process_workflow_many(task_ids, db, dry_run=dry_run, compiled=_select_rules(rule_names))
+    finally:
+        db.close()
+
+# --- PLANIFICATION ---
+
+def open_task_ids(after_id=0):
+    from database import SessionLocal
+    from models import Task
+    db = SessionLocal()
+    try:
+        rows = db.query(Task.id).filter(
+            Task.closed_at.is_(None), Task.status != "Terminé", Task.id > after_id
+        ).order_by(Task.id).all()
+        return [row.id for row in rows]
+    finally:
+        db.close()
+
+def make_chunks(task_ids, size):
+    return [task_ids[i:i + size] for i in range(0, len(task_ids), size)]
+
+def skip_done(task_ids, done_ranges):
+    """Retire les IDs couverts par les lots déjà terminés ([premier_id, dernier_id], triés)."""
+    if not done_ranges:
+        return task_ids
+    starts = [lo for lo, _ in done_ranges]
+    kept = []
+    for task_id in task_ids:
+        i = bisect.bisect_right(starts, task_id) - 1
+        if i < 0 or task_id > done_ranges[i][1]:
+            kept.append(task_id)
+    return kept
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"[BACKFILL] Point de reprise illisible ({e}), reprise depuis le début")
+        return None
+
+def save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _report(done_chunks, total_chunks, done_tasks, total_tasks, started):
+    elapsed = time.perf_counter() - started
+    rate = done_tasks / elapsed if elapsed > 0 else 0.0
+    eta = (total_tasks - done_tasks) / rate if rate > 0 else 0.0
+    print(f"[BACKFILL] Lots {done_chunks}/{total_chunks} | Tâches {done_tasks}/{total_tasks} "
+          f"| {rate:.0f} tâches/s | reste ~{eta:.0f} s")
+
+def backfill(workers=None, chunk_size=500, dry_run=False, rule_names=None,
+             checkpoint=DEFAULT_CHECKPOINT, reset=False, trace_level="OFF", executor=None):
+    """
+    Rejoue les workflows sur toutes les tâches ouvertes. Retourne le résumé cumulé.
+    `executor` permet d'injecter un autre exécuteur (tests).
+
+    Le point de reprise mémorise le plus grand ID dont tous les lots précédents sont terminés
+    (`last_id`) et les plages des lots terminés au-delà (`done`) : les lots finissent dans le
+    désordre, et un lot rejoué dupliquerait ses sous-tâches et ses entrées d'audit.
+    """
+    state = None if (reset or dry_run) else load_checkpoint(checkpoint)
+    if state and state.get("rules") != (sorted(rule_names) if rule_names else None):
+        print("[BACKFILL] Point de reprise créé pour d'autres règles : ignoré")
+        state = None
+    after_id = state["last_id"] if state else 0
+    done_ranges = sorted(tuple(r) for r in state.get("done", [])) if state else []
+    totals = dict(state["totals"]) if state else dict.fromkeys(TOTAL_KEYS, 0)
+
+    task_ids = skip_done(open_task_ids(after_id), done_ranges)
+    chunks = make_chunks(task_ids, chunk_size)
+    mode = "DRY-RUN" if dry_run else "ÉCRITURE"
+    print(f"[BACKFILL] {len(task_ids)} tâche(s) ouverte(s) après #{after_id}"
+          + (f" ({len(done_ranges)} lot(s) déjà terminé(s) ignoré(s))" if done_ranges else "")
+          + f", {len(chunks)} lot(s) de {chunk_size} [{mode}]")
+    if not chunks:
+        if not dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        return dict(totals, changes=[]) if dry_run else totals
+
+    pool = executor or ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(trace_level,))
+    changes = []
+    finished = [False] * len(chunks)
+    watermark = 0       # nombre de lots consécutifs terminés depuis le début
+    done_tasks = 0
+    started = time.perf_counter()
+    try:
+        futures = {pool.submit(run_chunk, chunk, dry_run, rule_names): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            index = futures[future]
+            summary = future.result()
+            finished[index] = True
+            done_tasks += len(chunks[index])
+            for key in TOTAL_KEYS:
+                totals[key] += summary.get(key, 0)
+            changes.extend(summary.get("changes", []))
+
+            while watermark < len(chunks) and finished[watermark]:
+                watermark += 1
+            if not dry_run:
+                last_id = chunks[watermark - 1][-1] if watermark else after_id
+                done = [r for r in done_ranges if r[1] > last_id]
+                done += [(chunks[i][0], chunks[i][-1]) for i in range(watermark, len(chunks)) if finished[i]]
+                save_checkpoint(checkpoint, {
+                    "last_id": last_id,
+                    "done": sorted(done),
+                    "rules": sorted(rule_names) if rule_names else None,
+                    "totals": totals,
+                    "updated_at": time.time(),
+                })
+            _report(sum(finished), len(chunks), done_tasks, len(task_ids), started)
+    finally:
+        if executor is None:
+            pool.shutdown(cancel_futures=True)
+
+    if not dry_run and watermark == len(chunks) and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    elapsed = time.perf_counter() - started
+    print(f"[BACKFILL] Terminé en {elapsed:.1f} s : {totals['matched']} tâche(s) concernée(s), "
+          f"{totals['updated']} mise(s) à jour, {totals['children']} sous-tâche(s)")
+    if dry_run:
+        return dict(totals, changes=changes)
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rejoue les workflows sur les tickets ouverts.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Nombre de processus (défaut : nombre de CPU)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Tâches par lot (un commit par lot)")
+    parser.add_argument("--rule", action="append", dest="rules", help="Limiter à une règle (option répétable)")
+    parser.add_argument("--dry-run", action="store_true", help="N'écrit rien, affiche les modifications prévues")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Fichier de reprise")
+    parser.add_argument("--reset", action="store_true", help="Ignore le point de reprise existant")
+    parser.add_argument("--trace", default="OFF", choices=["OFF", "INFO", "DEBUG"], help="Niveau de trace du moteur")
+    args = parser.parse_args(argv)
+
+    result = backfill(workers=args.workers, chunk_size=args.chunk_size, dry_run=args.dry_run,
+                      rule_names=args.rules, checkpoint=args.checkpoint, reset=args.reset,
+                      trace_level=args.trace)
+    if args.dry_run:
+        for change in sorted(result["changes"], key=lambda c: c["task_id"]):
+            print(f"  #{change['task_id']} : {', '.join(change['rules'])} -> {change['fields']}"
+                  + (f" + {len(change['children'])} sous-tâche(s)" if change['children'] else "")
+                  + (" [clôture]" if change['completed'] else ""))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Banc d'essai des routes de lecture de l'API : mode sync (handlers du threadpool, moteur
+bloquant) contre mode async (handlers coroutines, moteur asyncpg / aiosqlite).
+
+Pour chaque mode, un serveur uvicorn est lancé avec API_DB_MODE=<mode> sur la même base,
+puis chargé par `--concurrency` clients simultanés pendant `--duration` secondes.
+L'authentification passe par la vérification locale des JWT (secret HS256 généré pour
+l'occasion) : aucun appel à Supabase Auth ne fausse les mesures.
+
+Exemples :
+    python bench_api.py                                   # base SQLite locale bench_api.db, 2000 tickets
+    python bench_api.py --db-url postgresql://... --concurrency 128 --duration 30
+    python bench_api.py --path "/tasks/?limit=50" --path /tasks/stats --json resultats.json
+"""
+import os
+import sys
+import json
+import time
+import secrets
+import asyncio
+import argparse
+import subprocess
+
+DEFAULT_PATHS = ["/tasks/?limit=50", "/tasks/stats", "/classifications/", "/users/?limit=50"]
+DEFAULT_DB = "sqlite:///./bench_api.db"
+
+# --- PRÉPARATION ---
+
+def seed(db_url, count):
+    """Complète la table `tasks` jusqu'à `count` tickets (processus séparé : database.py lit l'URL à l'import)."""
+    code = f"""
+import models
+from database import SessionLocal, init_db
+init_db()
+db = SessionLocal()
+try:
+    if db.query(models.TaskClassification).count() == 0:
+        db.add_all([models.TaskClassification(name="Incidents"), models.TaskClassification(name="Demandes")])
+        db.commit()
+    classification_ids = [c.id for c in db.query(models.TaskClassification).all()]
+    missing = {count} - db.query(models.Task).count()
+    statuses, priorities = ["Nouveau", "En cours", "Terminé"], ["Basse", "Moyenne", "Haute", "Critique"]
+    for i in range(max(missing, 0)):
+        db.add(models.Task(title=f"Ticket de charge {{i}}", description="Banc d'essai de l'API",
+                           status=statuses[i % 3], priority=priorities[i % 4],
+                           classification_id=classification_ids[i % len(classification_ids)]))
+    db.commit()
+    print(f"[BENCH] {{db.query(models.Task).count()}} tickets en base")
+finally:
+    db.close()
+"""
+    subprocess.run([sys.executable, "-c", code], env=dict(os.environ, SUPABASE_DB_URL=db_url), check=True)
+
+def make_token(secret):
+    import jwt
+    claims = {"sub": "bench", "aud": "authenticated", "role": "authenticated", "exp": int(time.time()) + 3600}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+def start_server(mode, db_url, port, secret):
+    env = dict(os.environ, SUPABASE_DB_URL=db_url, API_DB_MODE=mode, SUPABASE_JWT_SECRET=secret,
+               SUPABASE_URL="", SUPABASE_KEY="", SUPABASE_JWKS_URL="", ENGINE_TRACE_LEVEL="OFF")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+
+async def wait_ready(server, client, base_url, headers, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté (code {server.returncode})")
+        try:
+            if (await client.get(f"{base_url}/metrics", headers=headers)).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Le serveur n'a pas démarré")
+
+# --- CHARGE ---
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+async def load(server, base_url, token, paths, concurrency, duration, warmup):
+    import httpx
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await wait_ready(server, client, base_url, headers)
+        latencies, errors = [], 0
+        start = time.monotonic()
+        measure_from, deadline = start + warmup, start + warmup + duration
+
+        async def user(offset):
+            nonlocal errors
+            i = offset
+            while True:
+                sent = time.monotonic()
+                if sent >= deadline:
+                    return
+                try:
+                    ok = (await client.get(base_url + paths[i % len(paths)], headers=headers)).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if sent >= measure_from:
+                    latencies.append(time.monotonic() - sent)
+                    errors += not ok
+                i += 1
+
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+def run_mode(mode, args, secret, token):
+    server = start_server(mode, args.db_url, args.port, secret)
+    try:
+        return asyncio.run(load(server, f"http://127.0.0.1:{args.port}", token, args.path or DEFAULT_PATHS,
+                                args.concurrency, args.duration, args.warmup))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare le débit et la latence p99 des routes de lecture en mode sync et async.")
+    parser.add_argument("--db-url", default=os.environ.get("BENCH_DB_URL", DEFAULT_DB))
+    parser.add_argument("--tasks", type=int, default=2000, help="Nombre minimal de tickets en base")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0, help="Durée mesurée par mode (s)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Chauffe non mesurée (s)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mode", action="append", choices=["sync", "async"], help="Modes comparés (défaut : les deux)")
+    parser.add_argument("--path", action="append", help="Route chargée, répétable (défaut : tickets, KPI, natures, utilisateurs)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Fichier de résultats JSON")
+    args = parser.parse_args(argv)
+
+    seed(args.db_url, args.tasks)
+    secret = secrets.token_urlsafe(32)
+    token = make_token(secret)
+    results = {}
+    for mode in args.mode or ["sync", "async"]:
+        print(f"[BENCH] Mode {mode} : {args.concurrency} clients, {args.duration:.0f} s")
+        results[mode] = run_mode(mode, args, secret, token)
+
+    print(f"\n{'mode':<6} {'requêtes':>9} {'erreurs':>8} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<6} {r['requests']:>9} {r['errors']:>8} {r['rps']:>9.1f} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r["errors"] == 0 for r in results.values()) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
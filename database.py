@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -14,5 +15,47 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Moteur asynchrone des routes de lecture de l'API (API_DB_MODE=async) : asyncpg pour
+# PostgreSQL, aiosqlite en local. Le worker du moteur de workflow, les minuteurs et les
+# scripts restent sur le moteur synchrone ci-dessus.
+API_DB_MODE = os.environ.get("API_DB_MODE", "async").strip().lower()
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def async_database_url(url):
+    """URL du pilote asynchrone correspondant à `url` (postgresql:// -> asyncpg, sqlite:// -> aiosqlite)."""
+    url = make_url(url)
+    backend = url.drivername.split("+")[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Aucun pilote asynchrone pour {url.drivername}")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    # asyncpg n'accepte pas `sslmode` (paramètre libpq) : équivalent `ssl`
+    if backend != "sqlite" and "sslmode" in url.query:
+        url = url.update_query_dict({"ssl": url.query["sslmode"]}).difference_update_query(["sslmode"])
+    return url
+
+def _create_async_engine():
+    if API_DB_MODE != "async":
+        return None
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        url = async_database_url(SQLALCHEMY_DATABASE_URL)
+        connect_args = {}
+        # Pooler Supabase (pgbouncer, mode transaction) : pas de requêtes préparées côté serveur
+        if url.drivername == "postgresql+asyncpg" and url.port == 6543:
+            connect_args["statement_cache_size"] = 0
+        return create_async_engine(url, connect_args=connect_args)
+    except (ImportError, ValueError) as e:
+        print(f"[SGBD] Moteur asynchrone indisponible, routes de lecture en mode sync : {e}")
+        return None
+
+async_engine = _create_async_engine()
+
+if async_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    AsyncSessionLocal = None
+
 def init_db():
     Base.metadata.create_all(bind=engine)
@@ -1,8 +1,22 @@
 import yaml
 import os
-import streamlit as st
-from sqlalchemy.orm import Session
-from models import Task, AuditLog
+import copy
+import time
+import hashlib
+import json
+import threading
+import datetime
+from types import SimpleNamespace
+from collections import deque
+from sqlalchemy import insert, update, select, literal, cast, func, and_, or_, true, false, String, DateTime
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.exc import IntegrityError
+from models import Task, AuditLog, WorkflowTimer, WorkflowRuleVersion, get_utc_now
+import metrics
+import tracing
+import refdata
+import operators
+from tracing import INFO, DEBUG
 
 # Configuration
 RULES_FILE = "workflows.yaml"
@@ -14,7 +28,9 @@ MAPPING = {
     'Assigné à': 'assigned_to', 
     'Titre': 'title', 
     'Description': 'description',
-    'Tags': 'tags'
+    'Tags': 'tags',
+    'ID': 'id',
+    'Créé le': 'created_at'
 }
 
 # --- FONCTIONS UTILITAIRES (Celles qui manquaient) ---
@@ -28,16 +44,12 @@ def normalize_status(val):
         return "À faire"
     return val
 
-@st.cache_data(ttl=60)
 def load_workflows():
-    if not os.path.exists(RULES_FILE):
-        return []
-    try:
-        with open(RULES_FILE, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f) or []
-    except Exception as e:
-        print(f"[ENGINE] Erreur lecture YAML: {e}")
-        return []
+    """
+    Règles brutes (liste de dicts) actives : version en base ou fichier workflows.yaml.
+    Retourne une copie : l'appelant (Flow Designer) peut la modifier librement.
+    """
+    return copy.deepcopy(_refresh_rules()["rules"])
 
 def get_task_value(task, field_key):
     """Récupère la valeur d'un champ de la tâche de manière robuste (String)."""
@@ -48,62 +60,861 @@ def get_task_value(task, field_key):
     return str(val).strip() if val is not None else ""
 
 def check_condition(task_val, operator, rule_val):
-    """Compare la valeur de la tâche avec la règle (Insensible à la casse)."""
-    t_val = task_val.lower()
-    
-    # Cas 1 : La règle est une LISTE (Multi-Select)
-    if isinstance(rule_val, list):
-        r_vals = [str(v).lower() for v in rule_val]
-        if t_val in r_vals:
-            return True, f"'{task_val}' est dans {rule_val}"
-        return False, f"'{task_val}' PAS dans {rule_val}"
-
-    # Cas 2 : La règle est une CHAINE
-    r_val = str(rule_val).lower()
-    
-    if operator in ['Contient', 'contains']:
-        if r_val in t_val: return True, f"'{r_val}' trouvé dans '{task_val}'"
-        return False, f"'{r_val}' PAS trouvé dans '{task_val}'"
-    
-    elif operator in ['Est égal à', 'equals', 'Est parmi']:
-        if r_val == t_val: return True, f"'{r_val}' == '{task_val}'"
-        return False, f"'{r_val}' != '{task_val}'"
-        
-    elif operator in ['Commence par', 'starts_with']:
-        if t_val.startswith(r_val): return True, f"Début OK"
-        return False, f"Début KO"
-        
-    return False, "Opérateur inconnu"
+    """Compare la valeur de la tâche avec la règle (Insensible à la casse). Retourne (résultat, explication)."""
+    cond = CompiledCondition(None, 'value', operator, rule_val)
+    return cond.evaluate(TaskValues(SimpleNamespace(value=task_val)))
 
-def cascade_completion(task, db: Session):
+# --- RÈGLES COMPILÉES (Dispatch indexé par champ) ---
+
+# Champs pour lesquels les déclencheurs d'égalité / 'Est parmi' sont indexés
+INDEXED_FIELDS = ('priority', 'status', 'assigned_to')
+
+# Automate multi-motifs ('Contient' / 'Commence par')
+# En dessous de ce nombre de motifs, une boucle de `in` (en C) reste plus rapide
+AUTOMATON_MIN_PATTERNS = 8
+
+class PatternAutomaton:
+    """
+    Automate Aho-Corasick construit une fois pour tous les motifs d'un champ.
+    Une seule passe sur le texte renvoie (motifs trouvés, motifs trouvés en début de texte).
+    """
+    __slots__ = ('patterns', '_lengths', '_empty', '_goto', '_fail', '_out')
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._lengths = [len(p) for p in self.patterns]
+        self._empty = frozenset(pid for pid, p in enumerate(self.patterns) if not p)
+        self._goto = None
+        if len(self.patterns) >= AUTOMATON_MIN_PATTERNS:
+            self._build()
+
+    def _build(self):
+        goto, out = [{}], [()]
+        for pid, pat in enumerate(self.patterns):
+            if not pat:
+                continue
+            state = 0
+            for ch in pat:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    out.append(())
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state] += (pid,)
+
+        # Liens d'échec (parcours en largeur)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            r = queue.popleft()
+            for ch, s in goto[r].items():
+                queue.append(s)
+                f = fail[r]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[s] = goto[f].get(ch, 0)
+                out[s] += out[fail[s]]
+
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def scan(self, text):
+        if self._goto is None:
+            found = {pid for pid, p in enumerate(self.patterns) if p in text}
+            return found, {pid for pid in found if text.startswith(self.patterns[pid])}
+
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        found, prefixes = set(self._empty), set(self._empty)
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hits = out[state]
+            if hits:
+                found.update(hits)
+                for pid in hits:
+                    if lengths[pid] == i + 1:
+                        prefixes.add(pid)
+        return found, prefixes
+
+class DecisionNode:
+    """Nœud du graphe de décision (condition ou groupe), résultat mémorisé par tâche dans TaskValues.memo."""
+    __slots__ = ()
+
+    def check(self, values):
+        """Résultat mémorisé pour la tâche (un seul calcul par tâche, toutes règles confondues)."""
+        memo = values.memo
+        ok = memo.get(self)
+        if ok is None:
+            started = time.perf_counter()
+            ok = memo[self] = self.test(values)
+            stats = self.stats
+            if stats is not None:
+                stats[0] += 1
+                stats[2] += time.perf_counter() - started
+                if ok:
+                    stats[1] += 1
+        return ok
+
+    def evaluate(self, values):
+        ok = self.test(values)
+        return ok, self.explain(values, ok)
+
+class CompiledCondition(DecisionNode):
     """
-    Propagate 'Terminé' status to children.
+    Déclencheur pré-traité une seule fois (MAPPING résolu, opérateur du registre compilé
+    en fermeture `test`, cf. operators.py). Évaluer une condition = un appel de fonction.
+    Nœud feuille du graphe de décision : une condition identique citée par plusieurs
+    règles n'est compilée (et évaluée pour une tâche) qu'une fois.
     """
-    # Ensure children are loaded
-    if not task.children:
+    __slots__ = ('label', 'field', 'operator', 'value', 'op', 'error', 'choices', 'needle', 'matcher', 'pattern_id',
+                 'stats', 'test', 'key', 'fields', 'title')
+
+    def __init__(self, label, field, operator, value):
+        self.label = label
+        self.field = field
+        self.operator = operator
+        self.value = value
+        self.op = operators.get(operator)
+        self.error = operators.validate(field, operator, value)
+        self.choices = frozenset(str(v).lower() for v in value) if isinstance(value, list) else None
+        self.needle = None if isinstance(value, list) else str(value).lower()
+        # Renseignés par CompiledRuleSet pour les déclencheurs 'Contient' / 'Commence par'
+        self.matcher = None
+        self.pattern_id = None
+        # Renseigné par CompiledRuleSet : [évaluations, succès, coût cumulé (s)]
+        self.stats = None
+        self.test = operators.compile_test(field, operator, value)
+        # Identité dans le graphe de décision (mutualisation entre règles) et clé des statistiques
+        canonical = self.op.name if self.op is not None else operator
+        self.key = (field, canonical, self.choices if self.choices is not None else str(value))
+        self.fields = frozenset([field])
+        self.title = f"{label} {operator}"
+
+    def bind_matcher(self, matcher, pattern_id):
+        """Évaluation par l'automate partagé du champ (un seul parcours du texte pour tous les motifs)."""
+        self.matcher = matcher
+        self.pattern_id = pattern_id
+        self.test = operators.compile_scan(self.operator, self.field, matcher, pattern_id)
+
+    @property
+    def index_keys(self):
+        """Valeurs (minuscules) indexables, ou None si le déclencheur n'est pas une égalité."""
+        if self.field not in INDEXED_FIELDS or self.op is None or self.op.negated or self.op.kind != "equals":
+            return None
+        if self.choices is not None:
+            return self.choices
+        return frozenset([self.needle])
+
+    @property
+    def is_substring(self):
+        return self.choices is None and self.error is None and self.op is not None and self.op.substring
+
+    @property
+    def cost_class(self):
+        return self.op.cost if self.op is not None else "equality"
+
+    def explain(self, values, ok):
+        """Explication lisible du résultat (traces DEBUG uniquement)."""
+        if self.error:
+            return self.error
+        task_val = values.get(self.field)[0]
+        return f"'{task_val}' {self.operator} {self.value!r}" if ok else f"NON '{task_val}' {self.operator} {self.value!r}"
+
+    @property
+    def stats_key(self):
+        return f"{self.field}|{self.operator}|{self.value}"
+
+    def leaves(self):
+        yield self
+
+# Groupes de déclencheurs : {"all": [...]} (ET), {"any": [...]} (OU), {"not": ...} (NON)
+GROUP_MODES = {'all': "ET", 'any': "OU", 'not': "NON"}
+
+class ConditionGroup(DecisionNode):
+    """
+    Nœud ET / OU / NON du graphe de décision. Les enfants sont évalués avec court-circuit,
+    dans l'ordre ajusté par CompiledRuleSet.reorder ; un groupe identique cité par plusieurs
+    règles est partagé et son résultat mémorisé par tâche comme celui d'une condition.
+    """
+    __slots__ = ('mode', 'children', 'order', 'key', 'fields', 'title', 'label', 'field', 'stats')
+
+    def __init__(self, mode, children):
+        self.mode = mode
+        self.children = children
+        self.order = list(children)
+        child_keys = [c.key for c in children]
+        self.key = (mode, tuple(child_keys) if mode == 'not' else frozenset(child_keys))
+        self.fields = frozenset().union(*(c.fields for c in children))
+        self.title = f"{GROUP_MODES[mode]}(" + ", ".join(c.title for c in children) + ")"
+        self.label = self.title
+        self.field = None
+        self.stats = None
+
+    @property
+    def cost_class(self):
+        return "group"
+
+    @property
+    def index_keys(self):
+        return None
+
+    @property
+    def is_substring(self):
+        return False
+
+    @property
+    def stats_key(self):
+        # Même identité que `key` : enfants ordonnés pour NON, sans ordre pour ET / OU
+        child_keys = [c.stats_key for c in self.children]
+        if self.mode != 'not':
+            child_keys.sort()
+        return f"{self.mode}({','.join(child_keys)})"
+
+    def leaves(self):
+        for child in self.children:
+            yield from child.leaves()
+
+    def test(self, values):
+        if self.mode == 'any':
+            return any(child.check(values) for child in self.order)
+        ok = all(child.check(values) for child in self.order)
+        return not ok if self.mode == 'not' else ok
+
+    def explain(self, values, ok):
+        return f"{self.title} -> {'OK' if ok else 'KO'}"
+
+def compile_trigger(trig, nodes):
+    """
+    Compile un déclencheur (condition ou groupe all / any / not) en nœud du graphe de décision.
+    `nodes` (clé -> nœud) est partagé par toutes les règles d'un jeu : les nœuds identiques sont réutilisés.
+    """
+    if not isinstance(trig, dict):
+        return None
+    for mode in GROUP_MODES:
+        if mode in trig:
+            items = trig[mode]
+            if isinstance(items, dict):
+                items = [items]
+            children = [node for node in (compile_trigger(t, nodes) for t in (items or [])) if node is not None]
+            if not children:
+                return None
+            if mode == 'not' and len(children) > 1:
+                children = [nodes.setdefault(ConditionGroup('all', children).key, ConditionGroup('all', children))]
+            elif mode != 'not' and len(children) == 1:
+                return children[0]
+            group = ConditionGroup(mode, children)
+            return nodes.setdefault(group.key, group)
+    tech_key = MAPPING.get(trig.get('field'))
+    if not tech_key:
+        return None
+    cond = CompiledCondition(trig.get('field'), tech_key, trig.get('operator'), trig.get('value'))
+    return nodes.setdefault(cond.key, cond)
+
+def parse_delay(value):
+    """Délai d'une règle temporisée (clé `delay`) en secondes : entier = minutes, ou "45s", "30m", "2h", "1j"."""
+    return operators.parse_duration(value)
+
+class CompiledRule:
+    __slots__ = ('position', 'name', 'conditions', 'text_conditions', 'steps', 'raw', 'labels', 'condition_labels', 'traced', 'order', 'delay', 'leaves', 'reads')
+
+    def __init__(self, position, rule, nodes=None):
+        self.position = position
+        self.raw = rule
+        self.name = rule.get('name', 'Sans nom')
+        self.steps = rule.get('steps') or rule.get('actions') or []
+        # Opt-in : trace DEBUG systématique de cette règle (hors échantillonnage)
+        self.traced = bool(rule.get('trace'))
+        # Règle temporisée : actions exécutées `delay` secondes après que ses conditions sont remplies
+        self.delay = parse_delay(rule.get('delay'))
+
+        triggers = rule.get('triggers', [])
+        # Compatibilité ancienne version (single trigger)
+        if not triggers and rule.get('trigger'):
+            triggers = [{'field': 'Titre', 'operator': 'Contient', 'value': 'TODO_FIX'}]
+
+        # Déclencheurs de premier niveau (ET implicite) : conditions ou groupes all / any / not
+        nodes = {} if nodes is None else nodes
+        self.conditions = [node for node in (compile_trigger(trig, nodes) for trig in triggers) if node is not None]
+        self.text_conditions = []
+        # Toutes les conditions feuilles, quelle que soit leur profondeur (sans doublon)
+        self.leaves = list({id(leaf): leaf for node in self.conditions for leaf in node.leaves()}.values())
+        # Champs lus par la règle (empreinte de réfraction entre passes)
+        self.reads = tuple(sorted({leaf.field for leaf in self.leaves}))
+
+        # Labels des métriques, construits une fois par compilation
+        self.labels = (self.name,)
+        self.condition_labels = [(self.name, f"{i+1}. {c.title}") for i, c in enumerate(self.conditions)]
+        # Ordre d'évaluation des conditions : (index d'origine, condition), ajusté par CompiledRuleSet.reorder
+        self.order = list(enumerate(self.conditions))
+
+class TaskValues:
+    """
+    Lecture mémorisée des champs d'une tâche : chaque attribut n'est lu qu'une fois,
+    et chaque champ texte n'est parcouru qu'une fois par l'automate.
+    """
+    __slots__ = ('task', '_cache', '_scans', 'memo')
+
+    def __init__(self, task):
+        self.task = task
+        self._cache = {}
+        self._scans = {}
+        self.memo = {}          # nœud du graphe de décision -> résultat pour cette tâche
+
+    def get(self, field_key):
+        """Retourne (valeur, valeur_minuscule)."""
+        pair = self._cache.get(field_key)
+        if pair is None:
+            val = get_task_value(self.task, field_key)
+            pair = self._cache[field_key] = (val, val.lower())
+        return pair
+
+    def scan(self, field_key, matcher):
+        """Retourne (motifs trouvés, motifs en début de texte) pour le champ."""
+        res = self._scans.get(field_key)
+        if res is None:
+            res = self._scans[field_key] = matcher.scan(self.get(field_key)[1])
+        return res
+
+    def raw(self, field_key):
+        """Valeur brute (nombres, dates) pour les opérateurs typés."""
+        return getattr(self.task, field_key, None)
+
+    def invalidate(self, field_key):
+        self._cache.pop(field_key, None)
+        self._scans.pop(field_key, None)
+        if self.memo:
+            # Seuls les nœuds qui lisent ce champ sont à recalculer
+            self.memo = {node: ok for node, ok in self.memo.items() if field_key not in node.fields}
+
+# --- STATISTIQUES DE SÉLECTIVITÉ (ordre adaptatif des conditions) ---
+
+STATS_FILE = os.environ.get("ENGINE_STATS_FILE") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "condition_stats.json")
+STATS_SAVE_INTERVAL = float(os.environ.get("ENGINE_STATS_SAVE_INTERVAL", "60"))
+# Nombre d'évaluations de tâches entre deux réordonnancements des conditions
+REORDER_INTERVAL = int(os.environ.get("ENGINE_REORDER_INTERVAL", "500"))
+# Évaluation en point fixe : bornes par tâche (passes, actions exécutées, sous-tâches créées)
+MAX_PASSES = int(os.environ.get("ENGINE_MAX_PASSES", "10"))
+MAX_ACTIONS = int(os.environ.get("ENGINE_MAX_ACTIONS", "200"))
+MAX_CHILDREN = int(os.environ.get("ENGINE_MAX_CHILDREN", "20"))
+# Coût a priori (s) d'une condition jamais mesurée
+PRIOR_COST = {"equality": 0.5e-6, "substring": 2e-6, "typed": 1e-6, "regex": 5e-6, "group": 3e-6}
+
+_condition_stats = {}   # "champ|opérateur|valeur" (ou "mode(clés des enfants)") -> [évaluations, succès, coût cumulé (s)]
+_stats_state = {"loaded": False, "saved_at": 0.0, "flusher": None}
+_stats_stop = threading.Event()
+_stats_lock = threading.Lock()
+
+def _load_condition_stats():
+    """Charge (une fois par processus) les statistiques persistées au redémarrage précédent."""
+    if _stats_state["loaded"]:
         return
+    with _stats_lock:
+        if _stats_state["loaded"]:
+            return
+        _stats_state["loaded"] = True
+        _stats_state["saved_at"] = time.time()
+        try:
+            with open(STATS_FILE, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[ENGINE] Statistiques de conditions illisibles ({e}), reprise à zéro")
+            return
+        for key, cells in data.items():
+            if isinstance(cells, list) and len(cells) == 3:
+                _condition_stats[key] = [int(cells[0]), int(cells[1]), float(cells[2])]
 
-    print(f"[ENGINE] Propagation exclusion 'Terminé' pour parent #{task.id}")
-    for child in task.children:
-        if child.status != "Terminé": 
-            child.status = "Terminé"
-            db.add(child)
-            # Audit Log
-            log = AuditLog(
-                message=f"[ENGINE] Clôture automatique (Parent #{task.id} terminé)"
-            )
-            db.add(log)
-            print(f"[ENGINE] -> Enfant #{child.id} clôturé.")
-            # Recursive call
-            cascade_completion(child, db)
+def save_condition_stats(force=False):
+    """Écrit les statistiques (au plus une fois par STATS_SAVE_INTERVAL sauf `force`). Écriture atomique."""
+    now = time.time()
+    if not force and now - _stats_state["saved_at"] < STATS_SAVE_INTERVAL:
+        return False
+    with _stats_lock:
+        _stats_state["saved_at"] = now
+        data = {key: list(cells) for key, cells in list(_condition_stats.items())}
+        tmp = f"{STATS_FILE}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, STATS_FILE)
+        except OSError as e:
+            print(f"[ENGINE] Échec sauvegarde des statistiques de conditions : {e}")
+            return False
+    return True
+
+def _flush_condition_stats():
+    while not _stats_stop.wait(STATS_SAVE_INTERVAL):
+        save_condition_stats(force=True)
+
+def start_stats_flusher():
+    """
+    Sauvegarde périodique par un thread dédié : aucune écriture de fichier pendant une évaluation.
+    Démarrée par le processus propriétaire des statistiques (l'API), jamais à la compilation des règles :
+    l'interface, les backfills et les tests n'écrasent pas le fichier.
+    """
+    if _stats_state["flusher"] is not None:
+        return
+    _load_condition_stats()
+    _stats_stop.clear()
+    thread = threading.Thread(target=_flush_condition_stats, name="condition-stats-flush", daemon=True)
+    _stats_state["flusher"] = thread
+    thread.start()
+
+def stop_stats_flusher(timeout=5):
+    """Arrête la sauvegarde périodique et écrit une dernière fois les statistiques."""
+    thread = _stats_state["flusher"]
+    if thread is None:
+        return
+    _stats_stop.set()
+    thread.join(timeout)
+    _stats_state["flusher"] = None
+    save_condition_stats(force=True)
+
+def _stats_for(node):
+    """Statistiques d'un nœud, partagées par toutes les règles qui le citent."""
+    return _condition_stats.setdefault(node.stats_key, [0, 0, 0.0])
+
+def condition_rank(cond, short_on=False):
+    """
+    Rang d'une condition dans un ET (`short_on` = False) : coût moyen / probabilité d'échec ;
+    dans un OU (`short_on` = True) : coût moyen / probabilité de succès.
+    Trier par rang croissant minimise le coût attendu avant court-circuit.
+    """
+    evals, passes, cost = cond.stats or (0, 0, 0.0)
+    avg_cost = cost / evals if evals else PRIOR_COST[cond.cost_class]
+    # Lissage de Laplace : une condition jamais vue est supposée réussir une fois sur deux
+    pass_rate = (passes + 1) / (evals + 2)
+    return avg_cost / (pass_rate if short_on else 1.0 - pass_rate)
+
+class CompiledRuleSet:
+    """
+    Jeu de règles compilé une fois par version du fichier.
+    Les règles sont indexées par leur déclencheur d'égalité le plus sélectif
+    (priority, status, assigned_to) : une tâche n'est confrontée qu'aux règles
+    susceptibles de la concerner. Les motifs 'Contient' / 'Commence par' sont
+    regroupés par champ dans un automate unique.
+    Les règles temporisées (`delay`) sont tenues à part : l'évaluation ne fait
+    qu'armer leur minuteur, leurs actions sont exécutées à l'échéance.
+    Les déclencheurs (conditions et groupes ET / OU / NON) forment un graphe de décision
+    partagé : un nœud cité par plusieurs règles n'est évalué qu'une fois par tâche.
+    """
+
+    def __init__(self, rules, version=None):
+        self.version = version
+        rules = [r for r in (rules or []) if isinstance(r, dict)]
+        timed = [r for r in rules if parse_delay(r.get('delay'))]
+        self.nodes = {}         # clé -> nœud du graphe de décision (conditions et groupes)
+        self.rules = [CompiledRule(i, r, self.nodes) for i, r in enumerate(r for r in rules if not parse_delay(r.get('delay')))]
+        # Conditions testées directement (sans automate) pour armer les minuteurs
+        timed_nodes = {}
+        self.timed_rules = [CompiledRule(i, r, timed_nodes) for i, r in enumerate(timed)]
+        self._timed_fields = frozenset(leaf.field for r in self.timed_rules for leaf in r.leaves)
+        self._timed_sets = {}   # nom -> jeu compilé de la seule règle, exécuté à l'échéance
+        self._index = {}        # field -> {valeur minuscule -> [positions]}
+        self._unindexed = []    # positions sans déclencheur indexable
+        self._dependents = {}   # field -> {positions des règles dont un déclencheur lit ce champ}
+        self.evaluations = 0
+        self.pruned_total = 0
+
+        for pos, rule in enumerate(self.rules):
+            for leaf in rule.leaves:
+                self._dependents.setdefault(leaf.field, set()).add(pos)
+            # Seules les égalités de premier niveau (toujours requises) servent à l'index
+            best = None
+            for cond in rule.conditions:
+                keys = cond.index_keys
+                if keys is not None and (best is None or len(keys) < len(best[1])):
+                    best = (cond.field, keys)
+            if best is None:
+                self._unindexed.append(pos)
+                continue
+            buckets = self._index.setdefault(best[0], {})
+            for key in best[1]:
+                buckets.setdefault(key, []).append(pos)
+
+        # Un automate par champ, partagé par tous les motifs des règles actives
+        patterns = {}           # field -> {motif -> pattern_id}
+        substrings = [node for node in self.nodes.values() if node.is_substring]
+        for cond in substrings:
+            ids = patterns.setdefault(cond.field, {})
+            cond.pattern_id = ids.setdefault(cond.needle, len(ids))
+        self._matchers = {field: PatternAutomaton(ids) for field, ids in patterns.items()}
+        # Champs dont la modification impose une nouvelle sélection des règles
+        self.selective_fields = frozenset(self._index) | frozenset(self._matchers)
+        self.traced_rules = frozenset(r.name for r in self.rules if r.traced)
+
+        _load_condition_stats()
+        for node in self.nodes.values():
+            node.stats = _stats_for(node)
+        self.reorder()
+        for cond in substrings:
+            cond.bind_matcher(self._matchers[cond.field], cond.pattern_id)
+        for rule in self.rules:
+            rule.text_conditions = [c for c in rule.conditions if c.is_substring]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def reorder(self):
+        """
+        Réordonne les conditions de chaque règle (et les enfants de chaque groupe)
+        selon la sélectivité et le coût observés. Les conditions n'ont pas d'effet
+        de bord : seul le coût change. L'ordre des règles (et donc de leurs actions)
+        reste celui du fichier.
+        """
+        for node in self.nodes.values():
+            if isinstance(node, ConditionGroup) and len(node.children) > 1:
+                short_on = node.mode == 'any'
+                node.order = sorted(node.children, key=lambda child: condition_rank(child, short_on))
+        for rule in self.rules:
+            if len(rule.conditions) > 1:
+                rule.order = sorted(enumerate(rule.conditions), key=lambda item: (condition_rank(item[1]), item[0]))
+
+    def timed_set(self, rule_name):
+        """Jeu compilé (sans délai) d'une règle temporisée, None si elle n'existe plus."""
+        subset = self._timed_sets.get(rule_name)
+        if subset is None:
+            rule = next((r for r in self.timed_rules if r.name == rule_name), None)
+            if rule is None:
+                return None
+            subset = self._timed_sets[rule_name] = CompiledRuleSet([dict(rule.raw, delay=None)], self.version)
+        return subset
+
+    def depends_on(self, fields):
+        """Vrai si une règle (immédiate ou temporisée) lit l'un des champs techniques donnés."""
+        return bool(self.rules_for_fields(fields)) or not self._timed_fields.isdisjoint(fields or ())
+
+    def rules_for_fields(self, fields):
+        """Positions des règles dont au moins un déclencheur référence l'un des champs techniques donnés."""
+        positions = set()
+        for field in fields or ():
+            positions.update(self._dependents.get(field, ()))
+        return positions
+
+    def select(self, values, after=-1, only=None):
+        """
+        Retourne (règles candidates dans l'ordre du fichier, nombre de règles écartées).
+        `after` permet de ne sélectionner que les règles situées après une position donnée,
+        `only` restreint la sélection à un ensemble de positions (évaluation incrémentale).
+        """
+        hits = set(self._unindexed)
+        for field, buckets in self._index.items():
+            positions = buckets.get(values.get(field)[1])
+            if positions:
+                hits.update(positions)
+        if only is not None:
+            hits &= only
+        selected = [self.rules[p] for p in sorted(hits) if p > after]
+        # Élagage par l'automate : un seul parcours par champ texte pour toutes les règles
+        selected = [r for r in selected if all(c.check(values) for c in r.text_conditions)]
+        pruned = (len(self.rules) - after - 1) - len(selected)
+        return selected, pruned
+
+# --- CACHE DES RÈGLES ---
+# Source : dernière version de la table `workflow_rules` lorsque use_rules_database() a été
+# appelé (API, workers, backfill) et qu'une version existe ; sinon fichier workflows.yaml
+# (invalidé par mtime + empreinte du contenu). Chaque processus garde un jeu compilé qu'il
+# ne recompile que si la version (ou l'empreinte du contenu) change.
+
+# Intervalle minimal entre deux lectures de la version active en base (SELECT max(version))
+RULES_CHECK_INTERVAL = float(os.environ.get("ENGINE_RULES_CHECK_INTERVAL", "2"))
+
+_rules_lock = threading.Lock()
+_rules_cache = {"stat": None, "digest": None, "rules": [], "ruleset": None, "version": None}
+_rules_source = {"session_factory": None, "checked_at": 0.0, "version": None}
+
+# Événement "règles chargées" : nombre de chargements, durée, empreinte et version du contenu
+RULES_STATS = {"loads": 0, "last_load_ms": 0.0, "last_loaded_at": None, "digest": None, "count": 0, "version": None}
+
+class RulesVersionConflict(Exception):
+    """Une autre version des règles a été enregistrée depuis la version lue par l'appelant."""
+    def __init__(self, current):
+        super().__init__(f"Règles modifiées entre-temps (version active : {current})")
+        self.current = current
+
+def use_rules_database(session_factory):
+    """Les règles actives sont lues dans la table `workflow_rules` via `session_factory`."""
+    with _rules_lock:
+        _rules_source.update(session_factory=session_factory, checked_at=0.0, version=None)
+
+def current_rules_version(db: Session):
+    """Numéro de la version active, None si aucune version n'est enregistrée."""
+    return db.query(func.max(WorkflowRuleVersion.version)).scalar()
+
+def _db_rules_version():
+    """Version active en base, relue au plus une fois par RULES_CHECK_INTERVAL (None sans base)."""
+    source = _rules_source
+    factory = source["session_factory"]
+    if factory is None:
+        return None
+    now = time.monotonic()
+    if now - source["checked_at"] < RULES_CHECK_INTERVAL:
+        return source["version"]
+    db = factory()
+    try:
+        source["version"] = current_rules_version(db)
+    except Exception as e:
+        print(f"[ENGINE] Erreur lecture version des règles: {e}")
+    finally:
+        db.close()
+    source["checked_at"] = now
+    return source["version"]
+
+def _rules_file_stat():
+    try:
+        st_res = os.stat(RULES_FILE)
+        return (st_res.st_mtime_ns, st_res.st_size)
+    except OSError:
+        return None
+
+def _parse_rules(raw, cache):
+    """Liste des règles d'un contenu YAML ; None si invalide alors que des règles sont déjà actives."""
+    try:
+        rules = yaml.safe_load(raw.decode("utf-8")) or []
+    except Exception as e:
+        print(f"[ENGINE] Erreur lecture YAML: {e}")
+        metrics.inc("liteflow_engine_errors_total", ("rules",))
+        if cache["ruleset"] is not None:
+            # Contenu en cours d'écriture ou invalide : on conserve les règles actives
+            return None
+        rules = []
+    return rules if isinstance(rules, list) else []
+
+def _install_rules(rules, digest, start, stat=None, version=None):
+    global _rules_cache
+    ruleset = CompiledRuleSet(rules, digest)
+    _rules_cache = {"stat": stat, "digest": digest, "rules": rules, "ruleset": ruleset, "version": version}
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    RULES_STATS["loads"] += 1
+    RULES_STATS["last_load_ms"] = elapsed_ms
+    RULES_STATS["last_loaded_at"] = time.time()
+    RULES_STATS["digest"] = digest
+    RULES_STATS["count"] = len(ruleset)
+    RULES_STATS["version"] = version
+    source = f"version {version}" if version is not None else "fichier"
+    print(f"[ENGINE] Règles chargées ({source}) : {len(ruleset)} règle(s) en {elapsed_ms:.1f} ms (empreinte {digest[:12]})")
+    return _rules_cache
+
+def _refresh_rules_from_db(version):
+    """Recharge la version `version` depuis la base ; recompile seulement si son contenu diffère."""
+    global _rules_cache
+    cache = _rules_cache
+    if cache["ruleset"] is not None and cache["version"] == version:
+        return cache
+
+    with _rules_lock:
+        cache = _rules_cache
+        if cache["ruleset"] is not None and cache["version"] == version:
+            return cache
+
+        start = time.perf_counter()
+        db = _rules_source["session_factory"]()
+        try:
+            row = db.get(WorkflowRuleVersion, version)
+            content, digest = (row.content, row.digest) if row is not None else (None, None)
+        except Exception as e:
+            print(f"[ENGINE] Erreur lecture des règles (version {version}): {e}")
+            return cache
+        finally:
+            db.close()
+        if content is None:
+            return cache
+
+        if cache["ruleset"] is not None and digest == cache["digest"]:
+            # Même contenu (ex : import du fichier déjà chargé) : pas de recompilation
+            _rules_cache = dict(cache, version=version)
+            return _rules_cache
+
+        rules = _parse_rules(content.encode("utf-8"), cache)
+        if rules is None:
+            return cache
+        return _install_rules(rules, digest, start, version=version)
+
+def _refresh_rules():
+    """
+    Base de données : une lecture de la version active au plus toutes les RULES_CHECK_INTERVAL s.
+    Fichier : un simple os.stat par appel tant que le fichier n'a pas bougé.
+    Si mtime/taille changent, le contenu est relu et haché : il n'est re-parsé
+    et recompilé que si son empreinte SHA-256 a réellement changé.
+    """
+    global _rules_cache
+    version = _db_rules_version()
+    if version is not None:
+        return _refresh_rules_from_db(version)
+
+    stat = _rules_file_stat()
+    cache = _rules_cache
+    if cache["ruleset"] is not None and cache["version"] is None and stat == cache["stat"]:
+        return cache
+
+    with _rules_lock:
+        cache = _rules_cache
+        if cache["ruleset"] is not None and cache["version"] is None and stat == cache["stat"]:
+            return cache
+
+        start = time.perf_counter()
+        raw = b""
+        if stat is not None:
+            try:
+                with open(RULES_FILE, "rb") as f:
+                    raw = f.read()
+            except OSError as e:
+                print(f"[ENGINE] Erreur lecture YAML: {e}")
+                return cache
+        digest = hashlib.sha256(raw).hexdigest()
+
+        if cache["ruleset"] is not None and digest == cache["digest"]:
+            # Fichier touché mais contenu identique : pas de nouveau parsing
+            _rules_cache = dict(cache, stat=stat, version=None)
+            return _rules_cache
+
+        rules = _parse_rules(raw, cache)
+        if rules is None:
+            return cache
+        return _install_rules(rules, digest, start, stat=stat)
+
+def invalidate_rules_cache():
+    """Force une nouvelle vérification de la version (ou du fichier) au prochain accès."""
+    global _rules_cache
+    with _rules_lock:
+        _rules_cache = dict(_rules_cache, stat=None)
+        _rules_source["checked_at"] = 0.0
+
+def get_compiled_rules():
+    """Retourne le jeu de règles compilé, recompilé uniquement si la version ou le fichier a changé."""
+    return _refresh_rules()["ruleset"]
+
+# --- VERSIONS DES RÈGLES (table workflow_rules, import / export YAML) ---
+
+def dump_rules(rules):
+    """Sérialisation YAML des règles (format de workflows.yaml)."""
+    return yaml.dump(rules, default_flow_style=False, allow_unicode=True)
+
+def read_rules(db: Session):
+    """(version active, règles) ; version 0 et règles du fichier tant qu'aucune version n'est enregistrée."""
+    row = db.query(WorkflowRuleVersion).order_by(WorkflowRuleVersion.version.desc()).first()
+    if row is None:
+        return 0, load_workflows()
+    rules = yaml.safe_load(row.content) or []
+    return row.version, rules if isinstance(rules, list) else []
+
+def _store_rules(db: Session, content, base_version=None, author=None):
+    current = current_rules_version(db) or 0
+    if base_version is not None and base_version != current:
+        raise RulesVersionConflict(current)
+    version = current + 1
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    db.add(WorkflowRuleVersion(version=version, content=content, digest=digest, author=author))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Enregistrement concurrent de la même version : un seul gagnant (clé primaire)
+        db.rollback()
+        raise RulesVersionConflict(current_rules_version(db))
+    invalidate_rules_cache()
+    print(f"[ENGINE] Règles enregistrées : version {version} (empreinte {digest[:12]})")
+    return version
 
-def check_rules_integrity(workflows_file=None):
+def save_rules(db: Session, rules, base_version=None, author=None):
+    """
+    Enregistre `rules` (liste de dicts) comme nouvelle version et retourne son numéro.
+    Si `base_version` est fourni et n'est plus la version active : RulesVersionConflict.
+    """
+    if not isinstance(rules, list) or not all(isinstance(r, dict) for r in rules):
+        raise ValueError("Les règles doivent être une liste d'objets")
+    return _store_rules(db, dump_rules(rules), base_version, author)
+
+def import_rules_file(db: Session, path=RULES_FILE, base_version=None, author="import"):
+    """Importe un fichier YAML comme nouvelle version (contenu conservé tel quel)."""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    rules = yaml.safe_load(content) or []
+    if not isinstance(rules, list):
+        raise ValueError(f"{path} : une liste de règles est attendue")
+    return _store_rules(db, content, base_version, author)
+
+def export_rules_file(db: Session, path=RULES_FILE):
+    """Écrit la version active dans un fichier YAML et retourne son numéro (0 : aucune version en base)."""
+    row = db.query(WorkflowRuleVersion).order_by(WorkflowRuleVersion.version.desc()).first()
+    if row is None:
+        return 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(row.content)
+    return row.version
+
+def _is_open(status_col):
+    return or_(status_col.is_(None), status_col != "Terminé")
+
+def close_subtree(db: Session, root_ids, source="ENGINE", closed_at=None):
+    """
+    Clôture toute la descendance non terminée des tâches `root_ids` en une paire
+    d'instructions ensemblistes : une CTE récursive parcourt le sous-arbre,
+    un INSERT ... SELECT écrit les AuditLog puis un UPDATE clôture les tâches.
+    Partagé par le moteur et l'API. Retourne le nombre de tâches clôturées.
+    """
+    root_ids = list(root_ids)
+    if not root_ids:
+        return 0
+    closed_at = closed_at or get_utc_now()
+
+    child = aliased(Task)
+    subtree = select(Task.id, Task.parent_id).where(
+        Task.parent_id.in_(root_ids), _is_open(Task.status)
+    ).cte("subtree", recursive=True, nesting=True)
+    subtree = subtree.union_all(
+        select(child.id, child.parent_id)
+        .join(subtree, child.parent_id == subtree.c.id)
+        .where(_is_open(child.status))
+    )
+
+    message = (
+        literal(f"[{source}] Clôture automatique (Parent #") + cast(subtree.c.parent_id, String)
+        + literal(" terminé) pour l'enfant #") + cast(subtree.c.id, String)
+    )
+    db.execute(insert(AuditLog).from_select(
+        ["message", "timestamp"],
+        select(message, literal(closed_at, DateTime))
+    ))
+    res = db.execute(
+        update(Task).where(Task.id.in_(select(subtree.c.id)))
+        .values(status="Terminé", closed_at=closed_at),
+        execution_options={"synchronize_session": False}
+    )
+    print(f"[{source}] Propagation 'Terminé' : {res.rowcount} descendant(s) clôturé(s) pour {root_ids}")
+    return res.rowcount
+
+def cascade_completion(task, db: Session):
+    """
+    Propagate 'Terminé' status to all descendants (set-based, see close_subtree).
+    """
+    return close_subtree(db, [task.id])
+
+def _trigger_leaves(trig):
+    """Conditions (dicts avec 'field') d'un déclencheur, à toute profondeur de groupe."""
+    if isinstance(trig, list):
+        for item in trig:
+            yield from _trigger_leaves(item)
+    elif isinstance(trig, dict):
+        group = next((trig[mode] for mode in GROUP_MODES if mode in trig), None)
+        if group is not None:
+            yield from _trigger_leaves(group)
+        else:
+            yield trig
+
+def check_rules_integrity(workflows_file=None, rules=None):
     """
     Vérifie la validité des règles (Statuts obsolètes, etc.) pour l'interface.
+    `rules` : règles lues via l'API (par défaut, règles actives de ce processus).
     """
     warnings = []
     # On recharge les règles
-    rules = load_workflows()
+    if rules is None:
+        rules = load_workflows()
     
     # Liste de référence des statuts valides
     VALID_STATUSES = ["Nouveau", "À faire", "En cours", "Terminé"]
@@ -111,6 +922,17 @@ def check_rules_integrity(workflows_file=None):
     for rule in rules:
         rule_name = rule.get('name', 'Sans nom')
         steps = rule.get('steps') or rule.get('actions') or []
+
+        # Vérification des déclencheurs, y compris dans les groupes (opérateur connu, regex / nombre / date / durée valides)
+        for j, trig in enumerate(rule.get('triggers') or []):
+            for leaf in _trigger_leaves(trig):
+                tech_key = MAPPING.get(leaf.get('field'))
+                if not tech_key:
+                    continue
+                error = operators.validate(tech_key, leaf.get('operator'), leaf.get('value')) \
+                    or operators.list_notice(leaf.get('operator'), leaf.get('value'))
+                if error:
+                    warnings.append(f"⚠️ Règle '{rule_name}' (Déclencheur {j+1}) : {error}.")
         
         for i, step in enumerate(steps):
             fields = step.get('fields', {})
@@ -124,134 +946,686 @@ def check_rules_integrity(workflows_file=None):
                     
     return warnings
 
-def process_workflow(task_id, db: Session):
-    task = db.query(Task).filter(Task.id == task_id).first()
-    if not task: return
+# --- CŒUR DU MOTEUR (partagé par les exécutions unitaires et par lot) ---
 
-    print(f"\n[ENGINE] --- Analyse Tâche #{task.id} : {task.title} ---")
-    
-    # Sécurité: Ne pas traiter les tickets clôturés
-    if task.closed_at or task.status == "Terminé":
-        print(f"[ENGINE] [SKIP] Ticket #{task.id} déjà clôturé. Workflow ignoré.")
-        return
-    rules = load_workflows()
-    
-    changes_made = False
+# Référence d'une tâche pas encore insérée, remplacée par son ID dans les AuditLog (WorkflowOutcome.bind)
+PENDING_TASK_REF = "#<nouveau>"
 
-    for rule in rules:
-        triggers = rule.get('triggers', [])
-        # Compatibilité ancienne version (single trigger)
-        if not triggers and rule.get('trigger'):
-            # Conversion simplifiée
-            triggers = [{'field': 'Titre', 'operator': 'Contient', 'value': 'TODO_FIX'}] 
+def _task_ref(task):
+    return PENDING_TASK_REF if task.id is None else f"#{task.id}"
 
-        all_met = True
-        
-        # --- 1. Vérification des Conditions (ET logique) ---
-        for idx, trig in enumerate(triggers):
-            field = trig.get('field')
-            operator = trig.get('operator')
-            rule_value = trig.get('value')
-            
-            tech_key = MAPPING.get(field)
-            if not tech_key: 
-                continue
+class WorkflowOutcome:
+    """Écritures produites par l'évaluation des règles sur une tâche."""
+    __slots__ = ('task_id', 'matched', 'changes', 'children', 'logs', 'completed', 'timers', 'passes', 'halted')
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.matched = []       # noms des règles appliquées
+        self.changes = {}       # champ technique -> valeur finale
+        self.children = []      # données des sous-tâches à créer
+        self.logs = []          # messages d'AuditLog
+        self.completed = False  # le statut est passé à 'Terminé'
+        self.timers = []        # (règle temporisée, délai en secondes) dont les conditions sont remplies
+        self.passes = 1         # passes d'évaluation effectuées (point fixe)
+        self.halted = None      # motif d'interruption : 'cycle', 'passes', 'actions' ou 'children'
+
+    @property
+    def has_changes(self):
+        return bool(self.logs)
+
+    def bind(self, task_id):
+        """Renseigne l'ID attribué à une tâche évaluée avant son insertion."""
+        self.task_id = task_id
+        self.logs = [message.replace(PENDING_TASK_REF, f"#{task_id}") for message in self.logs]
+
+# Clés acceptées dans les étapes pour désigner la nature (ID ou nom)
+CLASSIFICATION_KEYS = ('classification_id', 'classification', 'nature')
+
+def _classification_value(value, refs):
+    """ID d'une nature existante à partir d'un ID ou d'un nom (insensible à la casse), sinon None."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int) or str(value).strip().isdigit():
+        classification_id = int(value)
+        return classification_id if refs.classification_name(classification_id) is not None else None
+    return refs.classification_id(value)
 
-            task_value = get_task_value(task, tech_key)
-            is_ok, reason = check_condition(task_value, operator, rule_value)
+def _classification_resolver(db: Session):
+    """
+    Résolution des natures via le cache de référence partagé (aucune requête tant qu'il est à jour) :
+    resolve() -> nature par défaut des sous-tâches, resolve(valeur) -> ID à partir d'un ID ou d'un nom.
+    """
+    def resolve(value=refdata.DEFAULT_CLASSIFICATION):
+        return _classification_value(value, refdata.get(db))
+    return resolve
+
+def _fingerprint(values, rule):
+    """Valeurs courantes des champs lus par une règle."""
+    return tuple(values.get(field)[1] for field in rule.reads)
+
+def _halt(outcome, trace, reason, message):
+    """Interrompt l'évaluation : message d'AuditLog, trace et compteur par motif."""
+    outcome.halted = reason
+    outcome.logs.append(f"[ENGINE] {message} : évaluation interrompue")
+    metrics.inc("liteflow_engine_halts_total", (reason,))
+    if trace.wants(INFO):
+        trace.emit(INFO, "halt", message, reason=reason)
+
+def evaluate_rules(task, compiled, resolve_classification, changed_fields=None, trace=None):
+    """
+    Applique les règles compilées sur `task` (objet ORM ou TaskSnapshot) en mémoire
+    et retourne un WorkflowOutcome décrivant les écritures à effectuer.
+    Si `changed_fields` est fourni (mise à jour), seules les règles dont un déclencheur
+    lit l'un de ces champs sont évaluées ; les champs modifiés par les règles elles-mêmes
+    étendent ce périmètre aux règles suivantes.
+    L'évaluation est répétée en point fixe : après chaque passe, les règles lisant un champ
+    modifié sont réévaluées (quel que soit leur rang), jusqu'à ce qu'aucun champ ne change.
+    Une écriture rétablissant une valeur déjà prise (cycle) ou le dépassement de MAX_PASSES,
+    MAX_ACTIONS ou MAX_CHILDREN interrompt l'évaluation (outcome.halted).
+    Le déroulé est écrit dans `trace` (tracing.TaskTrace, ouverte ici si absente).
+    """
+    started = time.perf_counter()
+    if trace is None:
+        trace = tracing.begin(task.id, compiled.traced_rules)
+    outcome = WorkflowOutcome(task.id)
+    values = TaskValues(task)
+    scope = None if changed_fields is None else compiled.rules_for_fields(changed_fields)
+    candidates, pruned = compiled.select(values, only=scope)
+    compiled.evaluations += 1
+    compiled.pruned_total += pruned
+    if compiled.evaluations % REORDER_INTERVAL == 0:
+        compiled.reorder()
+    if trace.wants(INFO):
+        trace.emit(INFO, "select", f"{len(candidates)} règle(s) candidate(s), {pruned} écartée(s) par l'index",
+                   candidates=len(candidates), pruned=pruned)
+
+    # --- Point fixe : une passe par vague de champs modifiés, jusqu'à stabilité ou budget atteint ---
+    fired = {}          # position -> empreinte des champs lus lors de la dernière application
+    history = {}        # champ -> valeurs prises pendant l'évaluation (détection de cycle)
+    actions = 0
+    while True:
+        pass_changed = set()
+        pos = 0
+        while pos < len(candidates) and outcome.halted is None:
+            rule = candidates[pos]
+            pos += 1
+            # Réfraction : une règle déjà appliquée ne l'est à nouveau que si les champs qu'elle lit ont changé
+            if fired.get(rule.position) == _fingerprint(values, rule):
+                continue
+            all_met = True
+            rule_started = time.perf_counter()
+            metrics.inc("liteflow_rule_evaluations_total", rule.labels)
+            debug = trace.wants(DEBUG, rule.name)
+        
+            # --- 1. Vérification des Conditions (ET logique, ordre adaptatif, résultats partagés entre règles) ---
+            for idx, cond in rule.order:
+                cond_started = time.perf_counter()
+                is_ok = cond.check(values)
+                metrics.observe("liteflow_condition_duration_seconds", time.perf_counter() - cond_started, rule.condition_labels[idx])
             
-            print(f"[DEBUG] Regle '{rule['name']}' Cond {idx+1}: {field} ({task_value}) {operator} {rule_value} -> {is_ok} ({reason})")
+                if debug:
+                    reason = cond.explain(values, is_ok)
+                    if cond.field is None:
+                        trace.emit(DEBUG, "condition", f"Regle '{rule.name}' Cond {idx+1}: {cond.title} -> {is_ok}",
+                                   rule=rule.name, condition=idx + 1, group=cond.title, ok=is_ok)
+                    else:
+                        task_val = values.get(cond.field)[0]
+                        trace.emit(DEBUG, "condition", f"Regle '{rule.name}' Cond {idx+1}: {cond.label} ({task_val}) {cond.operator} {cond.value} -> {is_ok} ({reason})",
+                                   rule=rule.name, condition=idx + 1, field=cond.field, operator=cond.operator,
+                                   expected=cond.value, actual=task_val, ok=is_ok)
             
-            if not is_ok:
-                all_met = False
-                break
+                if not is_ok:
+                    all_met = False
+                    break
         
-        # --- 2. Exécution des Actions ---
-        if all_met:
-            print(f"[DEBUG] pour '{rule['name']}' ! Exécution...")
+            if not all_met:
+                metrics.observe("liteflow_rule_duration_seconds", time.perf_counter() - rule_started, rule.labels)
+                continue
+
+            # --- 2. Exécution des Actions ---
+            if trace.wants(INFO, rule.name):
+                trace.emit(INFO, "match", f"Règle '{rule.name}' : conditions remplies, exécution...", rule=rule.name)
             # Log de match de règle
-            db.add(AuditLog(message=f"[ENGINE] Règle '{rule['name']}' appliquée"))
-            changes_made = True
-            
-            steps = rule.get('steps') or rule.get('actions') or []
-            for step in steps:
+            outcome.matched.append(rule.name)
+            outcome.logs.append(f"[ENGINE] Règle '{rule.name}' appliquée")
+            metrics.inc("liteflow_rule_matches_total", rule.labels)
+            reindex = False
+        
+            for step in rule.steps:
                 action = step.get('action')
                 fields = step.get('fields', {})
-                
+                if actions >= MAX_ACTIONS:
+                    _halt(outcome, trace, "actions", f"Budget de {MAX_ACTIONS} actions atteint pour {_task_ref(task)}")
+                    break
+                actions += 1
+                metrics.inc("liteflow_rule_actions_total", (rule.name, str(action)))
+            
                 if action == 'update':
                     for label, val in fields.items():
                         # Mapping inverse (Label -> Tech) si nécessaire, ou utilisation directe
                         tech_key = MAPPING.get(label) if label in MAPPING else label.lower()
-                        
+                    
+                        # Nature désignée par ID ou par nom : résolue via le cache de référence
+                        if tech_key in CLASSIFICATION_KEYS:
+                            tech_key = 'classification_id'
+                            resolved = resolve_classification(val)
+                            if resolved is None:
+                                if trace.wants(INFO, rule.name):
+                                    trace.emit(INFO, "skip", f"Nature '{val}' inconnue : mise à jour ignorée pour {_task_ref(task)}", rule=rule.name)
+                                continue
+                            val = resolved
+                    
                         # Gestion accent via la fonction utilitaire
                         if tech_key == 'status':
                             val = normalize_status(val)
                             # Règle de Sécurité : Si le ticket est déjà 'Terminé', on ignore le changement de statut
                             if task.status == "Terminé" and val != "Terminé":
-                                print(f"[ENGINE] Ignoré : Tentative de changer le statut 'Terminé' de #{task.id} via '{rule['name']}'")
-                                db.add(AuditLog(message=f"[ENGINE] Règle '{rule['name']}' ignorée : Impossible de modifier le statut d'un ticket déjà terminé."))
+                                if trace.wants(INFO, rule.name):
+                                    trace.emit(INFO, "skip", f"Ignoré : Tentative de changer le statut 'Terminé' de {_task_ref(task)} via '{rule.name}'", rule=rule.name)
+                                outcome.logs.append(f"[ENGINE] Règle '{rule.name}' ignorée : Impossible de modifier le statut d'un ticket déjà terminé.")
                                 continue
-                        
+                    
                         if hasattr(task, tech_key):
+                            # Cycle : l'écriture rétablit une valeur déjà prise par le champ pendant l'évaluation
+                            current = getattr(task, tech_key)
+                            if val != current:
+                                seen = history.setdefault(tech_key, [current])
+                                if val in seen:
+                                    _halt(outcome, trace, "cycle", f"Cycle détecté sur {label} ({current} -> {val}) par la règle '{rule.name}' pour {_task_ref(task)}")
+                                    break
+                                seen.append(val)
+                                pass_changed.add(tech_key)
                             setattr(task, tech_key, val)
-                            print(f"[ENGINE] UPDATE {tech_key} -> {val}")
-                            changes_made = True
-                            
+                            values.invalidate(tech_key)
+                            outcome.changes[tech_key] = val
+                            if tech_key in compiled.selective_fields:
+                                reindex = True
+                            if scope is not None:
+                                dependents = compiled.rules_for_fields([tech_key])
+                                if not dependents <= scope:
+                                    scope |= dependents
+                                    reindex = True
+                            if trace.wants(INFO, rule.name):
+                                trace.emit(INFO, "update", f"UPDATE {tech_key} -> {val}", rule=rule.name, field=tech_key, value=val)
+                        
                             # Audit Log for Update
-                            db.add(AuditLog(message=f"[ENGINE] Règle '{rule['name']}' : Mise à jour de {label}"))
-                            
+                            outcome.logs.append(f"[ENGINE] Règle '{rule.name}' : Mise à jour de {label}")
+                        
                             # Check for status completion
                             if tech_key == 'status' and val in ['Terminé', 'Done']:
-                                cascade_completion(task, db)
-                            
+                                outcome.completed = True
+                    if outcome.halted:
+                        break
+                        
                 elif action == 'create_task':
                     # Mapping des champs de création
                     create_data = {}
                     for k, v in fields.items():
                         tk = MAPPING.get(k) if k in MAPPING else k.lower()
                         create_data[tk] = v
-                    
-                    try:
-                        # 1. Héritage de la Nature du Filtre parent
+                
+                    # 1. Nature explicite de l'étape (ID ou nom), sinon héritage de la Nature du parent
+                    target_classif_id = None
+                    requested = next((create_data[k] for k in CLASSIFICATION_KEYS if create_data.get(k) not in (None, "")), None)
+                    if requested is not None:
+                        target_classif_id = resolve_classification(requested)
+                        if target_classif_id is None and trace.wants(INFO, rule.name):
+                            trace.emit(INFO, "fallback", f"Nature '{requested}' inconnue, héritage de la nature du parent {_task_ref(task)}", rule=rule.name)
+                    if not target_classif_id:
                         target_classif_id = getattr(task, 'classification_id', None)
-                        
-                        # 2. Sécurité : Recherche de la nature 'Demandes' par défaut si nécessaire
-                        if not target_classif_id:
-                            from models import TaskClassification
-                            default_nat = db.query(TaskClassification).filter(TaskClassification.name == "Demandes").first()
-                            if default_nat:
-                                target_classif_id = default_nat.id
-                                print(f"[ENGINE] Nature manquante sur parent #{task.id}, repli sur 'Demandes' (ID: {target_classif_id})")
-                        
-                        if not target_classif_id:
-                            print(f"[ENGINE] Aucune nature disponible pour la création de sous-tâche pour #{task.id}")
-                            continue
-
-                        print(f"[ENGINE] Création sous-tâche (Parent #{task.id}) avec Nature ID : {target_classif_id}")
-                        new_task = Task(
-                            title=create_data.get('title', 'Sous-tâche'),
-                            description=create_data.get('description', ''),
-                            parent_id=task.id,
-                            status=create_data.get('status', 'Nouveau'),
-                            priority=create_data.get('priority', 'Moyenne'),
-                            assigned_to=create_data.get('assigned_to'),
-                            classification_id=target_classif_id
-                        )
-                        db.add(new_task)
-                        db.add(AuditLog(message=f"[ENGINE] Sous-tâche créée pour le parent #{task_id} (Nature héritée)"))
-                        print(f"[ENGINE] CREATE sous-tâche '{new_task.title}' [OK]")
-                        changes_made = True
-                    except Exception as e:
-                        print(f"[ENGINE] [ERREUR] Échec create_task : {e}")
-                        db.rollback()
-                        return
-
-    if changes_made:
-        try:
-            db.commit()
-            print("[ENGINE] [OK] Commit effectué.\n")
-        except Exception as e:
-            print(f"[ENGINE] [ERREUR] Échec commit final : {e}")
+                
+                    # 2. Sécurité : Recherche de la nature 'Demandes' par défaut si nécessaire
+                    if not target_classif_id:
+                        target_classif_id = resolve_classification()
+                        if target_classif_id:
+                            if trace.wants(INFO, rule.name):
+                                trace.emit(INFO, "fallback", f"Nature manquante sur parent {_task_ref(task)}, repli sur 'Demandes' (ID: {target_classif_id})", rule=rule.name)
+                
+                    if not target_classif_id:
+                        if trace.wants(INFO, rule.name):
+                            trace.emit(INFO, "skip", f"Aucune nature disponible pour la création de sous-tâche pour {_task_ref(task)}", rule=rule.name)
+                        continue
+
+                    if len(outcome.children) >= MAX_CHILDREN:
+                        _halt(outcome, trace, "children", f"Budget de {MAX_CHILDREN} sous-tâches atteint pour {_task_ref(task)}")
+                        break
+                    outcome.children.append(dict(
+                        title=create_data.get('title', 'Sous-tâche'),
+                        description=create_data.get('description', ''),
+                        status=create_data.get('status', 'Nouveau'),
+                        priority=create_data.get('priority', 'Moyenne'),
+                        assigned_to=create_data.get('assigned_to'),
+                        classification_id=target_classif_id
+                    ))
+                    outcome.logs.append(f"[ENGINE] Sous-tâche créée pour le parent {_task_ref(task)} (Nature héritée)")
+                    if trace.wants(INFO, rule.name):
+                        trace.emit(INFO, "create_task", f"CREATE sous-tâche '{outcome.children[-1]['title']}' (Parent {_task_ref(task)}, Nature ID : {target_classif_id}) [OK]",
+                                   rule=rule.name, title=outcome.children[-1]['title'], classification_id=target_classif_id)
+
+            fired[rule.position] = _fingerprint(values, rule)
+            metrics.observe("liteflow_rule_duration_seconds", time.perf_counter() - rule_started, rule.labels)
+
+            # Un champ indexé a changé : les règles suivantes sont re-sélectionnées
+            if reindex:
+                candidates = compiled.select(values, after=rule.position, only=scope)[0]
+                pos = 0
+
+        if outcome.halted or outcome.completed or not pass_changed:
+            break
+        # Passe suivante : seules les règles lisant un champ modifié sont réévaluées (ordre du fichier)
+        scope = compiled.rules_for_fields(pass_changed)
+        candidates = compiled.select(values, only=scope)[0]
+        if not candidates:
+            break
+        if outcome.passes >= MAX_PASSES:
+            _halt(outcome, trace, "passes", f"Limite de {MAX_PASSES} passes atteinte pour {_task_ref(task)}")
+            break
+        outcome.passes += 1
+        if trace.wants(INFO):
+            trace.emit(INFO, "pass", f"Passe {outcome.passes} : {len(candidates)} règle(s) à réévaluer ({', '.join(sorted(pass_changed))} modifié(s))",
+                       passes=outcome.passes, candidates=len(candidates), fields=sorted(pass_changed))
+
+    # --- 3. Règles temporisées : minuteur armé si les conditions sont remplies (état final) ---
+    if not outcome.completed and task.status != "Terminé":
+        for rule in compiled.timed_rules:
+            if all(cond.check(values) for cond in rule.conditions):
+                outcome.timers.append((rule.name, rule.delay))
+                if trace.wants(INFO, rule.name):
+                    trace.emit(INFO, "timer", f"Règle temporisée '{rule.name}' : échéance dans {rule.delay} s",
+                               rule=rule.name, delay=rule.delay)
+
+    metrics.observe("liteflow_workflow_duration_seconds", time.perf_counter() - started)
+    return outcome
+
+def _arm_timers(db: Session, items, fresh=False):
+    """
+    Persiste les minuteurs (task_id, règle, délai en secondes) dans `workflow_timers`
+    (un executemany) et retourne les messages d'AuditLog correspondants.
+    Une tâche n'a qu'un minuteur en attente par règle : une fois déclenché (ou en échec),
+    il peut être réarmé. `fresh` (tâche qui vient d'être insérée) évite la requête de vérification.
+    """
+    if not items:
+        return []
+    if not fresh:
+        task_ids = {task_id for task_id, _, _ in items}
+        existing = set(db.execute(
+            select(WorkflowTimer.task_id, WorkflowTimer.rule_name).where(
+                WorkflowTimer.task_id.in_(task_ids),
+                WorkflowTimer.rule_name.in_({name for _, name, _ in items}),
+                WorkflowTimer.status == "En attente",
+            )
+        ).all())
+        items = [item for item in items if (item[0], item[1]) not in existing]
+    if not items:
+        return []
+    now = get_utc_now()
+    rows = [
+        {"task_id": task_id, "rule_name": name, "status": "En attente",
+         "due_at": now + datetime.timedelta(seconds=delay), "created_at": now}
+        for task_id, name, delay in items
+    ]
+    db.execute(insert(WorkflowTimer), rows)
+    return [f"[ENGINE] Règle '{row['rule_name']}' programmée pour #{row['task_id']} "
+            f"(échéance {row['due_at']:%Y-%m-%d %H:%M:%S} UTC)" for row in rows]
+
+def _apply_outcome(task, outcome, db: Session, trace):
+    """Écrit le résultat d'une évaluation unitaire (AuditLog, sous-tâches, minuteurs, clôture) et commit."""
+    try:
+        outcome.logs.extend(_arm_timers(db, [(task.id, name, delay) for name, delay in outcome.timers]))
+        if not outcome.has_changes:
+            if trace.wants(INFO):
+                trace.emit(INFO, "done", "Aucune modification nécessaire.")
+            db.rollback()
+            return
+        # Les mises à jour de champs sont déjà portées par l'objet ORM
+        for message in outcome.logs:
+            db.add(AuditLog(message=message))
+        for data in outcome.children:
+            db.add(Task(parent_id=task.id, **data))
+        if outcome.completed:
+            cascade_completion(task, db)
+        db.commit()
+        if trace.wants(INFO):
+            trace.emit(INFO, "commit", "[OK] Commit effectué.", matched=outcome.matched)
+    except Exception as e:
+        print(f"[ENGINE] [ERREUR] Échec commit final : {e}")
+        trace.emit(INFO, "error", f"[ERREUR] Échec commit final : {e}")
+        metrics.inc("liteflow_engine_errors_total", ("commit",))
+        db.rollback()
+        raise
+
+def process_workflow(task_id, db: Session, changed_fields=None):
+    """
+    Exécute le workflow d'une tâche. `changed_fields` (champs techniques modifiés par une
+    mise à jour) limite l'évaluation aux règles qui en dépendent ; None = toutes les règles.
+    """
+    task = db.query(Task).filter(Task.id == task_id).first()
+    if not task: return
+
+    compiled = get_compiled_rules()
+    trace = tracing.begin(task.id, compiled.traced_rules)
+    if trace.wants(INFO):
+        trace.emit(INFO, "start", f"--- Analyse Tâche #{task.id} : {task.title} ---", changed_fields=changed_fields)
+    
+    # Sécurité: Ne pas traiter les tickets clôturés
+    if task.closed_at or task.status == "Terminé":
+        if trace.wants(INFO):
+            trace.emit(INFO, "skip", f"[SKIP] Ticket #{task.id} déjà clôturé. Workflow ignoré.")
+        return
+
+    outcome = evaluate_rules(task, compiled, _classification_resolver(db), changed_fields, trace)
+    if not outcome.has_changes and not outcome.timers:
+        if trace.wants(INFO):
+            trace.emit(INFO, "done", "Aucune modification nécessaire.")
+        return
+    _apply_outcome(task, outcome, db, trace)
+
+def process_timer(task_id, rule_name, db: Session):
+    """
+    Exécute une règle temporisée arrivée à échéance. Ses conditions sont réévaluées
+    sur l'état courant de la tâche : les actions ne s'appliquent que si elles tiennent toujours.
+    Retourne le WorkflowOutcome, ou None si la tâche, la règle ou le ticket ouvert n'existent plus.
+    """
+    task = db.query(Task).filter(Task.id == task_id).first()
+    if not task: return None
+
+    compiled = get_compiled_rules().timed_set(rule_name)
+    trace = tracing.begin(task.id, (rule_name,))
+    if compiled is None:
+        trace.emit(INFO, "skip", f"[SKIP] Règle temporisée '{rule_name}' introuvable (supprimée ou sans délai).", rule=rule_name)
+        return None
+    if trace.wants(INFO, rule_name):
+        trace.emit(INFO, "start", f"--- Échéance '{rule_name}' : Tâche #{task.id} : {task.title} ---", rule=rule_name)
+    if task.closed_at or task.status == "Terminé":
+        if trace.wants(INFO, rule_name):
+            trace.emit(INFO, "skip", f"[SKIP] Ticket #{task.id} déjà clôturé. Échéance ignorée.", rule=rule_name)
+        return None
+
+    outcome = evaluate_rules(task, compiled, _classification_resolver(db), trace=trace)
+    _apply_outcome(task, outcome, db, trace)
+    return outcome
+
+def insert_with_workflow(task, db: Session):
+    """
+    Crée une tâche avec son workflow en une seule transaction : les règles sont évaluées
+    sur l'objet encore en attente (avant tout flush), les champs modifiés partent donc
+    dans l'INSERT initial. Le flush attribue l'ID, puis sous-tâches et AuditLog sont
+    insérés par lot (un executemany chacun) ; l'appelant fait l'unique commit.
+    Retourne le WorkflowOutcome.
+    """
+    compiled = get_compiled_rules()
+    trace = tracing.begin(None, compiled.traced_rules)
+    if trace.wants(INFO):
+        trace.emit(INFO, "start", f"--- Analyse nouvelle tâche : {task.title} (avant insertion) ---")
+
+    # Date de création fixée avant l'évaluation (opérateurs de date), comme le ferait le défaut de la colonne
+    if task.created_at is None:
+        task.created_at = get_utc_now()
+    outcome = WorkflowOutcome(None)
+    if task.status != "Terminé":
+        outcome = evaluate_rules(task, compiled, _classification_resolver(db), trace=trace)
+
+    db.add(task)
+    db.flush()
+    outcome.bind(task.id)
+    trace.bind(task.id)
+    if outcome.children:
+        db.execute(insert(Task), [dict(data, parent_id=task.id) for data in outcome.children])
+    outcome.logs.extend(_arm_timers(db, [(task.id, name, delay) for name, delay in outcome.timers], fresh=True))
+    if outcome.has_changes:
+        db.execute(insert(AuditLog), [{"message": message} for message in outcome.logs])
+    return outcome
+
+# --- ÉVALUATION PAR LOT ---
+
+SNAPSHOT_FIELDS = (
+    'id', 'title', 'description', 'priority', 'status', 'assigned_to', 'tags',
+    'parent_id', 'asset_id', 'classification_id', 'created_at', 'closed_at'
+)
+
+class TaskSnapshot:
+    """Copie compacte (sans état ORM) d'une ligne de `tasks` pour l'évaluation par lot."""
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, row):
+        for field, val in zip(SNAPSHOT_FIELDS, row):
+            setattr(self, field, val)
+
+def process_workflow_many(task_ids, db: Session, dry_run=False, compiled=None):
+    """
+    Évalue les règles sur un lot de tâches (toutes les tâches ouvertes si task_ids est None) :
+    une requête de chargement, des écritures groupées et un seul commit.
+    Retourne un résumé des écritures effectuées.
+    `dry_run` : rien n'est écrit, le résumé détaille les modifications prévues (clé "changes").
+    `compiled` : jeu de règles à appliquer (par défaut, les règles actives).
+    """
+    query = db.query(*[getattr(Task, f) for f in SNAPSHOT_FIELDS]).filter(
+        Task.closed_at.is_(None), Task.status != "Terminé"
+    )
+    if task_ids is not None:
+        task_ids = list(task_ids)
+        if not task_ids:
+            return {"tasks": 0, "matched": 0, "updated": 0, "children": 0, "logs": 0}
+        query = query.filter(Task.id.in_(task_ids))
+    snapshots = [TaskSnapshot(row) for row in query.all()]
+    print(f"\n[ENGINE] --- Analyse par lot : {len(snapshots)} tâche(s) ---")
+
+    compiled = compiled or get_compiled_rules()
+    resolve = _classification_resolver(db)
+    outcomes = [evaluate_rules(snap, compiled, resolve) for snap in snapshots]
+
+    updates = [dict(o.changes, id=o.task_id) for o in outcomes if o.changes]
+    children = [dict(data, parent_id=o.task_id) for o in outcomes for data in o.children]
+    timers = [(o.task_id, name, delay) for o in outcomes for name, delay in o.timers]
+    logs = [{"message": message} for o in outcomes for message in o.logs]
+    completed = [o.task_id for o in outcomes if o.completed]
+    summary = {
+        "tasks": len(snapshots),
+        "matched": sum(1 for o in outcomes if o.matched),
+        "updated": len(updates),
+        "children": len(children),
+        "logs": len(logs),
+    }
+    if dry_run:
+        summary["changes"] = [
+            {"task_id": o.task_id, "rules": o.matched, "fields": o.changes,
+             "children": [c["title"] for c in o.children], "completed": o.completed,
+             "timers": [name for name, _ in o.timers]}
+            for o in outcomes if o.has_changes or o.timers
+        ]
+        print(f"[ENGINE] [DRY-RUN] {len(summary['changes'])} tâche(s) seraient modifiées, aucune écriture.\n")
+        return summary
+
+    try:
+        armed = _arm_timers(db, timers)
+        logs.extend({"message": message} for message in armed)
+        summary["logs"] = len(logs)
+        if not logs:
+            print("[ENGINE] Aucune modification nécessaire.\n")
             db.rollback()
+            return summary
+        if updates:
+            db.execute(update(Task), updates)
+        if completed:
+            close_subtree(db, completed)
+        if children:
+            db.execute(insert(Task), children)
+        db.execute(insert(AuditLog), logs)
+        db.commit()
+        print(f"[ENGINE] [OK] Commit effectué ({summary['updated']} mise(s) à jour, {summary['children']} sous-tâche(s)).\n")
+    except Exception as e:
+        print(f"[ENGINE] [ERREUR] Échec commit par lot : {e}")
+        metrics.inc("liteflow_engine_errors_total", ("batch",))
+        db.rollback()
+        raise
+    return summary
+
+# --- COMPILATION SQL DES DÉCLENCHEURS (aperçu d'impact côté serveur) ---
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _typed_bound(cond):
+    """Borne d'un opérateur typé ('Supérieur à', 'Avant le', 'Plus ancien que'...) en UTC naïf / nombre."""
+    kind = cond.op.kind
+    if kind in ("older_than", "newer_than"):
+        return operators.to_naive_utc(get_utc_now()) - datetime.timedelta(seconds=operators.parse_duration(cond.value))
+    if operators.field_type(cond.field) == operators.DATE:
+        return operators.parse_date(cond.value)
+    return float(cond.value)
+
+def condition_to_sql(cond):
+    """Traduit un CompiledCondition en expression SQLAlchemy de même sémantique."""
+    op = cond.op
+    if op is None or cond.error:
+        return false()
+    raw = getattr(Task, cond.field)
+    # Même normalisation que get_task_value : NULL -> '', espaces retirés, casse ignorée
+    column = func.trim(func.coalesce(cast(raw, String), ""))
+    kind = op.kind
+    if cond.choices is not None:
+        expr = func.lower(column).in_(sorted(cond.choices)) if cond.choices else false()
+    elif kind in ("gt", "older_than"):
+        expr = raw > _typed_bound(cond) if kind == "gt" else raw < _typed_bound(cond)
+    elif kind in ("lt", "newer_than"):
+        expr = raw < _typed_bound(cond) if kind == "lt" else raw >= _typed_bound(cond)
+    elif kind == "regex":
+        expr = func.lower(column).regexp_match(f"(?i){cond.value}")
+    elif kind == "contains":
+        expr = column.ilike(f"%{_like_escape(cond.needle)}%", escape="\\")
+    elif kind == "starts_with":
+        expr = column.ilike(f"{_like_escape(cond.needle)}%", escape="\\")
+    elif operators.field_type(cond.field) == operators.NUMBER:
+        expr = raw == float(cond.value)
     else:
-        print("[ENGINE] Aucune modification nécessaire.\n")
\ No newline at end of file
+        expr = func.lower(column) == cond.needle
+    if kind in ("gt", "lt", "older_than", "newer_than") or (cond.choices is None and kind == "equals"
+                                                            and operators.field_type(cond.field) == operators.NUMBER):
+        # Colonne brute : NULL doit valoir faux (comme le moteur), et non inconnu, pour que
+        # les négations (N'est pas, groupe NON) retiennent aussi ces lignes
+        expr = and_(raw.isnot(None), expr)
+    return ~expr if op.negated else expr
+
+def node_to_sql(node):
+    """Traduit un nœud du graphe de décision (condition ou groupe ET / OU / NON) en expression SQLAlchemy."""
+    if isinstance(node, ConditionGroup):
+        parts = [node_to_sql(child) for child in node.children]
+        if node.mode == 'any':
+            return or_(false(), *parts)
+        expr = and_(true(), *parts)
+        return ~expr if node.mode == 'not' else expr
+    return condition_to_sql(node)
+
+def rule_to_where(rule):
+    """Clause WHERE (ET logique) équivalente aux déclencheurs d'une règle (dict ou CompiledRule)."""
+    if isinstance(rule, dict):
+        rule = CompiledRule(0, rule)
+    return and_(true(), *[node_to_sql(cond) for cond in rule.conditions])
+
+def preview_rule_impact(db: Session, rule, sample_size=10):
+    """Nombre de tâches correspondant aux déclencheurs et échantillon d'IDs (COUNT + LIMIT en base)."""
+    where = rule_to_where(rule)
+    count = db.query(func.count(Task.id)).filter(where).scalar() or 0
+    sample = db.query(Task.id).filter(where).order_by(Task.id.desc()).limit(sample_size).all()
+    return {"count": count, "sample_ids": [row.id for row in sample]}
+
+# --- SIMULATION (rejeu vectorisé sur l'historique, sans écriture) ---
+
+def _vector_mask(cond, column, raw):
+    """Équivalent vectorisé (pandas) du test compilé d'une condition : colonne normalisée et colonne brute."""
+    import pandas as pd
+
+    op = cond.op
+    if op is None or cond.error:
+        return pd.Series(False, index=column.index)
+    kind = op.kind
+    if cond.choices is not None:
+        mask = column.isin(cond.choices)
+    elif kind in ("gt", "lt", "older_than", "newer_than") or (kind == "equals"
+                                                              and operators.field_type(cond.field) == operators.NUMBER):
+        if operators.field_type(cond.field) == operators.DATE:
+            typed = pd.to_datetime(raw, errors="coerce")
+            if getattr(typed.dt, "tz", None) is not None:
+                typed = typed.dt.tz_convert("UTC").dt.tz_localize(None)
+        else:
+            typed = pd.to_numeric(raw, errors="coerce")
+        if kind == "equals":
+            mask = typed == float(cond.value)
+        else:
+            bound = _typed_bound(cond)
+            mask = typed > bound if kind == "gt" else typed < bound if kind in ("lt", "older_than") else typed >= bound
+    elif kind == "regex":
+        mask = column.str.contains(cond.value, case=False, regex=True)
+    elif kind == "contains":
+        mask = column.str.contains(cond.needle, regex=False)
+    elif kind == "starts_with":
+        mask = column.str.startswith(cond.needle)
+    else:
+        mask = column == cond.needle
+    mask = mask.fillna(False).astype(bool)
+    return ~mask if op.negated else mask
+
+def simulate_rules(db: Session, rules=None, sample_size=5, only_open=False):
+    """
+    Rejoue les déclencheurs des règles (actives par défaut) sur les tâches existantes.
+    Les tâches sont chargées en colonnes (pandas) et chaque condition est évaluée
+    par des opérations vectorisées ; les masques identiques sont partagés entre règles.
+    Aucune action n'est exécutée et rien n'est écrit en base.
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+    compiled = CompiledRuleSet(rules) if rules is not None else get_compiled_rules()
+    # Les règles temporisées sont simulées comme les autres (état actuel, sans délai)
+    all_rules = compiled.rules + compiled.timed_rules
+    fields = sorted({leaf.field for rule in all_rules for leaf in rule.leaves})
+
+    query = select(Task.id, *[getattr(Task, f) for f in fields])
+    if only_open:
+        query = query.where(Task.closed_at.is_(None), _is_open(Task.status))
+    frame = pd.read_sql(query, db.connection())
+
+    # Même normalisation que get_task_value : None -> "", str(), strip, minuscules
+    columns = {}
+    for field in fields:
+        col = frame[field].astype(object)
+        columns[field] = col.where(col.notna(), "").astype(str).str.strip().str.lower()
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # Masques partagés par clé de nœud : une condition ou un groupe commun n'est calculé qu'une fois
+    masks = {}
+    def node_mask(node):
+        cached = masks.get(node.key)
+        if cached is None:
+            if isinstance(node, ConditionGroup):
+                parts = [node_mask(child) for child in node.children]
+                cached = parts[0]
+                for part in parts[1:]:
+                    cached = cached | part if node.mode == 'any' else cached & part
+                if node.mode == 'not':
+                    cached = ~cached
+            else:
+                cached = _vector_mask(node, columns[node.field], frame[node.field])
+            masks[node.key] = cached
+        return cached
+
+    results = []
+    for rule in all_rules:
+        rule_start = time.perf_counter()
+        mask = pd.Series(True, index=frame.index)
+        for cond in rule.conditions:
+            mask &= node_mask(cond)
+        matched_ids = frame["id"][mask]
+        results.append({
+            "name": rule.name,
+            "matches": int(mask.sum()),
+            "sample_ids": [int(i) for i in matched_ids.head(sample_size)],
+            "elapsed_ms": round((time.perf_counter() - rule_start) * 1000, 3),
+        })
+
+    return {
+        "tasks": len(frame),
+        "load_ms": round(load_ms, 3),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+        "rules": results,
+    }
@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
-import yaml
 import json
 import uuid
 import os
 import requests
-from engine import check_rules_integrity, load_workflows
+from engine import load_workflows, parse_delay, MAPPING
+import operators
 
 # --- CONSTANTES & CONFIGURATION ---
 DISPLAY_TO_TECH = {
@@ -23,7 +23,7 @@ TECH_TO_DISPLAY = {v: k for k, v in DISPLAY_TO_TECH.items()}
 STATUS_OPTIONS = ["Nouveau", "À faire", "En cours", "Terminé"]
 PRIORITY_OPTIONS = ["Basse", "Moyenne", "Haute", "Critique"]
 
-ALL_TRIGGER_FIELDS = ["Titre", "Description", "Statut", "Priorité", "Assigné à"]
+ALL_TRIGGER_FIELDS = ["Titre", "Description", "Statut", "Priorité", "Assigné à", "ID", "Créé le"]
 ALL_ACTION_FIELDS = list(DISPLAY_TO_TECH.keys())
 
 # --- GESTION DE L'ÉTAT (STATE MANAGEMENT) ---
@@ -35,10 +35,14 @@ def init_flow_state():
         "editing_rule_idx": -1,
         "editing_step_idx": -1,
         "current_rule_name": "",
+        "current_delay": 0,
+        "current_logic": "ET",
+        "advanced_triggers": None,
         "current_triggers": [{'field': 'Titre', 'operator': 'Contient', 'value': ''}],
         "buf_fields": [],
         "buf_action": "update",
-        "delete_confirm_idx": -1
+        "delete_confirm_idx": -1,
+        "simulation_result": None
     }
     for key, val in defaults.items():
         if key not in st.session_state:
@@ -51,6 +55,73 @@ def normalize_status(val):
     if val == "A faire": return "À faire"
     return val
 
+# --- DÉCLENCHEURS : GROUPES ET / OU / NON ---
+
+def build_triggers(conditions, logic):
+    """
+    Déclencheurs YAML à partir des lignes de l'éditeur : NON -> {"not": cond},
+    OU -> un groupe {"any": [...]}, ET -> liste simple (ET implicite du moteur).
+    """
+    items = []
+    for cond in conditions:
+        clean = {k: v for k, v in cond.items() if k != 'negate'}
+        items.append({'not': clean} if cond.get('negate') else clean)
+    if logic == "OU" and len(items) > 1:
+        return [{'any': items}]
+    return items
+
+def parse_triggers(triggers):
+    """
+    Inverse de build_triggers : (logique, lignes de l'éditeur), ou None si les
+    déclencheurs utilisent des groupes imbriqués que l'éditeur ne sait pas représenter.
+    """
+    logic = "ET"
+    if len(triggers) == 1 and isinstance(triggers[0], dict) and isinstance(triggers[0].get('any'), list):
+        logic, triggers = "OU", triggers[0]['any']
+    conditions = []
+    for trig in triggers:
+        if not isinstance(trig, dict):
+            return None
+        if 'not' in trig and isinstance(trig['not'], dict) and 'field' in trig['not']:
+            conditions.append(dict(trig['not'], negate=True))
+        elif 'field' in trig:
+            conditions.append(dict(trig))
+        else:
+            return None
+    return logic, conditions
+
+def current_rule_triggers():
+    """Déclencheurs de la règle en cours d'édition (groupes avancés conservés tels quels)."""
+    if st.session_state.get('advanced_triggers') is not None:
+        return st.session_state.advanced_triggers
+    return build_triggers(st.session_state.current_triggers, st.session_state.get('current_logic', "ET"))
+
+def format_triggers(triggers, joiner="ET"):
+    """Résumé HTML des déclencheurs (conditions et groupes all / any / not)."""
+    sep = f" <span style='color:#ef4444; font-weight:800; font-size:11px;'>{joiner}</span> "
+    parts = []
+    for t in triggers:
+        if not isinstance(t, dict):
+            continue
+        if 'any' in t or 'all' in t:
+            sub = "OU" if 'any' in t else "ET"
+            items = t.get('any') or t.get('all') or []
+            parts.append(f"({format_triggers(items if isinstance(items, list) else [items], sub)})")
+        elif 'not' in t:
+            items = t['not'] if isinstance(t['not'], list) else [t['not']]
+            parts.append(f"<span style='color:#ef4444; font-weight:800; font-size:11px;'>NON</span> ({format_triggers(items)})")
+        else:
+            f = t.get('field', '?')
+            o = t.get('operator', '?')
+            v = t.get('value', '')
+            parts.append(f"<span style='background:#f1f5f9; padding:2px 6px; border-radius:4px; font-weight:600;'>{f}</span> <i style='color:#64748b; font-size:12px;'>{o}</i> <strong style='color:#5048e5;'>'{v}'</strong>")
+    return sep.join(parts)
+
+def _api_headers():
+    """En-tête d'authentification de la session courante pour les appels API du designer."""
+    token = st.session_state.get('token')
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
 # --- CALLBACKS (LOGIQUE MÉTIER) ---
 
 def cb_clear_buffer():
@@ -69,8 +140,12 @@ def cb_start_new_rule():
     """Réinitialise tout l'éditeur pour une nouvelle règle."""
     st.session_state.editing_rule_idx = -1
     st.session_state.current_rule_name = ""
+    st.session_state.current_delay = 0
+    st.session_state.current_logic = "ET"
+    st.session_state.advanced_triggers = None
     st.session_state.current_triggers = [{'field': 'Titre', 'operator': 'Contient', 'value': ''}]
     st.session_state.temp_steps = []
+    st.session_state.simulation_result = None
     cb_clear_buffer()
 
 def cb_add_trigger_condition():
@@ -108,7 +183,7 @@ def on_trigger_change(idx):
             s_groups = [g['name'] if isinstance(g, dict) else g for g in s_groups_raw] if s_groups_raw else ["Non assigné"]
             trig['value'] = [s_groups[0]] if s_groups else []
     else:
-        trig['operator'] = "Contient"
+        trig['operator'] = operators.names_for(operators.field_type(MAPPING[new_field]))[0]
         trig['value'] = ""
 
 def cb_add_field_row_to_buffer():
@@ -178,11 +253,7 @@ def cb_submit_step():
         # Sécurité : Forçage du type chaîne pour l'assignation (Évite le None suite à une erreur UI)
         if label == "Assigné à" and not val:
             val = "Non assigné"
-        elif label == "Nature":
-            s_classifs = st.session_state.get('classifications', [])
-            # Trouve l'ID par le nom (Stockage technique ID)
-            match = next((c for c in s_classifs if isinstance(c, dict) and c.get('name') == val), None)
-            if match: val = match.get('id', val)
+        # Nature : conservée par son nom, résolu en ID par le moteur (cache de référence)
             
         final_fields[tech_key] = val
 
@@ -204,6 +275,7 @@ def cb_load_rule(idx, current_rules):
     rule = current_rules[idx]
     st.session_state.editing_rule_idx = idx
     st.session_state.current_rule_name = rule.get('name', '')
+    st.session_state.current_delay = parse_delay(rule.get('delay')) // 60
     
     # Chargement Triggers (avec support rétro-compatibilité)
     raw_trigs = rule.get('triggers')
@@ -211,7 +283,15 @@ def cb_load_rule(idx, current_rules):
         raw_trig = rule.get('trigger')
         if isinstance(raw_trig, dict): raw_trigs = [raw_trig]
         else: raw_trigs = [{'field': 'Titre', 'operator': 'Contient', 'value': ''}]
-    st.session_state.current_triggers = raw_trigs
+    parsed = parse_triggers(raw_trigs)
+    if parsed is None:
+        # Groupes imbriqués : conservés tels quels, modifiables via l'export / import YAML
+        st.session_state.advanced_triggers = raw_trigs
+        st.session_state.current_logic = "ET"
+        st.session_state.current_triggers = [{'field': 'Titre', 'operator': 'Contient', 'value': ''}]
+    else:
+        st.session_state.advanced_triggers = None
+        st.session_state.current_logic, st.session_state.current_triggers = parsed
     
     # Chargement Étapes
     st.session_state.temp_steps = [s.copy() for s in rule.get('steps', [])]
@@ -233,36 +313,97 @@ def cb_load_step_for_edit(idx):
         if isinstance(safe_val, (dict, list)): safe_val = json.dumps(safe_val)
         else: safe_val = str(safe_val)
         
+        # Anciennes règles : Nature stockée par ID -> réaffichage du nom
+        if tech_k == "classification_id":
+            s_classifs = st.session_state.get('classifications', [])
+            match = next((c for c in s_classifs if isinstance(c, dict) and str(c.get('id')) == safe_val), None)
+            if match: safe_val = match.get('name', safe_val)
+        
         new_rows.append({"id": str(uuid.uuid4())[:8], "label": label, "value": safe_val})
     
     st.session_state.buf_fields = new_rows
 
-def cb_delete_rule(idx, workflows_file, api_url):
+def fetch_rule_impact(api_url, triggers):
+    """Aperçu d'impact (COUNT SQL côté serveur), mémorisé par jeu de déclencheurs."""
+    key = json.dumps(triggers, sort_keys=True, ensure_ascii=False)
+    cache = st.session_state.setdefault("impact_cache", {})
+    if key not in cache:
+        try:
+            resp = requests.post(f"{api_url}/workflows/preview", json={"triggers": triggers}, headers=_api_headers(), timeout=5)
+            cache[key] = resp.json() if resp.status_code == 200 else None
+        except Exception:
+            cache[key] = None
+    return cache[key]
+
+def cb_simulate_rule(api_url):
+    """Rejoue les déclencheurs en cours d'édition sur l'historique des tickets (sans écriture)."""
+    rule = {"name": st.session_state.current_rule_name or "Brouillon", "triggers": current_rule_triggers()}
+    try:
+        resp = requests.post(f"{api_url}/workflows/simulate", json={"rules": [rule]}, headers=_api_headers(), timeout=30)
+        if resp.status_code == 200:
+            st.session_state.simulation_result = resp.json()
+        else:
+            st.toast(f"❌ Simulation impossible ({resp.status_code})", icon="🚨")
+    except Exception as e:
+        st.toast(f"❌ Simulation impossible : {e}", icon="🚨")
+
+def fetch_rules(api_url):
+    """Règles actives lues via l'API ; leur version est conservée pour l'enregistrement (base_version)."""
+    try:
+        resp = requests.get(f"{api_url}/workflows/rules", headers=_api_headers(), timeout=5)
+        if resp.status_code == 200:
+            data = resp.json()
+            st.session_state.rules_version = data["version"]
+            return data["rules"]
+    except Exception:
+        pass
+    # API injoignable : lecture seule des règles locales
+    st.session_state.rules_version = None
+    return load_workflows()
+
+def push_rules(api_url, rules):
+    """Enregistre le jeu de règles complet via l'API (nouvelle version). Retourne True si enregistré."""
+    if st.session_state.get('rules_version') is None:
+        st.toast("❌ API injoignable : enregistrement impossible.", icon="🚨")
+        return False
+    payload = {"rules": rules, "base_version": st.session_state.rules_version, "author": st.session_state.get('user_email')}
+    try:
+        resp = requests.put(f"{api_url}/workflows/rules", json=payload, headers=_api_headers(), timeout=10)
+    except Exception as e:
+        st.toast(f"❌ Enregistrement impossible : {e}", icon="🚨")
+        return False
+    if resp.status_code == 409:
+        st.toast("⚠️ Les règles ont été modifiées entre-temps : rechargez puis recommencez.", icon="⚠️")
+        return False
+    if resp.status_code != 200:
+        st.toast(f"❌ Enregistrement impossible ({resp.status_code})", icon="🚨")
+        return False
+    st.session_state.rules_version = resp.json()["version"]
+    return True
+
+def cb_delete_rule(idx, api_url, current_rules):
     """Supprime définitivement une règle."""
     try:
-        rules = load_workflows()
+        rules = list(current_rules)
         
         if 0 <= idx < len(rules):
             del_name = rules[idx].get('name')
             del rules[idx]
             
-            with open(workflows_file, "w", encoding="utf-8") as f:
-                yaml.dump(rules, f, default_flow_style=False, allow_unicode=True)
-            
-            try:
-                requests.post(f"{api_url}/audit/logs", json={"message": f"[ADMIN] Règle supprimée: {del_name}"}, timeout=1)
-            except: pass
-            
-            st.toast("🗑️ Règle supprimée.")
-            st.cache_data.clear() # Invalide le cache après modification disque
-            if st.session_state.editing_rule_idx == idx: cb_start_new_rule()
-            elif st.session_state.editing_rule_idx > idx: st.session_state.editing_rule_idx -= 1
+            if push_rules(api_url, rules):
+                try:
+                    requests.post(f"{api_url}/audit/logs", json={"message": f"[ADMIN] Règle supprimée: {del_name}"}, timeout=1)
+                except: pass
+                
+                st.toast("🗑️ Règle supprimée.")
+                if st.session_state.editing_rule_idx == idx: cb_start_new_rule()
+                elif st.session_state.editing_rule_idx > idx: st.session_state.editing_rule_idx -= 1
             
         st.session_state.delete_confirm_idx = -1
     except Exception as e:
         st.error(f"Erreur suppression: {e}")
 
-def cb_save_global_rule(workflows_file, api_url, current_rules):
+def cb_save_global_rule(api_url, current_rules):
     """Sauvegarde la règle complète."""
     if not st.session_state.current_rule_name:
         st.toast("❌ Nom de la règle manquant.", icon="🚨")
@@ -270,21 +411,22 @@ def cb_save_global_rule(workflows_file, api_url, current_rules):
         
     final_rule = {
         "name": st.session_state.current_rule_name,
-        "triggers": st.session_state.current_triggers,
+        "triggers": current_rule_triggers(),
         "steps": st.session_state.temp_steps
     }
+    # Règle temporisée : délai en minutes (0 = exécution immédiate)
+    if st.session_state.get('current_delay'):
+        final_rule["delay"] = int(st.session_state.current_delay)
     
+    rules = list(current_rules)
     if st.session_state.editing_rule_idx != -1:
-        current_rules[st.session_state.editing_rule_idx] = final_rule
+        rules[st.session_state.editing_rule_idx] = final_rule
     else:
-        current_rules.append(final_rule)
+        rules.append(final_rule)
         
-    with open(workflows_file, "w", encoding="utf-8") as f:
-        yaml.dump(current_rules, f, default_flow_style=False, allow_unicode=True)
-    
-    st.toast("✅ Règle sauvegardée avec succès !", icon="💾")
-    st.cache_data.clear() # Invalide le cache après modification disque
-    cb_start_new_rule()
+    if push_rules(api_url, rules):
+        st.toast("✅ Règle sauvegardée avec succès !", icon="💾")
+        cb_start_new_rule()
 
 # -----------------------------------------------------------------------------
 # INTERFACE PRINCIPALE
@@ -299,8 +441,8 @@ def show_flow_designer(api_url, workflows_file, support_groups=None):
     clean_groups = [g['name'] if isinstance(g, dict) else g for g in support_groups] if support_groups else ["Non assigné"]
     st.session_state['support_groups'] = support_groups # On garde l'original au cas où
     
-    # 1. Chargement des règles (CACHED)
-    current_rules = load_workflows()
+    # 1. Chargement des règles (version active, via l'API)
+    current_rules = fetch_rules(api_url)
 
     st.markdown(
         """
@@ -326,16 +468,8 @@ def show_flow_designer(api_url, workflows_file, support_groups=None):
                 t = rule.get('trigger')
                 triggers = [t] if isinstance(t, dict) else []
             
-            # Formatage texte : "Titre Contient 'X' ET Priorité Est égal à 'Haute'"
-            desc_parts = []
-            for t in triggers:
-                if isinstance(t, dict):
-                    f = t.get('field', '?')
-                    o = t.get('operator', '?')
-                    v = t.get('value', '')
-                    desc_parts.append(f"<span style='background:#f1f5f9; padding:2px 6px; border-radius:4px; font-weight:600;'>{f}</span> <i style='color:#64748b; font-size:12px;'>{o}</i> <strong style='color:#5048e5;'>'{v}'</strong>")
-            
-            trigger_summary = " <span style='color:#ef4444; font-weight:800; font-size:11px;'>ET</span> ".join(desc_parts) if desc_parts else "Aucun déclencheur"
+            # Formatage texte : "Titre Contient 'X' ET (Priorité Est parmi 'Haute' OU NON (...))"
+            trigger_summary = format_triggers(triggers) or "Aucun déclencheur"
 
             # 2. Affichage en colonnes
             c1, c2, c3 = st.columns([4, 0.5, 0.5])
@@ -352,7 +486,7 @@ def show_flow_designer(api_url, workflows_file, support_groups=None):
             if st.session_state.delete_confirm_idx == i:
                 st.warning("Supprimer définitivement ?")
                 col_yes, col_no = st.columns(2)
-                col_yes.button("OUI", key=f"conf_del_rule_{i}", on_click=cb_delete_rule, args=(i, workflows_file, api_url), type="primary")
+                col_yes.button("OUI", key=f"conf_del_rule_{i}", on_click=cb_delete_rule, args=(i, api_url, current_rules), type="primary")
                 col_no.button("NON", key=f"no_rule_{i}", on_click=lambda: st.session_state.update(delete_confirm_idx=-1))
             else:
                 c3.button("🗑️", key=f"del_rule_{i}", on_click=lambda x=i: st.session_state.update(delete_confirm_idx=x), help="Supprimer la règle")
@@ -367,15 +501,26 @@ def show_flow_designer(api_url, workflows_file, support_groups=None):
     c_reset.button("🔄 Nouvel éditeur", on_click=cb_start_new_rule)
 
     st.text_input("Dénomination de la règle", key="current_rule_name", placeholder="ex: Escalade Auto P1...")
+    st.number_input("Délai avant exécution (minutes, 0 = immédiat)", key="current_delay", min_value=0, step=15,
+                    help="Les actions s'exécutent à l'échéance, si les déclencheurs sont toujours remplis (SLA, relances).")
 
     # --- TRIGGER BUILDER (Exclusion Mutuelle Globale) ---
-    st.markdown("<h4 style='color: #334155; border-bottom: 2px solid #e2e8f0; padding-bottom: 8px;'>1. Déclencheurs (ET logique)</h4>", unsafe_allow_html=True)
+    st.markdown("<h4 style='color: #334155; border-bottom: 2px solid #e2e8f0; padding-bottom: 8px;'>1. Déclencheurs</h4>", unsafe_allow_html=True)
+
+    if st.session_state.advanced_triggers is not None:
+        st.info("Cette règle utilise des groupes imbriqués (all / any / not) : ses déclencheurs sont conservés tels quels, modifiables via l'export / import YAML (workflow_rules.py).")
+        st.markdown(f"<p style='font-size:13px;'>⚡ Si : {format_triggers(st.session_state.advanced_triggers)}</p>", unsafe_allow_html=True)
+        st.button("✏️ Remplacer par des déclencheurs simples", on_click=lambda: st.session_state.update(advanced_triggers=None))
+    else:
+        st.radio("Combinaison", ["ET", "OU"], key="current_logic", horizontal=True,
+                 help="ET : toutes les conditions ; OU : au moins une. Cochez NON pour inverser une condition.")
     
-    for i, trig in enumerate(st.session_state.current_triggers):
-        c1, c2, c3 = st.columns([1.5, 1.5, 2])
+    for i, trig in enumerate(st.session_state.current_triggers if st.session_state.advanced_triggers is None else []):
+        c0, c1, c2, c3 = st.columns([0.5, 1.5, 1.5, 2])
+        trig['negate'] = c0.checkbox("NON", value=bool(trig.get('negate')), key=f"rule_trig_n_{i}")
         
-        # Calcul des options disponibles (Exclusion des autres lignes)
-        other_fields = [t['field'] for j, t in enumerate(st.session_state.current_triggers) if j != i]
+        # Calcul des options disponibles (Exclusion des autres lignes en ET ; en OU un champ peut revenir)
+        other_fields = [t['field'] for j, t in enumerate(st.session_state.current_triggers) if j != i] if st.session_state.current_logic == "ET" else []
         valid_fields = [f for f in ALL_TRIGGER_FIELDS if f not in other_fields]
         
         # Fallback si le champ actuel est devenu invalide
@@ -394,12 +539,13 @@ def show_flow_designer(api_url, workflows_file, support_groups=None):
             trig['field'] = new_field
             on_trigger_change(i) # Reset opérateur/valeur
 
-        # Définition des options d'opérateurs par défaut
-        ops = ["Contient", "Ne contient pas", "Est égal à", "Commence par"]
+        # Opérateurs proposés selon le type du champ (registre partagé avec le moteur)
+        kind = operators.field_type(MAPPING[new_field])
+        ops = operators.names_for(kind)
 
-        if new_field in ["Statut", "Priorité", "Assigné à"]:
-            trig['operator'] = "Est parmi" # Force l'opérateur
-            c2.text_input("Opérateur", value="Est parmi", disabled=True, key=f"rule_trig_o_{i}")
+        if kind == operators.CHOICE:
+            # Est égal à / N'est pas / Est parmi : valeurs choisies dans une liste
+            trig['operator'] = c2.selectbox("Opérateur", ops, index=ops.index(operators.closest_for(trig['operator'], kind)), key=f"rule_trig_o_{i}")
             
             # Détermination des options et conversion valeur actuelle
             if new_field == "Statut":
@@ -418,14 +564,32 @@ def show_flow_designer(api_url, workflows_file, support_groups=None):
 
         else:
             # Cas général (Titre, Description...)
-            trig['operator'] = c2.selectbox("Opérateur", ops, index=0 if trig['operator'] not in ops else ops.index(trig['operator']), key=f"rule_trig_o_{i}")
-            trig['value'] = c3.text_input("Valeur", value=trig['value'], key=f"rule_trig_v_{i}")
-
-
-    if len(st.session_state.current_triggers) < 3:
-        st.button("➕ Ajouter condition", on_click=cb_add_trigger_condition)
-    if len(st.session_state.current_triggers) > 1:
-        st.button("🗑️ Retirer dernière condition", on_click=cb_remove_trigger_condition)
+            trig['operator'] = c2.selectbox("Opérateur", ops, index=ops.index(operators.closest_for(trig['operator'], kind)), key=f"rule_trig_o_{i}")
+            placeholder = {operators.NUMBER: "ex : 1000", operators.DATE: "ex : 2026-01-31 ou 3j"}.get(kind, "")
+            trig['value'] = c3.text_input("Valeur", value=str(trig['value']), key=f"rule_trig_v_{i}", placeholder=placeholder)
+            error = operators.validate(MAPPING[new_field], trig['operator'], trig['value']) if trig['value'] != "" else None
+            if error:
+                c3.caption(f"⚠️ {error}")
+
+
+    if st.session_state.advanced_triggers is None:
+        if len(st.session_state.current_triggers) < 3:
+            st.button("➕ Ajouter condition", on_click=cb_add_trigger_condition)
+        if len(st.session_state.current_triggers) > 1:
+            st.button("🗑️ Retirer dernière condition", on_click=cb_remove_trigger_condition)
+
+    # Impact en direct : nombre de tickets existants correspondant aux déclencheurs
+    impact = fetch_rule_impact(api_url, current_rule_triggers())
+    if impact is not None:
+        ids = ", ".join(f"#{i}" for i in impact["sample_ids"][:5])
+        st.caption(f"🎯 Impact actuel : {impact['count']} ticket(s) correspondant(s)" + (f" (ex : {ids})" if ids else ""))
+
+    st.button("🔬 Simuler sur l'historique", on_click=cb_simulate_rule, args=(api_url,), help="Compte les tickets existants qui auraient déclenché la règle")
+    sim = st.session_state.get("simulation_result")
+    if sim and sim.get("rules"):
+        res = sim["rules"][0]
+        ids = ", ".join(f"#{i}" for i in res["sample_ids"]) or "aucun"
+        st.info(f"{res['matches']} ticket(s) sur {sim['tasks']} auraient déclenché la règle (exemples : {ids}) — {sim['elapsed_ms']:.0f} ms")
 
     st.markdown("<br/>", unsafe_allow_html=True)
 
@@ -550,4 +714,4 @@ def show_flow_designer(api_url, workflows_file, support_groups=None):
                 c2.button("🗑️", key=f"rule_del_step_{idx}", on_click=lambda x=idx: st.session_state.temp_steps.pop(x))
     
     st.divider()
-    st.button("💾 ENREGISTRER LA REGLE", type="primary", use_container_width=True, on_click=cb_save_global_rule, args=(workflows_file, api_url, current_rules))
\ No newline at end of file
+    st.button("💾 ENREGISTRER LA REGLE", type="primary", use_container_width=True, on_click=cb_save_global_rule, args=(api_url, current_rules))
\ No newline at end of file
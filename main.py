@@ -1,13 +1,29 @@
 # -*- coding: utf-8 -*-
-from fastapi import FastAPI, Depends, HTTPException, Query
-from typing import List
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
+from typing import List, Optional
+from datetime import datetime
+from contextlib import asynccontextmanager
+import inspect
+import functools
+from fastapi.responses import FileResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session, joinedload
 import models
 import schemas
-from database import SessionLocal, engine
+from database import SessionLocal, engine, async_engine, AsyncSessionLocal
 import os
-from engine import process_workflow
+import workflow_queue
+import workflow_timers
+import metrics
+import tracing
+import refdata
+import pagination
+import search
+import task_stats
+import auth
+from engine import close_subtree, simulate_rules, preview_rule_impact, get_compiled_rules, insert_with_workflow, start_stats_flusher, stop_stats_flusher
+from engine import use_rules_database, current_rules_version, read_rules, save_rules, dump_rules, import_rules_file, RulesVersionConflict, RULES_FILE
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from postgrest import SyncPostgrestClient
 from supabase_auth import SyncGoTrueClient
@@ -40,20 +56,25 @@ db_client = SyncPostgrestClient(
 
 security = HTTPBearer()
 
+# Vérification locale des JWT : SUPABASE_JWT_SECRET (HS256) ou JWKS du projet Supabase
+auth.configure(supabase_url=SUPABASE_URL)
+
+def _remote_get_user(token):
+    return auth_client.get_user(token)
+
 def get_user_from_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token: str = credentials.credentials
-    if not auth_client:
+    if not auth_client and not auth.local_verification_enabled():
         raise HTTPException(status_code=500, detail="Supabase client not configured")
     try:
-        user_response = auth_client.get_user(token)
-        if not user_response or not getattr(user_response, "user", None):
-            raise HTTPException(status_code=401, detail="Unauthorized")
-        return getattr(user_response, "user", None)
-    except Exception as e:
+        # Cache des jetons validés, signature vérifiée localement ; GoTrue seulement en voie lente
+        return auth.verify(token, remote=_remote_get_user if auth_client else None)
+    except auth.AuthError:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 # Création des tables au démarrage
 models.Base.metadata.create_all(bind=engine)
+search.ensure_index(engine)
 print("[SGBD] Connexion à Supabase établie et schéma synchronisé")
 
 # Initialisation des classifications par défaut
@@ -69,9 +90,39 @@ def init_data():
 
 init_data()
 
+# Pool de workers du moteur de workflow (file persistante `workflow_jobs`)
+workflow_workers = workflow_queue.WorkflowWorkerPool(SessionLocal)
+
+# Règles de workflow : table `workflow_rules`, initialisée depuis workflows.yaml au premier démarrage
+def init_rules():
+    use_rules_database(SessionLocal)
+    db = SessionLocal()
+    try:
+        if current_rules_version(db) is None and os.path.exists(RULES_FILE):
+            version = import_rules_file(db, RULES_FILE, base_version=0)
+            print(f"[SGBD] Règles importées depuis {RULES_FILE} (version {version})")
+    except RulesVersionConflict:
+        pass  # Importées entre-temps par un autre worker
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_rules()
+    workflow_workers.start()
+    workflow_timers.start(SessionLocal)
+    start_stats_flusher()
+    yield
+    workflow_timers.stop()
+    workflow_workers.stop()
+    stop_stats_flusher()
+    if async_engine is not None:
+        await async_engine.dispose()
+
 app = FastAPI(
     title="LiteFlow Pro API",
-    dependencies=[Depends(get_user_from_token)]
+    dependencies=[Depends(get_user_from_token)],
+    lifespan=lifespan
 )
 
 # Dépendance DB
@@ -82,28 +133,138 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def read_route(path, **route_options):
+    """
+    Route GET de lecture. Avec le moteur asynchrone (API_DB_MODE=async), le handler enregistré
+    est une coroutine qui exécute la fonction décorée dans AsyncSession.run_sync : les accès à
+    la base sont attendus sur la boucle d'événements au lieu d'occuper un thread du threadpool.
+    La fonction décorée est retournée telle quelle (appelable avec une Session synchrone).
+    """
+    def decorator(func):
+        if async_engine is None:
+            return app.get(path, **route_options)(func)
+        response_model = route_options.get("response_model")
+        adapter = TypeAdapter(response_model) if response_model is not None else None
+        signature = inspect.signature(func)
+
+        def call(session, args, kwargs):
+            result = func(*args, db=session, **kwargs)
+            # Sérialisé dans la session : aucun chargement différé hors de run_sync
+            return adapter.validate_python(result, from_attributes=True) if adapter else jsonable_encoder(result)
+
+        @functools.wraps(func)
+        async def handler(*args, db, **kwargs):
+            return await db.run_sync(call, args, kwargs)
+
+        handler.__signature__ = signature.replace(parameters=[
+            param.replace(annotation=inspect.Parameter.empty, default=Depends(get_async_db)) if param.name == "db" else param
+            for param in signature.parameters.values()
+        ])
+        app.get(path, **route_options)(handler)
+        return func
+    return decorator
+
+def paginated(response: Response, query, columns, cursor, limit, descending=True):
+    """Page de `query` ; le curseur de la page suivante est renvoyé dans l'en-tête X-Next-Cursor."""
+    try:
+        rows, next_cursor = pagination.paginate(query, columns, cursor, limit, descending=descending)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
 # -----------------------------------------------------------------------------
 # ROUTES DES TÂCHES (TICKETS)
 # -----------------------------------------------------------------------------
 
-@app.get("/tasks/", response_model=List[schemas.Task])
-def read_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    tasks = db.query(models.Task).options(joinedload(models.Task.classification)).offset(skip).limit(limit).all()
+@read_route("/tasks/", response_model=List[schemas.Task])
+def read_tasks(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    status: Optional[List[str]] = Query(None),
+    priority: Optional[List[str]] = Query(None),
+    assigned_to: Optional[str] = None,
+    classification_id: Optional[int] = None,
+    parent_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    """Tickets du plus récent au plus ancien ; page suivante : `cursor` = en-tête X-Next-Cursor reçu."""
+    query = db.query(models.Task)
+    if status:
+        query = query.filter(models.Task.status.in_(status))
+    if priority:
+        query = query.filter(models.Task.priority.in_(priority))
+    if assigned_to is not None:
+        query = query.filter(models.Task.assigned_to == assigned_to)
+    if classification_id is not None:
+        query = query.filter(models.Task.classification_id == classification_id)
+    if parent_id is not None:
+        query = query.filter(models.Task.parent_id == parent_id)
+    tasks = paginated(response, query, (models.Task.created_at, models.Task.id), cursor, limit)
+    refs = refdata.get(db)
     for t in tasks:
-        t.classification_name = t.classification.name if t.classification else None
+        t.classification_name = refs.classification_name(t.classification_id)
     return tasks
 
-@app.post("/tasks/")
+@read_route("/tasks/stats", response_model=schemas.TaskStats)
+def read_task_stats(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None, db: Session = Depends(get_db)):
+    """KPI du dashboard sur les tickets créés dans [date_from, date_to[ : une requête GROUP BY, mise en cache par version des données."""
+    return task_stats.get(db, date_from, date_to)
+
+@read_route("/tasks/search", response_model=List[schemas.TaskSearchHit])
+def search_tasks(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    status: Optional[List[str]] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """Recherche plein texte (titre, description, tags), résultats classés et surlignés ; page suivante via X-Next-Cursor."""
+    try:
+        hits, next_cursor = search.search_tasks(db, q, limit=limit, cursor=cursor, status=status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    refs = refdata.get(db)
+    return [
+        dict(schemas.Task.model_validate(task).model_dump(),
+             classification_name=refs.classification_name(task.classification_id),
+             score=score, title_highlight=title_hl, description_highlight=description_hl)
+        for task, score, title_hl, description_hl in hits
+    ]
+
+@app.post("/tasks/", response_model=schemas.Task)
 def create_task(task: schemas.TaskCreate, db: Session = Depends(get_db)):
     db_task = models.Task(**task.model_dump())
-    db.add(db_task)
+
+    # Workflow évalué avant l'insertion : ticket, sous-tâches et AuditLog dans une seule transaction
+    outcome = insert_with_workflow(db_task, db)
+    response = schemas.Task.model_validate(db_task)
+    response.classification_name = refdata.get(db).classification_name(db_task.classification_id)
     db.commit()
-    db.refresh(db_task)
-    
-    # Déclenchement automatique du workflow après création
-    process_workflow(db_task.id, db)
-    
-    return db_task
+    task_stats.invalidate()
+    if outcome.timers:
+        workflow_timers.notify()
+
+    return response
+
+@read_route("/tasks/{task_id}/workflow", response_model=List[schemas.WorkflowJob])
+def read_task_workflow_jobs(task_id: int, db: Session = Depends(get_db)):
+    """Statut des exécutions du moteur pour un ticket (le plus récent en premier)."""
+    return db.query(models.WorkflowJob).filter(models.WorkflowJob.task_id == task_id).order_by(models.WorkflowJob.id.desc()).all()
+
+@app.get("/tasks/{task_id}/traces")
+def read_task_traces(task_id: int, limit: int = Query(200, ge=1, le=1000)):
+    """Dernières traces du moteur pour un ticket (tampon mémoire du processus, les plus récentes en premier)."""
+    return tracing.recent(task_id, limit)
 
 @app.put("/tasks/{task_id}")
 def update_task(
@@ -119,6 +280,8 @@ def update_task(
 
     old_status = db_task.status
     update_data = task_update.model_dump(exclude_unset=True)
+    # Champs réellement modifiés : seuls les workflows qui en dépendent seront réévalués
+    changed_fields = [key for key, value in update_data.items() if getattr(db_task, key) != value]
     
     for key, value in update_data.items():
         setattr(db_task, key, value)
@@ -127,18 +290,22 @@ def update_task(
     if db_task.status == "Terminé" and old_status != "Terminé":
         import datetime
         db_task.closed_at = datetime.datetime.utcnow()
-        children = db.query(models.Task).filter(models.Task.parent_id == task_id).all()
-        for child in children:
-            child.status = "Terminé"
-            child.closed_at = db_task.closed_at
-            # Log de propagation
-            log = models.AuditLog(message=f"[SYSTEME] Clôture auto (Parent #{task_id} terminé) pour l'enfant #{child.id}")
-            db.add(log)
+        # Clôture de tout le sous-arbre (CTE récursive) + logs de propagation
+        close_subtree(db, [task_id], source="SYSTEME", closed_at=db_task.closed_at)
     elif db_task.status != "Terminé" and old_status == "Terminé":
         db_task.closed_at = None
 
+    # --- WORKFLOW INCRÉMENTAL (règles, immédiates ou temporisées, dépendant des champs modifiés) ---
+    queued = False
+    if not skip_workflow and db_task.status != "Terminé" and get_compiled_rules().depends_on(changed_fields):
+        workflow_queue.enqueue(db, task_id, changed_fields)
+        queued = True
+
     db.commit()
+    task_stats.invalidate()
     db.refresh(db_task)
+    if queued:
+        workflow_queue.notify()
 
     return db_task
 
@@ -150,15 +317,57 @@ def delete_task(task_id: int, db: Session = Depends(get_db)):
     
     db.delete(db_task)
     db.commit()
+    task_stats.invalidate()
     return {"message": "Task deleted"}
 
+# -----------------------------------------------------------------------------
+# ROUTES DU MOTEUR DE WORKFLOW
+# -----------------------------------------------------------------------------
+
+@app.post("/workflows/simulate")
+def simulate_workflows(request: schemas.RuleSimulationRequest, db: Session = Depends(get_db)):
+    """Rejoue des règles (actives par défaut) sur les tickets existants, sans rien écrire."""
+    return simulate_rules(db, rules=request.rules, sample_size=request.sample_size, only_open=request.only_open)
+
+@app.post("/workflows/preview", response_model=schemas.RulePreview)
+def preview_workflow_rule(request: schemas.RulePreviewRequest, db: Session = Depends(get_db)):
+    """Impact d'un jeu de déclencheurs : COUNT et échantillon d'IDs calculés en SQL."""
+    return preview_rule_impact(db, {"triggers": request.triggers}, sample_size=request.sample_size)
+
+@app.get("/workflows/rules", response_model=schemas.RuleSet)
+def read_workflow_rules(db: Session = Depends(get_db)):
+    """Règles actives et numéro de version (à renvoyer comme base_version lors de l'enregistrement)."""
+    version, rules = read_rules(db)
+    return {"version": version, "rules": rules}
+
+@app.put("/workflows/rules", response_model=schemas.RuleSet)
+def update_workflow_rules(request: schemas.RuleSetUpdate, db: Session = Depends(get_db)):
+    """Enregistre le jeu de règles complet comme nouvelle version (409 si base_version est périmée)."""
+    try:
+        version = save_rules(db, request.rules, base_version=request.base_version, author=request.author)
+    except RulesVersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"version": version, "rules": request.rules}
+
+@app.get("/workflows/rules/export", response_class=PlainTextResponse)
+def export_workflow_rules(db: Session = Depends(get_db)):
+    """Version active au format workflows.yaml."""
+    version, rules = read_rules(db)
+    return PlainTextResponse(dump_rules(rules), media_type="application/x-yaml; charset=utf-8",
+                             headers={"X-Rules-Version": str(version)})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Compteurs et histogrammes de latence du moteur, au format texte Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # -----------------------------------------------------------------------------
 # ROUTES DE FONDATION (GROUPES)
 # -----------------------------------------------------------------------------
 
-@app.get("/groups/", response_model=List[schemas.SupportGroup])
+@read_route("/groups/", response_model=List[schemas.SupportGroup])
 def read_groups(db: Session = Depends(get_db)):
-    return db.query(models.SupportGroup).options(joinedload(models.SupportGroup.classifications)).order_by(models.SupportGroup.name).all()
+    return refdata.get(db).groups
 
 @app.post("/groups/", response_model=schemas.SupportGroup)
 def create_group(group: schemas.GroupCreate, db: Session = Depends(get_db)):
@@ -179,6 +388,7 @@ def create_group(group: schemas.GroupCreate, db: Session = Depends(get_db)):
     except:
         db.rollback()
         raise HTTPException(status_code=400, detail="Group already exists or invalid data")
+    refdata.invalidate()
     
     db.refresh(db_group)
     return db_group
@@ -202,6 +412,7 @@ def update_group(group_id: int, group_update: schemas.GroupUpdate, db: Session =
         db_group.classifications = classifs
     
     db.commit()
+    refdata.invalidate()
     db.refresh(db_group)
     return db_group
 
@@ -211,21 +422,23 @@ def delete_group(group_id: int, db: Session = Depends(get_db)):
     if db_group:
         db.delete(db_group)
         db.commit()
+        refdata.invalidate()
     return {"message": "Group deleted"}
 
 # -----------------------------------------------------------------------------
 # ROUTES DES CLASSIFICATIONS
 # -----------------------------------------------------------------------------
 
-@app.get("/classifications/")
+@read_route("/classifications/")
 def read_classifications(db: Session = Depends(get_db)):
-    return db.query(models.TaskClassification).all()
+    return refdata.get(db).classifications
 
 @app.post("/classifications/")
 def create_classification(classif: schemas.ClassificationCreate, db: Session = Depends(get_db)):
     db_classif = models.TaskClassification(**classif.model_dump())
     db.add(db_classif)
     db.commit()
+    refdata.invalidate()
     db.refresh(db_classif)
     return db_classif
 
@@ -247,6 +460,7 @@ def update_classification(classif_id: int, classif_update: schemas.Classificatio
         db_classif.name = classif_update.name
     
     db.commit()
+    refdata.invalidate()
     db.refresh(db_classif)
     print(f"[API] Nature ID {classif_id} renommée en {db_classif.name}")
     return db_classif
@@ -267,15 +481,16 @@ def delete_classification(classif_id: int, db: Session = Depends(get_db)):
     
     db.delete(db_classif)
     db.commit()
+    refdata.invalidate()
     return {"message": "Classification deleted"}
 
 # -----------------------------------------------------------------------------
 # ROUTES DES ASSETS (CMDB)
 # -----------------------------------------------------------------------------
 
-@app.get("/assets/", response_model=list[schemas.Asset])
-def read_assets(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(models.Asset).offset(skip).limit(limit).all()
+@read_route("/assets/", response_model=list[schemas.Asset])
+def read_assets(response: Response, cursor: Optional[str] = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(get_db)):
+    return paginated(response, db.query(models.Asset), (models.Asset.id,), cursor, limit, descending=False)
 
 @app.post("/assets/", response_model=schemas.Asset)
 def create_asset(asset: schemas.AssetCreate, db: Session = Depends(get_db)):
@@ -302,7 +517,7 @@ def delete_asset(asset_id: int, db: Session = Depends(get_db)):
 # ROUTES ADMIN & MAINTENANCE (INDISPENSABLES POUR L'ONGLET ADMIN TOOLS)
 # -----------------------------------------------------------------------------
 
-@app.get("/audit/logs")
+@read_route("/audit/logs")
 def get_logs(limit: int = 100, db: Session = Depends(get_db)):
     return db.query(models.AuditLog).order_by(models.AuditLog.id.desc()).limit(limit).all()
 
@@ -340,12 +555,13 @@ def generate_user_code(db: Session):
         
     return f"{new_letter}{new_num:03d}"
 
-@app.get("/users/", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(models.User).options(
+@read_route("/users/", response_model=List[schemas.User])
+def read_users(response: Response, cursor: Optional[str] = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(get_db)):
+    query = db.query(models.User).options(
         joinedload(models.User.groups),
         joinedload(models.User.location)
-    ).offset(skip).limit(limit).all()
+    )
+    return paginated(response, query, (models.User.id,), cursor, limit, descending=False)
 
 @app.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -363,7 +579,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return db_user
 
-@app.get("/users/{user_id}", response_model=schemas.User)
+@read_route("/users/{user_id}", response_model=schemas.User)
 def read_user(user_id: int, db: Session = Depends(get_db)):
     db_user = db.query(models.User).options(
         joinedload(models.User.groups),
@@ -407,7 +623,6 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
 @app.get("/backup")
 def get_backup():
     import os
-    from fastapi.responses import FileResponse
     if os.path.exists("workflow.db"):
         return FileResponse("workflow.db", filename="liteflow_backup.db")
     raise HTTPException(status_code=404)
@@ -416,9 +631,10 @@ def get_backup():
 # ROUTES DES LOCALISATIONS
 # -----------------------------------------------------------------------------
 
-@app.get("/locations/", response_model=List[schemas.Location])
-def read_locations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(models.Location).options(joinedload(models.Location.users)).offset(skip).limit(limit).all()
+@read_route("/locations/", response_model=List[schemas.Location])
+def read_locations(response: Response, cursor: Optional[str] = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(get_db)):
+    query = db.query(models.Location).options(joinedload(models.Location.users))
+    return paginated(response, query, (models.Location.id,), cursor, limit, descending=False)
 
 @app.post("/locations/", response_model=schemas.Location)
 def create_location(location: schemas.LocationCreate, db: Session = Depends(get_db)):
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Métriques du moteur de workflow (format texte Prometheus, exposé sur GET /metrics).
+
+Agrégation sans verrou : chaque thread écrit dans son propre fragment (dictionnaires
+privés), l'export additionne les fragments au moment de la lecture. Le chemin chaud
+(évaluation d'une règle) ne prend donc aucun verrou et ne partage aucune écriture
+entre workers.
+"""
+import threading
+from bisect import bisect_left
+
+# Bornes (secondes) des histogrammes de latence : une condition se mesure en µs
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Nom -> (type, aide, noms des labels)
+METRICS = {
+    "liteflow_rule_evaluations_total": ("counter", "Nombre d'évaluations de chaque règle candidate.", ("rule",)),
+    "liteflow_rule_matches_total": ("counter", "Nombre de déclenchements de chaque règle (toutes conditions remplies).", ("rule",)),
+    "liteflow_rule_actions_total": ("counter", "Nombre d'actions exécutées par règle et par type d'action.", ("rule", "action")),
+    "liteflow_engine_errors_total": ("counter", "Erreurs du moteur par étape (commit, lot, file, minuteur).", ("stage",)),
+    "liteflow_engine_halts_total": ("counter", "Évaluations interrompues par motif (cycle, passes, actions, sous-tâches).", ("reason",)),
+    "liteflow_auth_tokens_total": ("counter", "Vérifications de jetons : cache (hit, miss), appels distants (remote), refus (rejected).", ("result",)),
+    "liteflow_rule_duration_seconds": ("histogram", "Durée d'évaluation d'une règle (conditions et actions).", ("rule",)),
+    "liteflow_condition_duration_seconds": ("histogram", "Durée d'évaluation d'une condition de règle.", ("rule", "condition")),
+    "liteflow_workflow_duration_seconds": ("histogram", "Durée d'évaluation de toutes les règles pour une tâche.", ()),
+}
+
+_local = threading.local()
+_shards = []
+
+class _Shard:
+    """Compteurs et histogrammes d'un seul thread."""
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}      # (nom, labels) -> valeur
+        self.histograms = {}    # (nom, labels) -> [compte par borne..., +Inf, somme]
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        _shards.append(shard)   # list.append est atomique (GIL)
+    return shard
+
+def inc(name, labels=(), value=1):
+    counters = _shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+def observe(name, seconds, labels=()):
+    histograms = _shard().histograms
+    key = (name, labels)
+    cells = histograms.get(key)
+    if cells is None:
+        cells = histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+    cells[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    cells[-1] += seconds
+
+def reset():
+    """Remet toutes les métriques à zéro (tests)."""
+    for shard in list(_shards):
+        shard.counters.clear()
+        shard.histograms.clear()
+
+def snapshot():
+    """Agrège les fragments de tous les threads : ({clé: valeur}, {clé: cellules})."""
+    counters, histograms = {}, {}
+    for shard in list(_shards):
+        for key, val in list(shard.counters.items()):
+            counters[key] = counters.get(key, 0) + val
+        for key, cells in list(shard.histograms.items()):
+            total = histograms.setdefault(key, [0] * len(cells))
+            for i, v in enumerate(list(cells)):
+                total[i] += v
+    return counters, histograms
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+INF_LABEL = 'le="+Inf"'
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+def render():
+    """Export au format texte Prometheus (version 0.0.4)."""
+    counters, histograms = snapshot()
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), val in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {val}")
+            continue
+        for (metric, labels), cells in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, cells):
+                cumulative += count
+                le = f'le="{_format_bound(bound)}"'
+                lines.append(f"{name}_bucket{_format_labels(label_names, labels, le)} {cumulative}")
+            cumulative += cells[len(LATENCY_BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(label_names, labels, INF_LABEL)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_names, labels)} {cells[-1]}")
+            lines.append(f"{name}_count{_format_labels(label_names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
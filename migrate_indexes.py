@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Migration des index de pagination / filtres (base existante : create_all ne modifie
+pas les tables déjà créées).
+
+    - crée les index déclarés dans models.py absents de la base (tickets : (created_at, id),
+      (status | assigned_to | classification_id, created_at, id), priority, parent_id)
+    - renseigne created_at des tickets anciens qui n'en ont pas : la pagination par curseur
+      trie sur (created_at, id) et une date NULL ne peut pas y figurer
+
+Usage :
+    python migrate_indexes.py
+"""
+import datetime
+from sqlalchemy import inspect, update
+from database import engine
+import models
+
+# Date affectée aux tickets sans date de création (placés en fin de liste)
+LEGACY_CREATED_AT = datetime.datetime(1970, 1, 1)
+
+def migrate():
+    print(f"Migrating database: {engine.url.render_as_string(hide_password=True)}")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        filled = conn.execute(
+            update(models.Task).where(models.Task.created_at.is_(None)).values(created_at=LEGACY_CREATED_AT)
+        ).rowcount
+        print(f"{filled} ticket(s) sans date de création mis à jour.")
+
+        inspector = inspect(conn)
+        for table in models.Base.metadata.sorted_tables:
+            existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                index.create(bind=conn)
+                print(f"Index '{index.name}' créé sur '{table.name}'.")
+    print("Migration finished.")
+
+if __name__ == "__main__":
+    migrate()
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Table
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Table, Index
 from sqlalchemy.orm import relationship, backref
 from database import Base
 import datetime
@@ -70,6 +70,15 @@ class Task(Base):
     children = relationship("Task", cascade="all, delete-orphan", backref=backref('parent', remote_side=[id]))
     asset = relationship("Asset", backref="tasks")
     classification = relationship("TaskClassification", backref="tasks")
+    # Pagination par curseur (created_at, id), seule ou après un filtre (voir pagination.py)
+    __table_args__ = (
+        Index("ix_tasks_created_at_id", "created_at", "id"),
+        Index("ix_tasks_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_tasks_assigned_to_created_at_id", "assigned_to", "created_at", "id"),
+        Index("ix_tasks_classification_created_at_id", "classification_id", "created_at", "id"),
+        Index("ix_tasks_priority", "priority"),
+        Index("ix_tasks_parent_id", "parent_id"),
+    )
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
@@ -83,4 +92,44 @@ class Location(Base):
     name = Column(String, unique=True, index=True) # Site or building name
     address = Column(String)
     zip_code = Column(String)
-    city = Column(String)
\ No newline at end of file
+    city = Column(String)
+
+
+class WorkflowJob(Base):
+    __tablename__ = "workflow_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), index=True, nullable=False)
+    status = Column(String, default="En attente", index=True) # En attente, En cours, Terminé, Échec
+    changed_fields = Column(String, nullable=True) # Champs modifiés (séparés par des virgules), NULL = évaluation complète
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    run_after = Column(DateTime, default=get_utc_now)
+    created_at = Column(DateTime, default=get_utc_now)
+    finished_at = Column(DateTime, nullable=True)
+
+class WorkflowTimer(Base):
+    """Règle temporisée armée pour une tâche (déclenchement à due_at si ses conditions tiennent toujours)."""
+    __tablename__ = "workflow_timers"
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False)
+    rule_name = Column(String, nullable=False)
+    due_at = Column(DateTime, nullable=False)
+    status = Column(String, default="En attente") # En attente, Déclenché, Échec
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=get_utc_now)
+    fired_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_workflow_timers_status_due_at", "status", "due_at"),
+        Index("ix_workflow_timers_task_rule", "task_id", "rule_name"),
+    )
+
+class WorkflowRuleVersion(Base):
+    """Version du jeu de règles de workflow (contenu YAML complet) ; la version la plus haute est active."""
+    __tablename__ = "workflow_rules"
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    content = Column(Text, nullable=False)
+    digest = Column(String, nullable=False)
+    author = Column(String, nullable=True)
+    created_at = Column(DateTime, default=get_utc_now)
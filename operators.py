@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Bibliothèque des opérateurs de déclencheurs, partagée par le moteur (engine.py)
+et par la liste d'opérateurs du Flow Designer.
+
+Chaque déclencheur est compilé une seule fois en une fermeture `test(values) -> bool` :
+valeur de la règle mise en minuscules, liste convertie en frozenset, regex compilée,
+nombre / date / durée analysés. L'évaluation ne fait ensuite qu'un appel de fonction.
+`values` est un engine.TaskValues : get(champ) -> (valeur, valeur_minuscule),
+raw(champ) -> valeur brute (nombres, dates).
+"""
+import re
+import datetime
+
+# Types de champs
+TEXT, NUMBER, DATE, CHOICE = "text", "number", "date", "choice"
+
+# Type des champs techniques (par défaut : texte)
+FIELD_TYPES = {
+    'status': CHOICE,
+    'priority': CHOICE,
+    'assigned_to': CHOICE,
+    'id': NUMBER,
+    'created_at': DATE,
+}
+
+def field_type(field_key):
+    return FIELD_TYPES.get(field_key, TEXT)
+
+# Durées (délais des règles temporisées, 'Plus ancien que') : entier = minutes,
+# ou chaîne suffixée "45s", "30m", "2h", "1j"
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'j': 86400, 'd': 86400}
+
+def parse_duration(value):
+    """Durée en secondes (0 si absente ou invalide)."""
+    if value is None or isinstance(value, bool):
+        return 0
+    if isinstance(value, (int, float)):
+        return max(int(value * 60), 0)
+    text = str(value).strip().lower()
+    if not text:
+        return 0
+    unit = DURATION_UNITS.get(text[-1])
+    number = text[:-1] if unit else text
+    try:
+        return max(int(float(number.strip()) * (unit or 60)), 0)
+    except ValueError:
+        print(f"[ENGINE] Durée invalide ignorée : {value!r}")
+        return 0
+
+def to_naive_utc(value):
+    """Les DateTime sans fuseau sont relus naïfs (UTC) : toutes les dates sont comparées ainsi."""
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+def parse_date(value):
+    """Date d'une règle ('2026-01-31', '2026-01-31 08:00', datetime) en UTC naïf, sinon None."""
+    if isinstance(value, datetime.datetime):
+        return to_naive_utc(value)
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    try:
+        return to_naive_utc(datetime.datetime.fromisoformat(str(value).strip()))
+    except ValueError:
+        return None
+
+def _as_number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return to_naive_utc(value)
+    return parse_date(value) if value else None
+
+class Operator:
+    """
+    Opérateur de déclencheur. `kind` désigne la comparaison, `negated` l'inverse
+    (N'est pas, Ne contient pas), `types` les types de champs proposés dans le designer,
+    `cost` la classe de coût a priori utilisée par l'ordonnancement des conditions.
+    """
+    __slots__ = ('name', 'kind', 'negated', 'types', 'aliases', 'cost')
+
+    def __init__(self, name, kind, types, aliases=(), negated=False, cost="equality"):
+        self.name = name
+        self.kind = kind
+        self.negated = negated
+        self.types = types
+        self.aliases = aliases
+        self.cost = cost
+
+    @property
+    def substring(self):
+        return self.kind in ("contains", "starts_with")
+
+OPERATORS = [
+    Operator("Est égal à", "equals", (TEXT, NUMBER, CHOICE), aliases=("equals",)),
+    Operator("N'est pas", "equals", (TEXT, NUMBER, CHOICE), aliases=("not_equals",), negated=True),
+    Operator("Est parmi", "equals", (CHOICE,), aliases=("in",)),
+    Operator("Contient", "contains", (TEXT,), aliases=("contains",), cost="substring"),
+    Operator("Ne contient pas", "contains", (TEXT,), aliases=("not_contains",), negated=True, cost="substring"),
+    Operator("Commence par", "starts_with", (TEXT,), aliases=("starts_with",), cost="substring"),
+    Operator("Correspond à (regex)", "regex", (TEXT,), aliases=("regex", "matches"), cost="regex"),
+    Operator("Supérieur à", "gt", (NUMBER,), aliases=("gt",), cost="typed"),
+    Operator("Inférieur à", "lt", (NUMBER,), aliases=("lt",), cost="typed"),
+    Operator("Après le", "gt", (DATE,), aliases=("after",), cost="typed"),
+    Operator("Avant le", "lt", (DATE,), aliases=("before",), cost="typed"),
+    Operator("Plus ancien que", "older_than", (DATE,), aliases=("older_than",), cost="typed"),
+    Operator("Plus récent que", "newer_than", (DATE,), aliases=("newer_than",), cost="typed"),
+]
+
+REGISTRY = {}
+for _op in OPERATORS:
+    REGISTRY[_op.name] = _op
+    for _alias in _op.aliases:
+        REGISTRY[_alias] = _op
+
+def get(name):
+    """Opérateur par nom ou alias YAML, None si inconnu."""
+    return REGISTRY.get(name)
+
+def names_for(kind):
+    """Noms des opérateurs proposés pour un type de champ (ordre du registre)."""
+    return [op.name for op in OPERATORS if kind in op.types]
+
+def closest_for(operator, kind):
+    """
+    Opérateur proposé pour ce type de champ qui conserve le sens de `operator` : lui-même s'il est
+    proposé, sinon l'égalité de même sens (un opérateur non proposé ne doit pas inverser la règle).
+    """
+    names = names_for(kind)
+    op = get(operator)
+    if op is None:
+        return names[0]
+    if op.name in names:
+        return op.name
+    for candidate in OPERATORS:
+        if kind in candidate.types and candidate.kind in (op.kind, "equals") and candidate.negated == op.negated:
+            return candidate.name
+    return names[0]
+
+# --- COMPILATION ---
+
+def _never(values):
+    return False
+
+def validate(field_key, operator, value):
+    """Message d'erreur si le déclencheur ne peut pas être compilé, sinon None."""
+    op = get(operator)
+    if op is None:
+        return f"Opérateur '{operator}' inconnu"
+    if isinstance(value, list):
+        # Une liste vaut appartenance ('Est parmi'), quel que soit l'opérateur (cf. list_notice)
+        return None
+    if op.kind == "regex":
+        try:
+            re.compile(str(value))
+        except re.error as e:
+            return f"Expression régulière invalide : {e}"
+    elif op.kind in ("gt", "lt"):
+        if field_type(field_key) == DATE:
+            if parse_date(value) is None:
+                return f"Date invalide : '{value}' (format AAAA-MM-JJ)"
+        elif _as_number(value) is None:
+            return f"Nombre invalide : '{value}'"
+    elif op.kind == "equals" and field_type(field_key) == NUMBER and _as_number(value) is None:
+        return f"Nombre invalide : '{value}'"
+    elif op.kind in ("older_than", "newer_than") and not parse_duration(value):
+        return f"Durée invalide : '{value}' (ex : 30m, 2h, 3j)"
+    return None
+
+def list_notice(operator, value):
+    """Avertissement si une liste est associée à un opérateur autre qu'une égalité (évaluée comme 'Est parmi')."""
+    op = get(operator)
+    if op is None or not isinstance(value, list) or op.kind == "equals":
+        return None
+    meaning = "N'est pas" if op.negated else "Est parmi"
+    return f"Liste de valeurs avec '{operator}' : évaluée comme '{meaning}'"
+
+def compile_test(field_key, operator, value):
+    """Fermeture `test(values) -> bool` du déclencheur ; un déclencheur invalide n'est jamais rempli."""
+    op = get(operator)
+    if op is None or validate(field_key, operator, value):
+        return _never
+    test = _compile(op, field_key, value)
+    if op.negated:
+        inner = test
+        def test(values):
+            return not inner(values)
+    return test
+
+def compile_scan(operator, field_key, matcher, pattern_id):
+    """Variante 'Contient' / 'Commence par' évaluée par l'automate partagé du champ (un parcours par texte)."""
+    op = get(operator)
+    index = 1 if op.kind == "starts_with" else 0
+    negated = op.negated
+    def test(values):
+        return (pattern_id in values.scan(field_key, matcher)[index]) is not negated
+    return test
+
+def _compile(op, field, value):
+    kind = op.kind
+    if isinstance(value, list):
+        choices = frozenset(str(v).lower() for v in value)
+        def test(values):
+            return values.get(field)[1] in choices
+        return test
+
+    if kind in ("gt", "lt"):
+        if field_type(field) == DATE:
+            bound, convert = parse_date(value), _as_date
+        else:
+            bound, convert = _as_number(value), _as_number
+        greater = kind == "gt"
+        def test(values):
+            val = convert(values.raw(field))
+            if val is None:
+                return False
+            return val > bound if greater else val < bound
+        return test
+
+    if kind in ("older_than", "newer_than"):
+        age = datetime.timedelta(seconds=parse_duration(value))
+        older = kind == "older_than"
+        def test(values):
+            val = _as_date(values.raw(field))
+            if val is None:
+                return False
+            threshold = to_naive_utc(datetime.datetime.now(datetime.timezone.utc)) - age
+            return val < threshold if older else val >= threshold
+        return test
+
+    if kind == "regex":
+        pattern = re.compile(str(value), re.IGNORECASE)
+        def test(values):
+            return pattern.search(values.get(field)[1]) is not None
+        return test
+
+    needle = str(value).lower()
+    if kind == "contains":
+        def test(values):
+            return needle in values.get(field)[1]
+    elif kind == "starts_with":
+        def test(values):
+            return values.get(field)[1].startswith(needle)
+    elif field_type(field) == NUMBER:
+        number = _as_number(value)
+        def test(values):
+            return _as_number(values.raw(field)) == number
+    else:
+        def test(values):
+            return values.get(field)[1] == needle
+    return test
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Pagination par curseur (keyset) des routes de liste.
+
+Le curseur est opaque pour le client (JSON en base64 url-safe) : il porte la clé de tri
+de la dernière ligne renvoyée. La page suivante est lue par
+    WHERE (created_at, id) < (:c, :i) ORDER BY created_at DESC, id DESC LIMIT n
+servie par un index (created_at, id) quelle que soit la profondeur, sans saut ni
+doublon lorsque des lignes sont insérées entre deux pages (contrairement à OFFSET).
+"""
+import json
+import base64
+import binascii
+import datetime
+from sqlalchemy import DateTime, tuple_
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+def encode_cursor(values):
+    payload = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def cursor_values(cursor, count):
+    """Liste brute des `count` valeurs portées par `cursor` ; ValueError si le curseur est invalide."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise ValueError("Curseur invalide")
+    if not isinstance(values, list) or len(values) != count or None in values:
+        raise ValueError("Curseur invalide")
+    return values
+
+def decode_cursor(cursor, columns):
+    """Valeurs de la clé de tri portées par `cursor` ; ValueError si le curseur est invalide."""
+    values = cursor_values(cursor, len(columns))
+    decoded = []
+    for column, value in zip(columns, values):
+        if isinstance(column.type, DateTime):
+            value = datetime.datetime.fromisoformat(str(value))
+        elif not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError("Curseur invalide")
+        decoded.append(value)
+    return decoded
+
+def paginate(query, columns, cursor=None, limit=DEFAULT_LIMIT, descending=True):
+    """
+    Page de `query` triée sur `columns` (la dernière colonne doit être unique, ex : id).
+    Retourne (lignes, curseur de la page suivante ou None).
+    """
+    key = tuple_(*columns)
+    if cursor:
+        bound = tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(key < bound if descending else key > bound)
+    order = [c.desc() for c in columns] if descending else list(columns)
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], c.key) for c in columns])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Cache en mémoire des données de référence (natures / classifications et groupes de support),
+partagé par le moteur de workflow et les routes de main.py.
+
+Le cache est versionné : chaque route d'écriture (groupes, natures) appelle invalidate(),
+qui incrémente la version ; la lecture suivante recharge les deux tables (2 requêtes).
+Un TTL (REFDATA_TTL) borne la péremption lorsque plusieurs processus partagent la base.
+"""
+import os
+import time
+import threading
+from sqlalchemy.orm import Session, selectinload
+from models import TaskClassification, SupportGroup
+
+TTL = float(os.environ.get("REFDATA_TTL", "60"))
+# Nature affectée par défaut aux sous-tâches sans nature
+DEFAULT_CLASSIFICATION = "Demandes"
+
+class RefData:
+    """Instantané immuable des données de référence."""
+    __slots__ = ('version', 'loaded_at', 'classifications', 'groups', '_classif_ids', '_classif_names', '_groups')
+
+    def __init__(self, version, classifications, groups):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.classifications = classifications      # [{"id", "name"}] triées par id
+        self.groups = groups                        # [{"id", "name", "classifications"}] triés par nom
+        self._classif_ids = {c["name"].strip().lower(): c["id"] for c in classifications}
+        self._classif_names = {c["id"]: c["name"] for c in classifications}
+        self._groups = {g["name"].strip().lower(): g for g in groups}
+
+    def classification_id(self, name):
+        """ID d'une nature à partir de son nom (insensible à la casse), None si inconnue."""
+        if name is None:
+            return None
+        return self._classif_ids.get(str(name).strip().lower())
+
+    def classification_name(self, classification_id):
+        return self._classif_names.get(classification_id)
+
+    def group(self, name):
+        """Groupe de support ({"id", "name", "classifications"}) par nom, None si inconnu."""
+        if name is None:
+            return None
+        return self._groups.get(str(name).strip().lower())
+
+_lock = threading.Lock()
+_state = {"version": 0, "snapshot": None}
+STATS = {"loads": 0, "invalidations": 0}
+
+def invalidate():
+    """À appeler après toute écriture sur les natures ou les groupes."""
+    with _lock:
+        _state["version"] += 1
+        STATS["invalidations"] += 1
+
+def _load(db: Session, version):
+    classifications = [
+        {"id": c.id, "name": c.name}
+        for c in db.query(TaskClassification).order_by(TaskClassification.id).all()
+    ]
+    groups = [
+        {"id": g.id, "name": g.name, "classifications": [{"id": c.id, "name": c.name} for c in g.classifications]}
+        for g in db.query(SupportGroup).options(selectinload(SupportGroup.classifications)).order_by(SupportGroup.name).all()
+    ]
+    return RefData(version, classifications, groups)
+
+def get(db: Session):
+    """Instantané courant, rechargé si la version a changé ou si le TTL est dépassé."""
+    snapshot = _state["snapshot"]
+    version = _state["version"]
+    if snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.loaded_at < TTL:
+        return snapshot
+    # Chargement hors verrou : dans une route asynchrone (AsyncSession.run_sync), la coroutine
+    # est suspendue pendant les requêtes et un verrou tenu bloquerait la boucle d'événements
+    snapshot = _load(db, version)
+    with _lock:
+        current = _state["snapshot"]
+        if current is None or current.version <= version:
+            _state["snapshot"] = snapshot
+        STATS["loads"] += 1
+    print(f"[REFDATA] Cache rechargé (version {version}) : {len(snapshot.classifications)} nature(s), {len(snapshot.groups)} groupe(s)")
+    return snapshot
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
-from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, List, Dict
 from datetime import datetime
 
 class AssetBase(BaseModel):
@@ -41,6 +41,11 @@ class Task(TaskBase):
     classification_name: Optional[str] = None
     model_config = ConfigDict(from_attributes=True)
 
+class TaskSearchHit(Task):
+    score: float
+    title_highlight: Optional[str] = None
+    description_highlight: Optional[str] = None
+
 class ClassificationCreate(BaseModel):
     name: str
 
@@ -116,3 +121,45 @@ class Location(LocationBase):
     id: int
     users: List[UserNested] = []
     model_config = ConfigDict(from_attributes=True)
+
+class WorkflowJob(BaseModel):
+    id: int
+    task_id: int
+    status: str
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    model_config = ConfigDict(from_attributes=True)
+
+class RuleSimulationRequest(BaseModel):
+    rules: Optional[List[dict]] = None
+    sample_size: int = Field(5, ge=0, le=100)
+    only_open: bool = False
+
+class RulePreviewRequest(BaseModel):
+    triggers: List[dict]
+    sample_size: int = Field(10, ge=0, le=100)
+
+class RulePreview(BaseModel):
+    count: int
+    sample_ids: List[int]
+
+class RuleSet(BaseModel):
+    version: int
+    rules: List[dict]
+
+class RuleSetUpdate(BaseModel):
+    rules: List[dict]
+    base_version: Optional[int] = None
+    author: Optional[str] = None
+
+class TaskStats(BaseModel):
+    total: int
+    closed: int
+    open: int
+    by_status: Dict[str, int]
+    by_priority: Dict[str, int]
+    by_classification: Dict[str, int]
+    by_assigned_to: Dict[str, int]
+    version: int
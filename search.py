@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Recherche plein texte des tickets (titre, description, tags) pour GET /tasks/search.
+
+L'index est maintenu par la base elle-même, quel que soit le chemin d'écriture
+(routes de main.py, moteur, close_subtree, backfill) :
+    - PostgreSQL : colonne générée `search_vector` (tsvector pondéré titre > tags > description)
+      indexée en GIN, plus des index trigrammes (pg_trgm) sur le titre et la description
+      pour les recherches partielles (ILIKE '%...%')
+    - SQLite : table FTS5 `tasks_fts` à contenu externe, synchronisée par triggers
+    - autre base, ou extension indisponible : repli sur LIKE (sans index)
+
+Les résultats sont classés par pertinence (score croissant = meilleur), surlignés
+(<mark>...</mark>) et paginés par curseur sur (score, id).
+"""
+import os
+import re
+from sqlalchemy import text, bindparam
+from models import Task
+import pagination
+
+# Configuration linguistique PostgreSQL (racinisation, mots vides)
+LANGUAGE = os.environ.get("SEARCH_LANGUAGE", "french")
+MARK_START, MARK_STOP = "<mark>", "</mark>"
+
+_state = {"mode": None}
+
+# --- INDEX ---
+
+_PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{LANGUAGE}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{LANGUAGE}', coalesce(tags, '')), 'B') ||
+        setweight(to_tsvector('{LANGUAGE}', coalesce(description, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_title_trgm ON tasks USING GIN (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_description_trgm ON tasks USING GIN (description gin_trgm_ops)",
+]
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE tasks_fts USING fts5(
+        title, description, tags, content='tasks', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description, tags) VALUES (new.id, new.title, new.description, new.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description, tags) VALUES ('delete', old.id, old.title, old.description, old.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description, tags ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description, tags) VALUES ('delete', old.id, old.title, old.description, old.tags);
+        INSERT INTO tasks_fts(rowid, title, description, tags) VALUES (new.id, new.title, new.description, new.tags);
+    END""",
+    # Indexation des tickets existants
+    "INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')",
+]
+
+def ensure_index(bind):
+    """Crée l'index de recherche propre au dialecte (idempotent). Retourne le mode retenu."""
+    dialect = bind.dialect.name
+    mode = "like"
+    try:
+        with bind.begin() as conn:
+            if dialect == "postgresql":
+                for ddl in _PG_DDL:
+                    conn.execute(text(ddl))
+                mode = "postgresql"
+            elif dialect == "sqlite":
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'")).first()
+                if not exists:
+                    for ddl in _SQLITE_DDL:
+                        conn.execute(text(ddl))
+                mode = "sqlite"
+    except Exception as e:
+        print(f"[SEARCH] Index plein texte indisponible ({dialect}), repli sur LIKE : {e}")
+        mode = "like"
+    _state["mode"] = mode
+    print(f"[SEARCH] Recherche plein texte : {mode}")
+    return mode
+
+# --- REQUÊTES ---
+
+def _like_pattern(query):
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def _fts5_query(query):
+    """Requête FTS5 sûre : chaque mot devient un préfixe entre guillemets (ET implicite)."""
+    words = re.findall(r"\w+", query, flags=re.UNICODE)
+    return " ".join(f'"{w}"*' for w in words)
+
+def _after_clause(cursor):
+    if cursor is None:
+        return "1 = 1", {}
+    score, task_id = pagination.cursor_values(cursor, 2)
+    if not isinstance(score, (int, float)) or not isinstance(task_id, int):
+        raise ValueError("Curseur invalide")
+    return "(score > :after_score OR (score = :after_score AND id > :after_id))", {"after_score": float(score), "after_id": task_id}
+
+def _status_clause(status, column):
+    return (f"{column} IN :status", {"status": list(status)}) if status else ("1 = 1", {})
+
+def _sqlite_sql(after, status_filter):
+    return f"""
+        SELECT id, score, title_hl, description_hl FROM (
+            SELECT t.id AS id, bm25(tasks_fts, 10.0, 1.0, 5.0) AS score,
+                   highlight(tasks_fts, 0, :mark_start, :mark_stop) AS title_hl,
+                   snippet(tasks_fts, 1, :mark_start, :mark_stop, '…', 16) AS description_hl
+            FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH :match AND {status_filter}
+        ) hits
+        WHERE {after}
+        ORDER BY score, id
+        LIMIT :limit
+    """
+
+def _postgresql_sql(after, status_filter):
+    return f"""
+        WITH q AS (SELECT websearch_to_tsquery('{LANGUAGE}', :query) AS query),
+        hits AS (
+            SELECT t.id AS id,
+                   -(ts_rank_cd(t.search_vector, q.query) + similarity(coalesce(t.title, ''), :query)) AS score
+            FROM tasks t, q
+            WHERE (t.search_vector @@ q.query OR t.title ILIKE :like OR t.description ILIKE :like) AND {status_filter}
+        ),
+        page AS (SELECT id, score FROM hits WHERE {after} ORDER BY score, id LIMIT :limit)
+        SELECT page.id, page.score,
+               ts_headline('{LANGUAGE}', coalesce(t.title, ''), q.query, :title_options) AS title_hl,
+               ts_headline('{LANGUAGE}', coalesce(t.description, ''), q.query, :description_options) AS description_hl
+        FROM page JOIN tasks t ON t.id = page.id, q
+        ORDER BY page.score, page.id
+    """
+
+def _like_sql(after, status_filter):
+    return f"""
+        SELECT id, score, NULL AS title_hl, NULL AS description_hl FROM (
+            SELECT t.id AS id, 0.0 AS score FROM tasks t
+            WHERE (t.title LIKE :like ESCAPE '\\' OR t.description LIKE :like ESCAPE '\\' OR t.tags LIKE :like ESCAPE '\\')
+              AND {status_filter}
+        ) hits
+        WHERE {after}
+        ORDER BY score, id
+        LIMIT :limit
+    """
+
+def search_tasks(db, query, limit=pagination.DEFAULT_LIMIT, cursor=None, status=None):
+    """
+    Tickets correspondant à `query`, du plus pertinent au moins pertinent.
+    Retourne ([(Task, score, titre surligné, extrait de description surligné)], curseur suivant ou None).
+    ValueError si le curseur est invalide.
+    """
+    query = (query or "").strip()
+    after, params = _after_clause(cursor)
+    mode = _state["mode"] or ensure_index(db.get_bind())
+    if mode == "sqlite":
+        match = _fts5_query(query)
+        if not match:
+            return [], None
+        status_filter, status_params = _status_clause(status, "t.status")
+        sql = _sqlite_sql(after, status_filter)
+        params.update(match=match, mark_start=MARK_START, mark_stop=MARK_STOP)
+    elif mode == "postgresql":
+        if not query:
+            return [], None
+        status_filter, status_params = _status_clause(status, "t.status")
+        sql = _postgresql_sql(after, status_filter)
+        params.update(query=query, like=_like_pattern(query),
+                      title_options=f"StartSel={MARK_START}, StopSel={MARK_STOP}, HighlightAll=true",
+                      description_options=f"StartSel={MARK_START}, StopSel={MARK_STOP}, MaxFragments=2")
+    else:
+        if not query:
+            return [], None
+        status_filter, status_params = _status_clause(status, "t.status")
+        sql = _like_sql(after, status_filter)
+        params.update(like=_like_pattern(query))
+    params.update(status_params, limit=limit + 1)
+
+    statement = text(sql)
+    if status_params:
+        statement = statement.bindparams(bindparam("status", expanding=True))
+    rows = db.execute(statement, params).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pagination.encode_cursor([float(rows[-1].score), rows[-1].id])
+    tasks = {t.id: t for t in db.query(Task).filter(Task.id.in_([r.id for r in rows])).all()}
+    hits = [(tasks[r.id], float(r.score), r.title_hl, r.description_hl) for r in rows if r.id in tasks]
+    return hits, next_cursor
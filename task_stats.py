@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Indicateurs des tickets (KPI du dashboard) pour GET /tasks/stats.
+
+Une seule requête GROUP BY (statut, priorité, nature, groupe) sur la table `tasks` ;
+les répartitions par dimension sont sommées en mémoire (quelques dizaines de lignes).
+Le résultat est mis en cache par (version des données, période) : chaque écriture sur
+les tickets (routes de main.py, file du moteur, minuteurs) appelle invalidate(), qui
+incrémente la version. Un TTL court (TASK_STATS_TTL) borne la péremption lorsque
+plusieurs processus écrivent dans la base.
+"""
+import os
+import time
+import threading
+from collections import Counter
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import Task
+from operators import to_naive_utc
+import refdata
+
+TTL = float(os.environ.get("TASK_STATS_TTL", "10"))
+# Périodes distinctes gardées en cache pour une même version
+MAX_ENTRIES = 128
+CLOSED_STATUS = "Terminé"
+
+_lock = threading.Lock()
+_state = {"version": 0, "entries": {}}
+STATS = {"queries": 0, "hits": 0, "invalidations": 0}
+
+def invalidate():
+    """À appeler après toute écriture sur les tickets."""
+    with _lock:
+        _state["version"] += 1
+        _state["entries"] = {}
+        STATS["invalidations"] += 1
+
+def _normalize_status(value):
+    return "À faire" if value == "A faire" else value
+
+def _compute(db: Session, date_from, date_to):
+    query = db.query(Task.status, Task.priority, Task.classification_id, Task.assigned_to, func.count(Task.id))
+    if date_from is not None:
+        query = query.filter(Task.created_at >= date_from)
+    if date_to is not None:
+        query = query.filter(Task.created_at < date_to)
+    rows = query.group_by(Task.status, Task.priority, Task.classification_id, Task.assigned_to).all()
+
+    refs = refdata.get(db)
+    by_status, by_priority, by_classification, by_assigned = Counter(), Counter(), Counter(), Counter()
+    for status, priority, classification_id, assigned_to, count in rows:
+        by_status[_normalize_status(status) or "Nouveau"] += count
+        by_priority[priority or "Moyenne"] += count
+        by_classification[refs.classification_name(classification_id) or f"#{classification_id}"] += count
+        by_assigned[assigned_to or "Non assigné"] += count
+    total = sum(by_status.values())
+    closed = by_status.get(CLOSED_STATUS, 0)
+    return {
+        "total": total,
+        "closed": closed,
+        "open": total - closed,
+        "by_status": dict(by_status),
+        "by_priority": dict(by_priority),
+        "by_classification": dict(by_classification),
+        "by_assigned_to": dict(by_assigned),
+    }
+
+def get(db: Session, date_from=None, date_to=None):
+    """Indicateurs sur les tickets créés dans [date_from, date_to[ (bornes optionnelles)."""
+    date_from = to_naive_utc(date_from) if date_from is not None else None
+    date_to = to_naive_utc(date_to) if date_to is not None else None
+    key = (date_from, date_to)
+    version = _state["version"]
+    entry = _state["entries"].get(key)
+    if entry is not None and entry[0] == version and time.monotonic() - entry[1] < TTL:
+        STATS["hits"] += 1
+        return entry[2]
+
+    result = dict(_compute(db, date_from, date_to), version=version)
+    STATS["queries"] += 1
+    with _lock:
+        if _state["version"] == version:
+            if len(_state["entries"]) >= MAX_ENTRIES:
+                _state["entries"] = {}
+            _state["entries"][key] = (version, time.monotonic(), result)
+    return result
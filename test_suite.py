@@ -34,6 +34,92 @@ def test_api_classifications():
         response = client.get("/classifications/", headers={"Authorization": "Bearer fake_token"})
         assert response.status_code == 200
 
+def test_api_jwt_verified_locally_with_token_cache(monkeypatch):
+    """JWT signé par une paire de clés locale : vérifié sans appel GoTrue, puis servi par le cache."""
+    import time
+    import jwt
+    import auth
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    monkeypatch.setitem(auth._config, "keys", {"k1": private_key.public_key()})
+    auth.clear_cache()
+    claims = {"sub": "user-1", "aud": "authenticated", "role": "authenticated", "exp": int(time.time()) + 600}
+    token = jwt.encode(claims, private_key, algorithm="ES256", headers={"kid": "k1"})
+    expired = jwt.encode(dict(claims, exp=int(time.time()) - 3600), private_key, algorithm="ES256", headers={"kid": "k1"})
+
+    hits, misses = auth.STATS["hits"], auth.STATS["misses"]
+    with patch("main.auth_client") as mock_auth:
+        for _ in range(3):
+            assert client.get("/classifications/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+        assert client.get("/classifications/", headers={"Authorization": f"Bearer {expired}"}).status_code == 401
+        mock_auth.get_user.assert_not_called()
+    assert auth.STATS["hits"] - hits == 2 and auth.STATS["misses"] - misses == 2
+
+    # Voie lente (jeton opaque, ou sans clé locale) : GoTrue décide, cache borné par l'expiration lisible
+    auth.clear_cache()
+    remote = MagicMock(return_value=MagicMock(user=MagicMock(id="user-2")))
+    for _ in range(2):
+        auth.verify("jeton-opaque", remote=remote)
+    assert remote.call_count == 2
+    short = jwt.encode(dict(claims, exp=int(time.time()) + 5), "secret-inconnu", algorithm="HS256")
+    auth.verify(short, remote=remote)
+    auth.verify(short, remote=remote)
+    assert remote.call_count == 3
+    deadline = next(iter(auth._cache._entries.values()))[0]
+    assert deadline - time.monotonic() <= 5
+    with pytest.raises(auth.AuthError):
+        auth.verify("jeton-opaque", remote=MagicMock(return_value=MagicMock(user=None)))
+    with pytest.raises(auth.AuthError):
+        auth.verify("jeton-opaque")
+    auth.clear_cache()
+
+def test_read_routes_served_by_async_engine(monkeypatch):
+    """Routes de lecture asynchrones (aiosqlite / asyncpg) : mêmes réponses que les fonctions synchrones."""
+    import time
+    import asyncio
+    import jwt
+    import auth
+    from fastapi import Response
+    import database
+    import main
+
+    url = database.async_database_url("postgresql://u:p@db.x.supabase.co:6543/postgres?sslmode=require")
+    assert url.drivername == "postgresql+asyncpg" and url.query == {"ssl": "require"}
+    assert database.async_database_url("sqlite:///./local.db").drivername == "sqlite+aiosqlite"
+    if database.async_engine is None:
+        pytest.skip("Pilote asynchrone non installé")
+
+    endpoints = {r.path: r.endpoint for r in app.routes if getattr(r, "methods", None) == {"GET"}}
+    assert asyncio.iscoroutinefunction(endpoints["/tasks/"]) and asyncio.iscoroutinefunction(endpoints["/users/{user_id}"])
+    assert not asyncio.iscoroutinefunction(endpoints["/workflows/rules"])
+
+    db = database.SessionLocal()
+    try:
+        classification_id = db.query(models.TaskClassification.id).first()[0]
+        db.add_all([models.Task(title=f"Async {i}", status="Nouveau", priority="Haute" if i % 2 else "Basse",
+                                classification_id=classification_id) for i in range(6)])
+        db.commit()
+        expected = [t.id for t in main.read_tasks(Response(), cursor=None, limit=2, status=None, priority=["Haute"],
+                                                        assigned_to=None, classification_id=None, parent_id=None, db=db)]
+    finally:
+        db.close()
+
+    # Jeton signé localement (HS256) : indépendant de SUPABASE_URL et de GoTrue
+    monkeypatch.setitem(auth._config, "secret", "secret-de-test-des-routes-asynchrones")
+    auth.clear_cache()
+    token = jwt.encode({"sub": "test", "aud": "authenticated", "exp": int(time.time()) + 600},
+                       "secret-de-test-des-routes-asynchrones", algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    with patch("main.auth_client", None):
+        response = client.get("/tasks/", params={"priority": "Haute", "limit": 2}, headers=headers)
+        assert response.status_code == 200
+        assert [t["id"] for t in response.json()] == expected
+        assert "X-Next-Cursor" in response.headers
+        assert client.get("/tasks/", params={"cursor": "invalide"}, headers=headers).status_code == 400
+        assert client.get("/users/999999", headers=headers).status_code == 404
+    auth.clear_cache()
+
 # --- 2. TESTS MOTEUR DE WORKFLOW ---
 def test_workflow_engine_no_crash():
     """Vérifie qu'aucun crash NoneType ne survient dans process_workflow."""
@@ -73,7 +159,764 @@ def test_ui_flow():
     # L'écran de login devrait être présent contenant les text_input Email / Mot de passe
     assert len(at.text_input) >= 2
 
-# --- 4. EXÉCUTION ET RAPPORT ASCII ---
+# --- 4. TESTS RÈGLES COMPILÉES ---
+SAMPLE_RULES = [
+    {"name": "CRITIQUE", "triggers": [
+        {"field": "Priorité", "operator": "Est parmi", "value": ["Critique"]},
+        {"field": "Titre", "operator": "Contient", "value": "ITSM"}]},
+    {"name": "SERVER URGENT", "triggers": [
+        {"field": "Statut", "operator": "Est parmi", "value": ["Nouveau", "En cours"]},
+        {"field": "Priorité", "operator": "Est parmi", "value": ["Haute"]}]},
+    {"name": "TITRE SEUL", "triggers": [
+        {"field": "Titre", "operator": "Contient", "value": "serveur"}]},
+]
+
+def make_task(**kw):
+    defaults = dict(id=1, title="", description="", priority="Moyenne", status="Nouveau",
+                    assigned_to="Non assigné", tags=None, classification_id=1, closed_at=None)
+    defaults.update(kw)
+    return MagicMock(spec=list(defaults), **defaults)
+
+def test_compiled_ruleset_prunes_by_index():
+    """Seules les règles dont le déclencheur indexé correspond sont candidates."""
+    from engine import CompiledRuleSet, TaskValues
+
+    compiled = CompiledRuleSet(SAMPLE_RULES)
+    candidates, pruned = compiled.select(TaskValues(make_task(priority="Critique", title="ITSM serveur down")))
+    assert [r.name for r in candidates] == ["CRITIQUE", "TITRE SEUL"]
+    assert pruned == 1
+
+    candidates, pruned = compiled.select(TaskValues(make_task(priority="haute", title="Panne")), after=0)
+    assert [r.name for r in candidates] == ["SERVER URGENT"]
+    assert pruned == 1
+
+def test_pattern_automaton_single_pass():
+    """L'automate renvoie tous les motifs présents, y compris chevauchants et en préfixe."""
+    from engine import PatternAutomaton
+
+    patterns = ["serveur", "serv", "ver", "itsm", "réseau", "vpn", "imprimante", "", "eur"]
+    found, prefixes = PatternAutomaton(patterns).scan("serveur itsm hors service")
+    assert found == {i for i, p in enumerate(patterns) if p in "serveur itsm hors service"}
+    assert prefixes == {0, 1, 7}
+
+def test_rules_cache_reloads_only_on_content_change(tmp_path):
+    """Le cache des règles ne re-parse le YAML que si son contenu change."""
+    import engine
+
+    rules_file = tmp_path / "workflows.yaml"
+    rules_file.write_text("- name: A\n  triggers: []\n", encoding="utf-8")
+    with patch("engine.RULES_FILE", str(rules_file)):
+        engine.invalidate_rules_cache()
+        loads = engine.RULES_STATS["loads"]
+        assert [r.name for r in engine.get_compiled_rules().rules] == ["A"]
+        assert engine.get_compiled_rules() is engine.get_compiled_rules()
+
+        os.utime(rules_file, ns=(0, 0))  # mtime modifié, contenu identique
+        engine.get_compiled_rules()
+        assert engine.RULES_STATS["loads"] == loads + 1
+
+        rules_file.write_text("- name: B\n  triggers: []\n", encoding="utf-8")
+        assert [r.name for r in engine.get_compiled_rules().rules] == ["B"]
+        assert engine.RULES_STATS["loads"] == loads + 2
+    engine.invalidate_rules_cache()
+
+def test_incremental_evaluation_follows_changed_fields():
+    """Une mise à jour ne réévalue que les règles dépendant des champs modifiés (et de leurs effets)."""
+    from engine import CompiledRuleSet, evaluate_rules
+
+    rules = CompiledRuleSet([
+        {"name": "PANNE", "triggers": [{"field": "Titre", "operator": "Contient", "value": "panne"}],
+         "steps": [{"action": "update", "fields": {"Priorité": "Critique"}}]},
+        {"name": "CRITIQUE", "triggers": [{"field": "Priorité", "operator": "Est parmi", "value": ["Critique"]}],
+         "steps": [{"action": "update", "fields": {"assigned_to": "GRP_ITSM"}}]},
+        {"name": "NOUVEAU", "triggers": [{"field": "Statut", "operator": "Est égal à", "value": "Nouveau"}],
+         "steps": [{"action": "update", "fields": {"tags": "triage"}}]},
+    ])
+    assert rules.rules_for_fields(["title"]) == {0}
+    assert rules.rules_for_fields(["description"]) == set()
+
+    outcome = evaluate_rules(make_task(title="Panne réseau"), rules, lambda: None, changed_fields=["title"])
+    assert outcome.matched == ["PANNE", "CRITIQUE"]
+
+    outcome = evaluate_rules(make_task(title="Panne réseau"), rules, lambda: None)
+    assert outcome.matched == ["PANNE", "CRITIQUE", "NOUVEAU"]
+
+def test_engine_metrics_prometheus_export():
+    """Les compteurs par règle sont agrégés entre threads et exportés au format Prometheus."""
+    import threading
+    import metrics
+    from engine import CompiledRuleSet, evaluate_rules
+
+    metrics.reset()
+    rules = CompiledRuleSet([dict(r, steps=[{"action": "update", "fields": {"tags": "x"}}]) for r in SAMPLE_RULES])
+    worker = threading.Thread(target=evaluate_rules, args=(make_task(title="serveur HS"), rules, lambda: None))
+    worker.start(); worker.join()
+    evaluate_rules(make_task(title="serveur HS"), rules, lambda: None)
+
+    text = metrics.render()
+    assert 'liteflow_rule_evaluations_total{rule="TITRE SEUL"} 2' in text
+    assert 'liteflow_rule_matches_total{rule="TITRE SEUL"} 2' in text
+    assert 'liteflow_rule_actions_total{rule="TITRE SEUL",action="update"} 2' in text
+    assert 'liteflow_rule_duration_seconds_bucket{rule="TITRE SEUL",le="+Inf"} 2' in text
+    assert "# TYPE liteflow_condition_duration_seconds histogram" in text
+    assert "liteflow_workflow_duration_seconds_count 2" in text
+
+def test_engine_traces_sampled_and_opt_in():
+    """Sans échantillonnage, seules les règles en opt-in (`trace: true`) sont tracées, par tâche."""
+    import tracing
+    from engine import CompiledRuleSet, evaluate_rules
+
+    rules = CompiledRuleSet([dict(SAMPLE_RULES[1]), dict(SAMPLE_RULES[2], trace=True)])
+    tracing.clear()
+    tracing.configure(sample=0.0)
+    try:
+        evaluate_rules(make_task(id=7, title="serveur HS", priority="Haute"), rules, lambda: None)
+    finally:
+        tracing.configure(sample=1.0)
+
+    traces = tracing.recent(7)
+    assert traces and all(t["rule"] == "TITRE SEUL" for t in traces)
+    assert {t["event"] for t in traces} == {"condition", "match"}
+    assert tracing.recent(8) == []
+
+    evaluate_rules(make_task(id=8, title="serveur HS", priority="Haute"), rules, lambda: None)
+    assert {t["rule"] for t in tracing.recent(8)} >= {"SERVER URGENT", "TITRE SEUL"}
+    if "ENGINE_TRACE_LEVEL" not in os.environ:
+        # Niveau INFO par défaut : conditions tracées seulement pour les règles en opt-in
+        assert {t["event"] for t in tracing.recent(8) if t["rule"] == "SERVER URGENT"} == {"match"}
+
+def test_conditions_reordered_by_observed_selectivity(tmp_path, monkeypatch):
+    """Une condition sélective passe en tête d'un ET ; les statistiques sont persistées en JSON."""
+    import json
+    import engine
+    from engine import CompiledRuleSet, evaluate_rules
+
+    rule = {"name": "ORDRE ADAPTATIF", "triggers": [
+        {"field": "Titre", "operator": "Est égal à", "value": "Panne"},
+        {"field": "Description", "operator": "Est égal à", "value": "disque plein"}],
+        "steps": [{"action": "update", "fields": {"tags": "x"}}]}
+    # Statistiques isolées de celles du processus (et du fichier du répertoire courant)
+    monkeypatch.setattr(engine, "_condition_stats", {})
+    monkeypatch.setitem(engine._stats_state, "loaded", True)
+    rules = CompiledRuleSet([rule])
+    compiled = rules.rules[0]
+    assert [idx for idx, _ in compiled.order] == [0, 1]
+
+    # Réordonnancement pendant l'évaluation, mais aucune écriture de fichier sur ce chemin
+    monkeypatch.setattr(engine, "STATS_FILE", str(tmp_path / "stats.json"))
+    monkeypatch.setattr(engine, "REORDER_INTERVAL", 10)
+    monkeypatch.setitem(engine._stats_state, "saved_at", 0.0)
+    for _ in range(50):
+        evaluate_rules(make_task(title="Panne", description="autre"), rules, lambda: None)
+    assert [idx for idx, _ in compiled.order] == [1, 0]
+    assert not (tmp_path / "stats.json").exists()
+    # Même résultat quel que soit l'ordre d'évaluation
+    assert evaluate_rules(make_task(title="Panne", description="disque plein"), rules, lambda: None).matched == ["ORDRE ADAPTATIF"]
+
+    assert engine.save_condition_stats(force=True)
+    saved = json.loads((tmp_path / "stats.json").read_text(encoding="utf-8"))
+    assert saved["description|Est égal à|disque plein"][:2] == [51, 1]
+
+    # Compiler ne démarre aucune sauvegarde : seul le propriétaire des statistiques (l'API) le fait
+    monkeypatch.setitem(engine._stats_state, "loaded", False)
+    monkeypatch.setattr(engine, "STATS_FILE", str(tmp_path / "api_stats.json"))
+    CompiledRuleSet([rule])
+    assert engine._stats_state["flusher"] is None
+    assert not (tmp_path / "api_stats.json").exists()
+    engine.start_stats_flusher()
+    assert engine._stats_state["flusher"].is_alive()
+    engine.stop_stats_flusher()
+    assert engine._stats_state["flusher"] is None
+    assert (tmp_path / "api_stats.json").exists()
+
+def test_trigger_groups_share_decision_nodes():
+    """Groupes ET / OU / NON : une sous-condition commune à plusieurs règles n'est évaluée qu'une fois par tâche."""
+    from engine import CompiledRuleSet, evaluate_rules, rule_to_where
+
+    panne = {"field": "Titre", "operator": "Contient", "value": "panne"}
+    urgent = {"any": [panne, {"field": "Priorité", "operator": "Est parmi", "value": ["Critique"]}]}
+    rules = CompiledRuleSet([
+        {"name": "URGENT", "triggers": [urgent], "steps": [{"action": "update", "fields": {"tags": "urgent"}}]},
+        {"name": "URGENT HORS VIP", "triggers": [urgent, {"not": {"field": "Description", "operator": "Contient", "value": "vip"}}],
+         "steps": [{"action": "update", "fields": {"tags": "x"}}]},
+    ])
+    group = rules.rules[0].conditions[0]
+    assert rules.rules[1].conditions[0] is group
+    leaf = next(c for c in group.children if c.field == "title")
+
+    before = list(leaf.stats)
+    outcome = evaluate_rules(make_task(title="Panne réseau", description="client VIP"), rules, lambda: None)
+    assert outcome.matched == ["URGENT"]
+    assert leaf.stats[0] - before[0] == 1
+    assert evaluate_rules(make_task(priority="Critique"), rules, lambda: None).matched == ["URGENT", "URGENT HORS VIP"]
+    assert evaluate_rules(make_task(title="Question"), rules, lambda: None).matched == []
+    assert " OR " in str(rule_to_where(rules.rules[1])) and "NOT" in str(rule_to_where(rules.rules[1]))
+
+    # Statistiques propres à chaque groupe : mêmes champs et opérateurs, valeurs différentes
+    other = CompiledRuleSet([{"name": "AUTRE", "triggers": [
+        {"any": [{"field": "Titre", "operator": "Contient", "value": "lenteur"},
+                 {"field": "Priorité", "operator": "Est parmi", "value": ["Haute"]}]}]}]).rules[0].conditions[0]
+    assert other.title == group.title and other.stats_key != group.stats_key
+    assert other.stats is not group.stats
+
+def test_fixed_point_passes_cycles_and_budgets(monkeypatch):
+    """Point fixe : une règle antérieure est réévaluée après une écriture ; cycles et budgets interrompent l'évaluation."""
+    import engine
+    from engine import CompiledRuleSet, evaluate_rules
+
+    rules = CompiledRuleSet([
+        {"name": "NOTIFIER ITSM", "triggers": [{"field": "Assigné à", "operator": "Est parmi", "value": ["GRP_ITSM"]}],
+         "steps": [{"action": "update", "fields": {"tags": "itsm"}}]},
+        {"name": "ROUTAGE", "triggers": [{"field": "Titre", "operator": "Contient", "value": "serveur"}],
+         "steps": [{"action": "update", "fields": {"assigned_to": "GRP_ITSM"}}]},
+    ])
+    outcome = evaluate_rules(make_task(title="Serveur HS"), rules, lambda: None)
+    assert outcome.matched == ["ROUTAGE", "NOTIFIER ITSM"]
+    assert outcome.passes == 2 and outcome.halted is None
+
+    ping_pong = CompiledRuleSet([
+        {"name": "PING", "triggers": [{"field": "Priorité", "operator": "Est parmi", "value": ["Basse"]}],
+         "steps": [{"action": "update", "fields": {"priority": "Haute"}}]},
+        {"name": "PONG", "triggers": [{"field": "Priorité", "operator": "Est parmi", "value": ["Haute"]}],
+         "steps": [{"action": "update", "fields": {"priority": "Basse"}}]},
+    ])
+    outcome = evaluate_rules(make_task(priority="Basse"), ping_pong, lambda: None)
+    assert outcome.halted == "cycle" and outcome.changes == {"priority": "Haute"}
+    assert "Cycle détecté" in outcome.logs[-1]
+
+    monkeypatch.setattr(engine, "MAX_CHILDREN", 1)
+    children = CompiledRuleSet([
+        {"name": "SOUS-TÂCHES", "triggers": [{"field": "Titre", "operator": "Contient", "value": "serveur"}],
+         "steps": [{"action": "create_task", "fields": {"title": "A"}}, {"action": "create_task", "fields": {"title": "B"}}]},
+    ])
+    outcome = evaluate_rules(make_task(title="Serveur HS"), children, lambda value=None: 1)
+    assert outcome.halted == "children" and len(outcome.children) == 1
+
+# --- 5. TESTS MOTEUR SUR BASE EN MÉMOIRE ---
+@pytest.fixture
+def db_session():
+    """Session SQLite en mémoire, isolée de la base de l'application."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    mem_engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=mem_engine)
+    session = sessionmaker(bind=mem_engine, autoflush=False)()
+    session.add_all([models.TaskClassification(name="Incidents"), models.TaskClassification(name="Demandes")])
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def sample_rules():
+    rules = [
+        {"name": "CRITIQUE", "triggers": [{"field": "Priorité", "operator": "Est parmi", "value": ["Critique"]}],
+         "steps": [{"action": "update", "fields": {"assigned_to": "GRP_ITSM"}},
+                   {"action": "create_task", "fields": {"title": "Vérifier le serveur"}}]},
+    ]
+    import engine
+    with patch("engine.get_compiled_rules", return_value=engine.CompiledRuleSet(rules)):
+        yield rules
+
+def test_process_workflow_many_single_commit(db_session, sample_rules):
+    """Un lot est chargé en une requête et écrit en un seul commit."""
+    from engine import process_workflow_many
+
+    db_session.add_all([
+        models.Task(title="Panne", priority="Critique", classification_id=1),
+        models.Task(title="Question", priority="Basse", classification_id=1),
+    ])
+    db_session.commit()
+
+    with patch.object(db_session, "commit", wraps=db_session.commit) as commit:
+        summary = process_workflow_many(None, db_session)
+    assert commit.call_count == 1
+    assert summary["tasks"] == 2 and summary["updated"] == 1 and summary["children"] == 1
+
+    parent = db_session.query(models.Task).filter(models.Task.title == "Panne").one()
+    assert parent.assigned_to == "GRP_ITSM"
+    assert db_session.query(models.Task).filter(models.Task.parent_id == parent.id).count() == 1
+
+def test_insert_with_workflow_single_transaction(db_session, sample_rules):
+    """Les règles sont évaluées avant l'INSERT : ticket, sous-tâche et AuditLog partent en un commit."""
+    from engine import insert_with_workflow
+
+    task = models.Task(title="Panne", priority="Critique", classification_id=1)
+    with patch.object(db_session, "commit", wraps=db_session.commit) as commit:
+        outcome = insert_with_workflow(task, db_session)
+        db_session.commit()
+    assert commit.call_count == 1
+    assert outcome.task_id == task.id and task.assigned_to == "GRP_ITSM"
+
+    child = db_session.query(models.Task).filter(models.Task.parent_id == task.id).one()
+    assert child.title == "Vérifier le serveur"
+    messages = [log.message for log in db_session.query(models.AuditLog)]
+    assert f"[ENGINE] Sous-tâche créée pour le parent #{task.id} (Nature héritée)" in messages
+
+def test_refdata_cache_resolves_classification_names(db_session):
+    """Les règles désignent une nature par son nom ; le cache n'est rechargé qu'après invalidation."""
+    import refdata
+    import engine
+    from engine import insert_with_workflow
+
+    rules = engine.CompiledRuleSet([
+        {"name": "NATURE PAR NOM", "triggers": [{"field": "Titre", "operator": "Contient", "value": "accès"}],
+         "steps": [{"action": "create_task", "fields": {"title": "Créer le compte", "classification": "demandes"}}]},
+    ])
+    refdata.invalidate()
+    loads = refdata.STATS["loads"]
+    with patch("engine.get_compiled_rules", return_value=rules):
+        for title in ("Demande d'accès VPN", "Demande d'accès ERP"):
+            insert_with_workflow(models.Task(title=title, classification_id=1), db_session)
+    db_session.commit()
+    assert refdata.STATS["loads"] == loads + 1
+
+    demandes = db_session.query(models.TaskClassification).filter_by(name="Demandes").one()
+    children = db_session.query(models.Task).filter(models.Task.title == "Créer le compte").all()
+    assert len(children) == 2 and {c.classification_id for c in children} == {demandes.id}
+
+    db_session.add(models.TaskClassification(name="Changements"))
+    db_session.commit()
+    assert refdata.get(db_session).classification_id("changements") is None
+    refdata.invalidate()
+    assert refdata.get(db_session).classification_id("changements") is not None
+
+def test_rules_versions_stored_in_database(db_session, tmp_path, monkeypatch):
+    """Règles versionnées en base : import / export YAML, conflit de version, recompilation au changement de version."""
+    import engine
+    monkeypatch.setattr(engine, "RULES_CHECK_INTERVAL", 0)
+    rules_file = tmp_path / "workflows.yaml"
+    rules_file.write_text("- name: A\n  triggers: []\n", encoding="utf-8")
+    engine.use_rules_database(lambda: db_session)
+    try:
+        assert engine.import_rules_file(db_session, str(rules_file), base_version=0) == 1
+        ruleset = engine.get_compiled_rules()
+        assert [r.name for r in ruleset.rules] == ["A"]
+        loads = engine.RULES_STATS["loads"]
+        assert engine.get_compiled_rules() is ruleset and engine.RULES_STATS["loads"] == loads
+
+        assert engine.save_rules(db_session, [{"name": "B", "triggers": []}], base_version=1) == 2
+        with pytest.raises(engine.RulesVersionConflict):
+            engine.save_rules(db_session, [{"name": "C", "triggers": []}], base_version=1)
+        assert [r.name for r in engine.get_compiled_rules().rules] == ["B"]
+        assert engine.read_rules(db_session) == (2, [{"name": "B", "triggers": []}])
+
+        export_file = tmp_path / "export.yaml"
+        assert engine.export_rules_file(db_session, str(export_file)) == 2
+        assert "name: B" in export_file.read_text(encoding="utf-8")
+    finally:
+        engine.use_rules_database(None)
+        engine.invalidate_rules_cache()
+
+def test_tasks_keyset_pagination_and_filters(db_session):
+    """Pagination par curseur (created_at, id) : ni saut ni doublon malgré une insertion entre deux pages."""
+    import datetime
+    from fastapi import HTTPException, Response
+    from main import read_tasks
+
+    def page(cursor=None, limit=3, status=None):
+        response = Response()
+        rows = read_tasks(response, cursor=cursor, limit=limit, status=status, priority=None, assigned_to=None,
+                          classification_id=None, parent_id=None, db=db_session)
+        return [t.id for t in rows], response.headers.get("X-Next-Cursor")
+
+    base = datetime.datetime(2026, 1, 1)
+    db_session.add_all([
+        models.Task(title=f"T{i}", status="Terminé" if i % 2 else "Nouveau", classification_id=1,
+                    created_at=base + datetime.timedelta(hours=i // 2))
+        for i in range(7)
+    ])
+    db_session.commit()
+
+    ids, cursor = page()
+    db_session.add(models.Task(title="Récent", classification_id=1, created_at=base + datetime.timedelta(days=1)))
+    db_session.commit()
+    while cursor:
+        more, cursor = page(cursor)
+        ids += more
+    assert ids == [7, 6, 5, 4, 3, 2, 1]
+
+    ids, cursor = page(limit=2, status=["Terminé"])
+    assert ids == [6, 4] and page(cursor, limit=2, status=["Terminé"]) == ([2], None)
+    with pytest.raises(HTTPException):
+        page("invalide")
+
+def test_task_search_ranked_highlighted_and_indexed_by_triggers(db_session):
+    """Recherche FTS5 : index tenu à jour par triggers, classement, surlignage et pagination par curseur."""
+    import search
+
+    assert search.ensure_index(db_session.get_bind()) == "sqlite"
+    db_session.add_all([
+        models.Task(title="Imprimante bloquée", description="Le serveur d'impression ne répond plus", classification_id=1),
+        models.Task(title="Serveur de fichiers HS", description="Disque plein", classification_id=1),
+        models.Task(title="Question", description="Accès au serveur VPN", classification_id=1),
+    ])
+    db_session.commit()
+
+    hits, cursor = search.search_tasks(db_session, "serveur", limit=2)
+    assert [task.id for task, *_ in hits] == [2, 3] and cursor
+    assert hits[0][2] == "<mark>Serveur</mark> de fichiers HS"
+    more, cursor = search.search_tasks(db_session, "serveur", limit=2, cursor=cursor)
+    assert [task.id for task, *_ in more] == [1] and cursor is None
+
+    task = db_session.get(models.Task, 3)
+    task.description = "Accès VPN"
+    db_session.commit()
+    assert [task.id for task, *_ in search.search_tasks(db_session, "serv")[0]] == [2, 1]
+    assert [task.id for task, *_ in search.search_tasks(db_session, "impr", status=["Terminé"])[0]] == []
+
+def test_task_stats_single_group_by_cached_per_version(db_session):
+    """KPI : répartitions issues d'un seul GROUP BY, servies du cache tant que la version des données ne change pas."""
+    import datetime
+    import task_stats
+    from sqlalchemy import event
+
+    db_session.add_all([
+        models.Task(title="A", status="Terminé", priority="Haute", classification_id=1, created_at=datetime.datetime(2026, 1, 5)),
+        models.Task(title="B", status="A faire", priority="Haute", assigned_to="GRP_ITSM", classification_id=2, created_at=datetime.datetime(2026, 2, 5)),
+        models.Task(title="C", status="Nouveau", classification_id=1, created_at=datetime.datetime(2026, 3, 5)),
+    ])
+    db_session.commit()
+    task_stats.invalidate()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        stats = task_stats.get(db_session)
+        assert task_stats.get(db_session) is stats
+        assert sum("GROUP BY" in s for s in statements) == 1
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    assert (stats["total"], stats["closed"], stats["open"]) == (3, 1, 2)
+    assert stats["by_status"] == {"Terminé": 1, "À faire": 1, "Nouveau": 1}
+    assert stats["by_classification"] == {"Incidents": 2, "Demandes": 1}
+    assert stats["by_assigned_to"] == {"Non assigné": 2, "GRP_ITSM": 1}
+
+    recent = task_stats.get(db_session, date_from=datetime.datetime(2026, 2, 1))
+    assert recent["total"] == 2 and recent["by_priority"] == {"Haute": 1, "Moyenne": 1}
+    task_stats.invalidate()
+    assert task_stats.get(db_session) is not stats
+
+def test_workflow_queue_claims_each_job_once(db_session, sample_rules):
+    """Un job n'est réclamé qu'une fois et son statut est consultable par tâche."""
+    import workflow_queue
+    from sqlalchemy.orm import sessionmaker
+
+    factory = sessionmaker(bind=db_session.get_bind(), autoflush=False)
+    task = models.Task(title="Panne", priority="Critique", classification_id=1)
+    db_session.add(task)
+    db_session.flush()
+    workflow_queue.enqueue(db_session, task.id)
+    db_session.commit()
+
+    assert workflow_queue.run_next(factory, "w1") is True
+    assert workflow_queue.run_next(factory, "w2") is False
+
+    job = db_session.query(models.WorkflowJob).filter(models.WorkflowJob.task_id == task.id).one()
+    assert job.status == workflow_queue.DONE and job.attempts == 1
+    db_session.refresh(task)
+    assert task.assigned_to == "GRP_ITSM"
+
+def test_workflow_queue_fails_abandoned_job_after_max_attempts(db_session):
+    """Un job abandonné (worker mort) est réclamé de nouveau, puis passé en échec une fois ses tentatives épuisées."""
+    import datetime
+    import workflow_queue
+    from sqlalchemy.orm import sessionmaker
+
+    factory = sessionmaker(bind=db_session.get_bind(), autoflush=False)
+    task = models.Task(title="Plantage", classification_id=1)
+    db_session.add(task)
+    db_session.flush()
+    stale = models.get_utc_now() - datetime.timedelta(seconds=workflow_queue.LOCK_TIMEOUT + 60)
+    retried = models.WorkflowJob(task_id=task.id, status=workflow_queue.RUNNING, attempts=1, locked_by="mort", locked_at=stale)
+    exhausted = models.WorkflowJob(task_id=task.id, status=workflow_queue.RUNNING,
+                                   attempts=workflow_queue.MAX_ATTEMPTS, locked_by="mort", locked_at=stale)
+    db_session.add_all([retried, exhausted])
+    db_session.commit()
+
+    db = factory()
+    try:
+        assert workflow_queue.claim_job(db, "w1") == (retried.id, task.id)
+        assert workflow_queue.claim_job(db, "w1") is None
+    finally:
+        db.close()
+    db_session.expire_all()
+    assert exhausted.status == workflow_queue.FAILED and exhausted.locked_by is None
+    assert retried.status == workflow_queue.RUNNING and retried.attempts == 2
+
+def test_timed_rule_armed_once_per_pending_and_fired_when_due(db_session):
+    """Une règle `delay` arme un minuteur persistant, déclenché à l'échéance si ses conditions tiennent."""
+    import datetime
+    import engine
+    import workflow_timers
+    from sqlalchemy.orm import sessionmaker
+
+    rules = engine.CompiledRuleSet([
+        {"name": "RELANCE", "delay": "1h", "triggers": [{"field": "Statut", "operator": "Est égal à", "value": "Nouveau"}],
+         "steps": [{"action": "update", "fields": {"Priorité": "Haute"}}]},
+    ])
+    assert not rules.rules and rules.depends_on(["status"]) and not rules.depends_on(["title"])
+    factory = sessionmaker(bind=db_session.get_bind(), autoflush=False)
+    with patch("engine.get_compiled_rules", return_value=rules):
+        still_new = models.Task(title="Relance", status="Nouveau", priority="Basse", classification_id=1)
+        moved_on = models.Task(title="Pris en charge", status="Nouveau", priority="Basse", classification_id=1)
+        for task in (still_new, moved_on):
+            assert engine.insert_with_workflow(task, db_session).timers == [("RELANCE", 3600)]
+        db_session.commit()
+        engine.process_workflow(still_new.id, db_session)
+        assert db_session.query(models.WorkflowTimer).count() == 2
+
+        scheduler = workflow_timers.TimerScheduler(factory, sync_interval=30)
+        scheduler.sync()
+        assert scheduler._heap == []
+
+        moved_on.status = "En cours"
+        db_session.query(models.WorkflowTimer).update({"due_at": datetime.datetime.utcnow() - datetime.timedelta(seconds=1)})
+        db_session.commit()
+        scheduler.sync()
+        assert scheduler.run_due() == 2 and scheduler.run_due() == 0
+
+    db_session.expire_all()
+    assert still_new.priority == "Haute" and moved_on.priority == "Basse"
+    statuses = {t.status for t in db_session.query(models.WorkflowTimer)}
+    assert statuses == {workflow_timers.FIRED}
+
+    # Un minuteur déclenché peut être réarmé, mais jamais deux minuteurs en attente pour la même règle
+    still_new.priority = "Basse"
+    db_session.commit()
+    with patch("engine.get_compiled_rules", return_value=rules):
+        engine.process_workflow(still_new.id, db_session)
+        engine.process_workflow(still_new.id, db_session)
+    pending = db_session.query(models.WorkflowTimer).filter_by(task_id=still_new.id, status=workflow_timers.PENDING)
+    assert pending.count() == 1 and db_session.query(models.WorkflowTimer).count() == 3
+
+def test_close_subtree_closes_open_descendants(db_session):
+    """La clôture ensembliste parcourt tout le sous-arbre, sauf sous les branches déjà terminées."""
+    from engine import close_subtree
+
+    root = models.Task(title="Projet", classification_id=1)
+    db_session.add(root)
+    db_session.flush()
+    child = models.Task(title="Lot 1", parent_id=root.id, classification_id=1)
+    done = models.Task(title="Lot 2", parent_id=root.id, status="Terminé", classification_id=1)
+    db_session.add_all([child, done])
+    db_session.flush()
+    grandchild = models.Task(title="Tâche 1.1", parent_id=child.id, classification_id=1)
+    untouched = models.Task(title="Tâche 2.1", parent_id=done.id, classification_id=1)
+    db_session.add_all([grandchild, untouched])
+    db_session.commit()
+
+    assert close_subtree(db_session, [root.id], source="SYSTEME") == 2
+    db_session.commit()
+
+    assert [child.status, grandchild.status, untouched.status] == ["Terminé", "Terminé", "Nouveau"]
+    assert grandchild.closed_at is not None
+    assert db_session.query(models.AuditLog).filter(models.AuditLog.message.like("[SYSTEME]%")).count() == 2
+
+def test_simulate_rules_vectorized_matches_row_engine(db_session):
+    """La simulation vectorisée compte les mêmes tickets que le moteur ligne à ligne, sans écrire."""
+    from engine import simulate_rules
+
+    db_session.add_all([
+        models.Task(title="ITSM en panne", priority="Critique", classification_id=1),
+        models.Task(title="itsm lent", priority="critique ", classification_id=1),
+        models.Task(title="ITSM", priority="Basse", classification_id=1),
+        models.Task(title=None, priority=None, classification_id=1),
+    ])
+    db_session.commit()
+
+    report = simulate_rules(db_session, rules=SAMPLE_RULES[:1])
+    assert report["tasks"] == 4
+    assert report["rules"][0]["matches"] == 2
+    assert report["rules"][0]["sample_ids"] == [1, 2]
+    assert db_session.query(models.AuditLog).count() == 0
+
+    import pydantic
+    import schemas
+    with pytest.raises(pydantic.ValidationError):
+        schemas.RuleSimulationRequest(sample_size=100000)
+    with pytest.raises(pydantic.ValidationError):
+        schemas.RulePreviewRequest(triggers=[], sample_size=-1)
+
+def test_rule_to_sql_preview_counts_in_database(db_session):
+    """Les déclencheurs traduits en SQL comptent les mêmes tickets que le moteur."""
+    from engine import preview_rule_impact
+
+    db_session.add_all([
+        models.Task(title="ITSM en panne", priority="Critique", classification_id=1),
+        models.Task(title="Accès 100%_ITSM", priority="Critique", classification_id=1),
+        models.Task(title="Serveur", priority="Critique", classification_id=1),
+    ])
+    db_session.commit()
+
+    assert preview_rule_impact(db_session, SAMPLE_RULES[0]) == {"count": 2, "sample_ids": [2, 1]}
+    escaped = {"triggers": [{"field": "Titre", "operator": "Contient", "value": "%_itsm"}]}
+    assert preview_rule_impact(db_session, escaped)["count"] == 1
+
+def test_typed_operators_agree_in_engine_sql_and_simulation(db_session):
+    """Regex, négations, nombres et dates : moteur, aperçu SQL et simulation retiennent les mêmes tickets."""
+    import datetime
+    from engine import CompiledRuleSet, TaskValues, preview_rule_impact, simulate_rules, check_condition, check_rules_integrity
+
+    now = datetime.datetime.utcnow()
+    db_session.add_all([
+        models.Task(title="INC-1042 imprimante", priority="Basse", classification_id=1, created_at=now - datetime.timedelta(days=10)),
+        models.Task(title="Imprimante HS", priority="Critique", classification_id=1, created_at=now - datetime.timedelta(hours=1)),
+        models.Task(title="inc-77 VPN", priority="Haute", classification_id=1, created_at=now - datetime.timedelta(days=3)),
+    ])
+    db_session.commit()
+    cases = {
+        "Correspond à (regex)": ("Titre", r"^inc-\d{3,}", {1}),
+        "Ne contient pas": ("Titre", "imprimante", {3}),
+        "N'est pas": ("Priorité", ["Critique", "Haute"], {1}),
+        "Supérieur à": ("ID", "1", {2, 3}),
+        "Avant le": ("Créé le", (now - datetime.timedelta(days=2)).date().isoformat(), {1, 3}),
+        "Plus ancien que": ("Créé le", "2j", {1, 3}),
+        "Plus récent que": ("Créé le", "1j", {2}),
+        # Liste avec un opérateur de texte : appartenance, comme avant le registre d'opérateurs
+        "Contient": ("Priorité", ["Critique", "haute"], {2, 3}),
+    }
+    rules = [{"name": op, "triggers": [{"field": f, "operator": op, "value": v}]} for op, (f, v, _) in cases.items()]
+    compiled = CompiledRuleSet(rules)
+    tasks = db_session.query(models.Task).order_by(models.Task.id).all()
+    report = {r["name"]: r["matches"] for r in simulate_rules(db_session, rules=rules)["rules"]}
+    for rule, (op, (_, _, expected)) in zip(compiled.rules, cases.items()):
+        assert {t.id for t in tasks if all(c.test(TaskValues(t)) for c in rule.conditions)} == expected, op
+        assert preview_rule_impact(db_session, rule)["count"] == len(expected), op
+        assert report[op] == len(expected), op
+
+    assert check_condition("Panne serveur", "Ne contient pas", "réseau")[0] is True
+    assert check_rules_integrity(rules=rules) == ["⚠️ Règle 'Contient' (Déclencheur 1) : Liste de valeurs avec 'Contient' : évaluée comme 'Est parmi'."]
+    assert CompiledRuleSet([{"name": "X", "triggers": [{"field": "ID", "operator": "Supérieur à", "value": "abc"}]}]).rules[0].conditions[0].error
+
+def test_designer_keeps_operator_of_choice_rule():
+    """Une règle existante sur un champ à choix garde son opérateur dans le designer (jamais inversée)."""
+    import yaml
+    import operators
+    from engine import CompiledRuleSet, check_condition
+
+    rule = yaml.safe_load("""
+name: STATUT NOUVEAU
+triggers:
+  - {field: Statut, operator: Est égal à, value: [Nouveau]}
+steps: []
+""")
+    trig = rule["triggers"][0]
+    kind = operators.field_type("status")
+    assert operators.names_for(kind)[0] == "Est égal à"
+    assert operators.closest_for(trig["operator"], kind) == "Est égal à"
+    assert operators.closest_for("equals", kind) == "Est égal à"
+    # Opérateur non proposé : égalité de même sens, pas le premier de la liste
+    assert operators.closest_for("Contient", kind) == "Est égal à"
+    assert operators.closest_for("Ne contient pas", kind) == "N'est pas"
+    assert operators.closest_for("Supérieur à", operators.field_type("title")) == "Est égal à"
+    assert CompiledRuleSet([rule]).rules
+    assert check_condition("Nouveau", trig["operator"], trig["value"])[0] is True
+    assert check_condition("En cours", trig["operator"], trig["value"])[0] is False
+
+
+def test_sql_preview_matches_engine_on_null_columns(db_session):
+    """Colonnes NULL (date de création héritée, texte vide) : négations et groupes NON identiques en SQL et dans le moteur."""
+    import datetime
+    from engine import CompiledRuleSet, TaskValues, preview_rule_impact, simulate_rules
+
+    now = datetime.datetime.utcnow()
+    db_session.add_all([
+        models.Task(title="Panne", priority="Critique", classification_id=1, created_at=now - datetime.timedelta(days=10)),
+        models.Task(title=None, priority=None, classification_id=1),
+    ])
+    db_session.commit()
+    # Ligne héritée sans date de création (la valeur par défaut du modèle s'applique à l'insertion)
+    db_session.query(models.Task).filter(models.Task.title.is_(None)).update({models.Task.created_at: None})
+    db_session.commit()
+    cases = {
+        "NON avant": ({"not": {"field": "Créé le", "operator": "Avant le", "value": now.date().isoformat()}}, {2}),
+        "NON plus ancien": ({"not": {"field": "Créé le", "operator": "Plus ancien que", "value": "1j"}}, {2}),
+        "N'est pas": ({"field": "Priorité", "operator": "N'est pas", "value": ["Critique"]}, {2}),
+        "Ne contient pas": ({"field": "Titre", "operator": "Ne contient pas", "value": "panne"}, {2}),
+    }
+    rules = [{"name": name, "triggers": [trig]} for name, (trig, _) in cases.items()]
+    compiled = CompiledRuleSet(rules)
+    tasks = db_session.query(models.Task).order_by(models.Task.id).all()
+    report = {r["name"]: r["matches"] for r in simulate_rules(db_session, rules=rules)["rules"]}
+    for rule, (name, (_, expected)) in zip(compiled.rules, cases.items()):
+        assert {t.id for t in tasks if all(c.check(TaskValues(t)) for c in rule.conditions)} == expected, name
+        assert preview_rule_impact(db_session, rule)["count"] == len(expected), name
+        assert report[name] == len(expected), name
+
+def test_backfill_dry_run_then_resumable_run(db_session, sample_rules, tmp_path, monkeypatch):
+    """Le backfill découpe les tâches ouvertes en lots ; le dry-run n'écrit rien."""
+    from concurrent.futures import Future
+    from sqlalchemy.orm import sessionmaker
+    import database
+    import backfill_workflows
+
+    class InlineExecutor:
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=db_session.get_bind(), autoflush=False))
+    db_session.add_all([models.Task(title=f"Panne {i}", priority="Critique", classification_id=1) for i in range(3)]
+                       + [models.Task(title="Question", priority="Basse", classification_id=1)])
+    db_session.commit()
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    preview = backfill_workflows.backfill(chunk_size=2, dry_run=True, checkpoint=checkpoint, executor=InlineExecutor())
+    assert preview["tasks"] == 4 and len(preview["changes"]) == 3
+    assert db_session.query(models.Task).filter(models.Task.assigned_to == "GRP_ITSM").count() == 0
+
+    totals = backfill_workflows.backfill(chunk_size=2, checkpoint=checkpoint, executor=InlineExecutor())
+    assert totals["updated"] == 3 and totals["children"] == 3
+    assert db_session.query(models.Task).filter(models.Task.assigned_to == "GRP_ITSM").count() == 3
+    assert not (tmp_path / "checkpoint.json").exists()
+
+def test_backfill_resume_skips_chunks_finished_out_of_order(db_session, sample_rules, tmp_path, monkeypatch):
+    """Interrompu avec un lot manquant avant des lots terminés, le backfill ne rejoue que le lot manquant."""
+    import json
+    from concurrent.futures import Future
+    from sqlalchemy.orm import sessionmaker
+    import database
+    import backfill_workflows
+
+    class InlineExecutor:
+        def __init__(self, fail_first=False):
+            self.fail_first = fail_first
+
+        def submit(self, fn, *args):
+            future = Future()
+            if self.fail_first:
+                self.fail_first = False
+                future.set_exception(KeyboardInterrupt())
+            else:
+                future.set_result(fn(*args))
+            return future
+
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=db_session.get_bind(), autoflush=False))
+    # Les lots terminent dans le désordre : le premier lot échoue après les suivants
+    monkeypatch.setattr(backfill_workflows, "as_completed", lambda futures: list(futures)[::-1])
+    tasks = [models.Task(title=f"Panne {i}", priority="Critique", classification_id=1) for i in range(5)]
+    db_session.add_all(tasks)
+    db_session.commit()
+    ids = sorted(t.id for t in tasks)
+    checkpoint = tmp_path / "checkpoint.json"
+
+    with pytest.raises(KeyboardInterrupt):
+        backfill_workflows.backfill(chunk_size=2, checkpoint=str(checkpoint), executor=InlineExecutor(fail_first=True))
+    state = json.loads(checkpoint.read_text(encoding="utf-8"))
+    assert state["last_id"] == 0 and state["done"] == [[ids[2], ids[3]], [ids[4], ids[4]]]
+    assert state["totals"]["children"] == 3
+
+    totals = backfill_workflows.backfill(chunk_size=2, checkpoint=str(checkpoint), executor=InlineExecutor())
+    assert totals["children"] == 5
+    for task_id in ids:
+        assert db_session.query(models.Task).filter(models.Task.parent_id == task_id).count() == 1
+    assert not checkpoint.exists()
+
+# --- 6. EXÉCUTION ET RAPPORT ASCII ---
 if __name__ == "__main__":
     results = []
     
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Traces structurées du moteur de workflow.
+
+Remplace les print("[DEBUG] ...") du chemin chaud :
+    - niveaux (INFO par défaut : règles appliquées et actions ; DEBUG : chaque condition,
+      à activer par ENGINE_TRACE_LEVEL=DEBUG pour un diagnostic)
+    - échantillonnage par tâche (ENGINE_TRACE_SAMPLE) : une tâche est tracée entièrement ou pas du tout
+    - opt-in par règle (ENGINE_TRACE_RULES ou `trace: true` dans workflows.yaml) : toujours tracée en DEBUG
+    - tampon circulaire borné (ENGINE_TRACE_BUFFER) consultable par tâche via GET /tasks/{id}/traces
+    - écriture asynchrone vers les sorties (console par défaut) par un thread dédié :
+      le worker n'attend jamais stdout, et les enregistrements en excès sont abandonnés
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+
+OFF, INFO, DEBUG = 0, 1, 2
+LEVEL_NAMES = {"OFF": OFF, "INFO": INFO, "DEBUG": DEBUG}
+
+# Configuration (surchargeable par variables d'environnement, modifiable à chaud via configure)
+_config = {
+    "level": LEVEL_NAMES.get(os.environ.get("ENGINE_TRACE_LEVEL", "INFO").upper(), INFO),
+    "sample": float(os.environ.get("ENGINE_TRACE_SAMPLE", "1.0")),
+    "rules": frozenset(r.strip() for r in os.environ.get("ENGINE_TRACE_RULES", "").split(",") if r.strip()),
+}
+BUFFER_SIZE = int(os.environ.get("ENGINE_TRACE_BUFFER", "5000"))
+FLUSH_INTERVAL = float(os.environ.get("ENGINE_TRACE_FLUSH_INTERVAL", "0.2"))
+
+_ring = deque(maxlen=BUFFER_SIZE)       # derniers enregistrements (lecture par l'API)
+_pending = deque(maxlen=BUFFER_SIZE)    # en attente d'écriture vers les sorties
+_sinks = []
+_writer = None
+_writer_lock = threading.Lock()
+STATS = {"emitted": 0, "dropped": 0}
+
+def configure(level=None, sample=None, rules=None):
+    """Change le niveau, le taux d'échantillonnage ou les règles suivies (sans redémarrage)."""
+    if level is not None:
+        _config["level"] = LEVEL_NAMES[level.upper()] if isinstance(level, str) else int(level)
+    if sample is not None:
+        _config["sample"] = float(sample)
+    if rules is not None:
+        _config["rules"] = frozenset(rules)
+
+def add_sink(sink):
+    """Ajoute une sortie : callable recevant chaque enregistrement (dict), appelée par le thread d'écriture."""
+    _sinks.append(sink)
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+def _console_sink(record):
+    level = "DEBUG" if record["level"] == DEBUG else "ENGINE"
+    print(f"[{level}] {record['message']}")
+
+if os.environ.get("ENGINE_TRACE_STDOUT", "1") == "1":
+    add_sink(_console_sink)
+
+class TaskTrace:
+    """
+    Trace d'une évaluation de tâche. `sampled` est tiré une fois par tâche.
+    Pour une tâche pas encore insérée (task_id None), les enregistrements sont
+    retenus jusqu'à bind(task_id).
+    """
+    __slots__ = ('task_id', 'sampled', 'rules', 'deferred')
+
+    def __init__(self, task_id, sampled, rules):
+        self.task_id = task_id
+        self.sampled = sampled
+        self.rules = rules
+        self.deferred = [] if task_id is None else None
+
+    def wants(self, level, rule=None):
+        """Test peu coûteux à appeler avant de formater un message."""
+        if rule is not None and rule in self.rules:
+            return True
+        return self.sampled and level <= _config["level"]
+
+    def emit(self, level, event, message, rule=None, **data):
+        record = {
+            "ts": time.time(),
+            "task_id": self.task_id,
+            "level": level,
+            "event": event,
+            "rule": rule,
+            "message": message,
+            "data": data,
+        }
+        if self.deferred is not None:
+            self.deferred.append(record)
+            return
+        _publish(record)
+
+    def bind(self, task_id):
+        """Rattache la trace à l'ID attribué par la base et publie les enregistrements retenus."""
+        self.task_id = task_id
+        records, self.deferred = self.deferred or [], None
+        for record in records:
+            record["task_id"] = task_id
+            _publish(record)
+
+def _publish(record):
+    _ring.append(record)
+    if _sinks:
+        if len(_pending) == _pending.maxlen:
+            STATS["dropped"] += 1
+        _pending.append(record)
+        _ensure_writer()
+    STATS["emitted"] += 1
+
+def begin(task_id, rules=()):
+    """
+    Ouvre la trace d'une tâche. `rules` : noms des règles à tracer en DEBUG quel que
+    soit l'échantillonnage (en plus de ENGINE_TRACE_RULES).
+    """
+    sample = _config["sample"]
+    sampled = _config["level"] > OFF and (sample >= 1.0 or random.random() < sample)
+    opted = _config["rules"] | frozenset(rules) if rules else _config["rules"]
+    return TaskTrace(task_id, sampled, opted)
+
+def recent(task_id=None, limit=200):
+    """Derniers enregistrements (les plus récents en premier), éventuellement filtrés par tâche."""
+    records = []
+    for record in reversed(list(_ring)):
+        if task_id is None or record["task_id"] == task_id:
+            records.append(dict(record, level=("DEBUG" if record["level"] == DEBUG else "INFO")))
+            if len(records) >= limit:
+                break
+    return records
+
+def flush():
+    """Écrit immédiatement les enregistrements en attente (tests, arrêt du processus)."""
+    while _pending:
+        try:
+            record = _pending.popleft()
+        except IndexError:
+            break
+        for sink in list(_sinks):
+            try:
+                sink(record)
+            except Exception:
+                pass
+
+def clear():
+    _ring.clear()
+    _pending.clear()
+
+def _writer_loop():
+    while True:
+        flush()
+        time.sleep(FLUSH_INTERVAL)
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_writer_loop, name="engine-trace-writer", daemon=True)
+            _writer.start()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+File d'attente persistante des exécutions du moteur de workflow.
+
+Les tickets modifiés par l'API sont mis en file (table `workflow_jobs`) dans la même
+transaction que leur écriture (les créations sont évaluées avant insertion, cf.
+engine.insert_with_workflow) ; un pool de workers interne au processus réclame
+les jobs et exécute process_workflow hors du chemin de la requête.
+Plusieurs processus uvicorn peuvent partager la même file sans traiter deux fois
+le même job :
+    - PostgreSQL : SELECT ... FOR UPDATE SKIP LOCKED
+    - SQLite     : UPDATE conditionnel (status = 'En attente') sur l'id candidat
+"""
+import os
+import datetime
+import socket
+import threading
+from sqlalchemy import update, or_, and_
+from sqlalchemy.orm import Session
+from models import WorkflowJob, get_utc_now
+from engine import process_workflow
+import workflow_timers
+import metrics
+import task_stats
+
+# Statuts des jobs
+PENDING = "En attente"
+RUNNING = "En cours"
+DONE = "Terminé"
+FAILED = "Échec"
+
+# Configuration (surchargeable par variables d'environnement)
+WORKER_COUNT = int(os.environ.get("WORKFLOW_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.environ.get("WORKFLOW_MAX_ATTEMPTS", "3"))
+POLL_INTERVAL = float(os.environ.get("WORKFLOW_POLL_INTERVAL", "2"))
+RETRY_DELAY = float(os.environ.get("WORKFLOW_RETRY_DELAY", "5"))
+# Un job 'En cours' plus ancien que ce délai est considéré comme abandonné (worker mort)
+LOCK_TIMEOUT = float(os.environ.get("WORKFLOW_LOCK_TIMEOUT", "300"))
+
+_wakeup = threading.Event()
+
+def enqueue(db: Session, task_id, changed_fields=None):
+    """
+    Ajoute un job à la session courante ; il est rendu durable par le commit de l'appelant.
+    `changed_fields` (mise à jour) limite l'évaluation aux règles dépendant de ces champs.
+    """
+    fields = ",".join(sorted(changed_fields)) if changed_fields is not None else None
+    job = WorkflowJob(task_id=task_id, status=PENDING, attempts=0, changed_fields=fields)
+    db.add(job)
+    return job
+
+def notify():
+    """Réveille les workers locaux sans attendre le prochain intervalle de scrutation."""
+    _wakeup.set()
+
+def _stale(now):
+    return and_(WorkflowJob.status == RUNNING, WorkflowJob.locked_at < now - datetime.timedelta(seconds=LOCK_TIMEOUT))
+
+def _claimable(now):
+    return or_(
+        and_(WorkflowJob.status == PENDING, WorkflowJob.run_after <= now),
+        and_(_stale(now), WorkflowJob.attempts < MAX_ATTEMPTS),
+    )
+
+def fail_abandoned(db: Session, now=None):
+    """
+    Passe en échec les jobs abandonnés (worker mort) ayant épuisé leurs tentatives :
+    un job qui interrompt systématiquement son worker n'est pas réclamé indéfiniment.
+    """
+    now = now or get_utc_now()
+    res = db.execute(
+        update(WorkflowJob)
+        .where(_stale(now), WorkflowJob.attempts >= MAX_ATTEMPTS)
+        .values(status=FAILED, last_error="Worker interrompu pendant l'exécution (tentatives épuisées)",
+                finished_at=now, locked_by=None, locked_at=None)
+    )
+    db.commit()
+    if res.rowcount:
+        print(f"[QUEUE] [ERREUR] {res.rowcount} job(s) abandonné(s) passé(s) en échec après {MAX_ATTEMPTS} tentatives")
+        metrics.inc("liteflow_engine_errors_total", ("queue",), res.rowcount)
+    return res.rowcount
+
+def claim_job(db: Session, worker_id):
+    """Réclame le prochain job disponible et retourne (job_id, task_id), ou None."""
+    now = get_utc_now()
+    fail_abandoned(db, now)
+    claim = dict(status=RUNNING, locked_by=worker_id, locked_at=now, attempts=WorkflowJob.attempts + 1)
+
+    if db.get_bind().dialect.name == "postgresql":
+        job = db.query(WorkflowJob).filter(_claimable(now)).order_by(WorkflowJob.id) \
+            .with_for_update(skip_locked=True).first()
+        if not job:
+            db.rollback()
+            return None
+        job_id, task_id = job.id, job.task_id
+        db.execute(update(WorkflowJob).where(WorkflowJob.id == job_id).values(**claim))
+        db.commit()
+        return job_id, task_id
+
+    # Équivalent SQLite : la mise à jour conditionnelle ne réussit que pour un seul worker
+    while True:
+        row = db.query(WorkflowJob.id, WorkflowJob.task_id).filter(_claimable(now)).order_by(WorkflowJob.id).first()
+        if not row:
+            db.rollback()
+            return None
+        res = db.execute(
+            update(WorkflowJob)
+            .where(WorkflowJob.id == row.id, _claimable(now))
+            .values(**claim)
+        )
+        db.commit()
+        if res.rowcount == 1:
+            return row.id, row.task_id
+
+def run_job(session_factory, job_id, task_id):
+    """Exécute le workflow d'un job réclamé et enregistre son résultat."""
+    db = session_factory()
+    try:
+        error = None
+        job = db.get(WorkflowJob, job_id)
+        changed_fields = None
+        if job is not None and job.changed_fields is not None:
+            changed_fields = [f for f in job.changed_fields.split(",") if f]
+        try:
+            process_workflow(task_id, db, changed_fields)
+            task_stats.invalidate()
+            # Des minuteurs ont pu être armés : le planificateur local se resynchronise
+            workflow_timers.notify()
+        except Exception as e:
+            db.rollback()
+            error = str(e)
+            print(f"[QUEUE] [ERREUR] Job #{job_id} (tâche #{task_id}) : {e}")
+            metrics.inc("liteflow_engine_errors_total", ("queue",))
+
+        job = db.get(WorkflowJob, job_id)
+        if job is None:
+            return
+        if error is None:
+            job.status = DONE
+            job.last_error = None
+            job.finished_at = get_utc_now()
+        elif job.attempts >= MAX_ATTEMPTS:
+            job.status = FAILED
+            job.last_error = error
+            job.finished_at = get_utc_now()
+        else:
+            job.status = PENDING
+            job.last_error = error
+            job.run_after = get_utc_now() + datetime.timedelta(seconds=RETRY_DELAY * job.attempts)
+        job.locked_by = None
+        job.locked_at = None
+        db.commit()
+    finally:
+        db.close()
+
+def run_next(session_factory, worker_id):
+    """Réclame et exécute un job. Retourne False si la file est vide."""
+    db = session_factory()
+    try:
+        claimed = claim_job(db, worker_id)
+    finally:
+        db.close()
+    if not claimed:
+        return False
+    run_job(session_factory, *claimed)
+    return True
+
+class WorkflowWorkerPool:
+    """Pool de threads consommant la file `workflow_jobs`."""
+
+    def __init__(self, session_factory, size=WORKER_COUNT):
+        self.session_factory = session_factory
+        self.size = size
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self._threads or self.size <= 0:
+            return
+        self._stop.clear()
+        for i in range(self.size):
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{i}"
+            t = threading.Thread(target=self._loop, args=(worker_id,), name=f"workflow-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"[QUEUE] {self.size} worker(s) de workflow démarré(s)")
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        _wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _loop(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                if run_next(self.session_factory, worker_id):
+                    continue
+            except Exception as e:
+                print(f"[QUEUE] [ERREUR] Worker {worker_id} : {e}")
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
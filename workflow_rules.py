@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Import / export des règles de workflow entre un fichier YAML et la table `workflow_rules`.
+
+Chaque import enregistre une nouvelle version ; les workers de l'API la chargent à leur
+prochaine vérification de version (ENGINE_RULES_CHECK_INTERVAL).
+
+Exemples :
+    python workflow_rules.py export                      # version active -> workflows.yaml
+    python workflow_rules.py import regles.yaml --author ops
+    python workflow_rules.py status
+"""
+import sys
+import argparse
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import / export des règles de workflow (table workflow_rules).")
+    parser.add_argument("command", choices=["import", "export", "status"])
+    parser.add_argument("path", nargs="?", default=None, help="Fichier YAML (défaut : workflows.yaml)")
+    parser.add_argument("--author", default="import", help="Auteur enregistré avec la version importée")
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal, init_db
+    from engine import RULES_FILE, current_rules_version, import_rules_file, export_rules_file
+    init_db()
+    path = args.path or RULES_FILE
+    db = SessionLocal()
+    try:
+        if args.command == "import":
+            version = import_rules_file(db, path, author=args.author)
+            print(f"[RULES] {path} importé : version {version}")
+        elif args.command == "export":
+            version = export_rules_file(db, path)
+            if not version:
+                print("[RULES] Aucune version enregistrée en base.")
+                return 1
+            print(f"[RULES] Version {version} exportée vers {path}")
+        else:
+            print(f"[RULES] Version active : {current_rules_version(db) or 'aucune'}")
+    finally:
+        db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
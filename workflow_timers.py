@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Planificateur des règles temporisées (clé `delay` de workflows.yaml : SLA, relances...).
+
+Les minuteurs sont armés par le moteur dans la table `workflow_timers` (même transaction
+que l'évaluation qui les a produits) : un redémarrage ne perd aucune échéance.
+Un thread unique par processus garde en mémoire un tas (heapq) des seuls minuteurs
+proches de leur échéance (horizon = 2 x TIMER_SYNC), resynchronisé avec la base toutes
+les TIMER_SYNC secondes ou sur notify(). Il dort jusqu'à la prochaine échéance et ne
+déclenche que les minuteurs dus : aucun balayage des tâches.
+Plusieurs processus peuvent partager la table : un UPDATE conditionnel
+(status = 'En attente') garantit qu'un minuteur n'est déclenché qu'une fois.
+"""
+import os
+import time
+import heapq
+import datetime
+import threading
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from models import WorkflowTimer, get_utc_now
+from engine import process_timer
+from operators import to_naive_utc
+import metrics
+import task_stats
+
+# Statuts des minuteurs
+PENDING = "En attente"
+FIRED = "Déclenché"
+FAILED = "Échec"
+
+# Configuration (surchargeable par variables d'environnement)
+TIMER_SYNC = float(os.environ.get("WORKFLOW_TIMER_SYNC", "30"))
+
+_wakeup = threading.Event()
+_scheduler = None
+
+def notify():
+    """Demande une resynchronisation immédiate (nouveaux minuteurs armés par ce processus)."""
+    _wakeup.set()
+
+def due_timers(db: Session, until):
+    """Minuteurs en attente arrivant à échéance avant `until` : [(due_at, id, task_id, règle)]."""
+    rows = db.query(WorkflowTimer.due_at, WorkflowTimer.id, WorkflowTimer.task_id, WorkflowTimer.rule_name).filter(
+        WorkflowTimer.status == PENDING, WorkflowTimer.due_at <= until
+    ).order_by(WorkflowTimer.due_at).all()
+    return [(to_naive_utc(row.due_at), row.id, row.task_id, row.rule_name) for row in rows]
+
+def fire_timer(session_factory, timer_id, task_id, rule_name):
+    """
+    Réclame le minuteur (au plus une fois, tous processus confondus) puis exécute sa règle.
+    Retourne True si ce processus l'a déclenché.
+    """
+    db = session_factory()
+    try:
+        res = db.execute(
+            update(WorkflowTimer)
+            .where(WorkflowTimer.id == timer_id, WorkflowTimer.status == PENDING)
+            .values(status=FIRED, fired_at=get_utc_now())
+        )
+        db.commit()
+        if res.rowcount != 1:
+            return False
+        try:
+            process_timer(task_id, rule_name, db)
+            task_stats.invalidate()
+        except Exception as e:
+            db.rollback()
+            print(f"[TIMER] [ERREUR] Minuteur #{timer_id} ('{rule_name}', tâche #{task_id}) : {e}")
+            metrics.inc("liteflow_engine_errors_total", ("timer",))
+            db.execute(
+                update(WorkflowTimer).where(WorkflowTimer.id == timer_id).values(status=FAILED, last_error=str(e))
+            )
+            db.commit()
+        return True
+    finally:
+        db.close()
+
+class TimerScheduler:
+    """Thread d'échéancier : tas des minuteurs proches, réveil à la prochaine échéance."""
+
+    def __init__(self, session_factory, sync_interval=TIMER_SYNC):
+        self.session_factory = session_factory
+        self.sync_interval = sync_interval
+        self._heap = []
+        self._known = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="workflow-timers", daemon=True)
+        self._thread.start()
+        print(f"[TIMER] Planificateur démarré (synchronisation toutes les {self.sync_interval:.0f} s)")
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        _wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def sync(self):
+        """Charge les minuteurs en attente dont l'échéance tombe dans l'horizon."""
+        until = to_naive_utc(get_utc_now()) + datetime.timedelta(seconds=2 * self.sync_interval)
+        db = self.session_factory()
+        try:
+            for entry in due_timers(db, until):
+                if entry[1] not in self._known:
+                    self._known.add(entry[1])
+                    heapq.heappush(self._heap, entry)
+        finally:
+            db.close()
+
+    def run_due(self):
+        """Déclenche les minuteurs échus du tas. Retourne le nombre de minuteurs déclenchés."""
+        now = to_naive_utc(get_utc_now())
+        fired = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, timer_id, task_id, rule_name = heapq.heappop(self._heap)
+            self._known.discard(timer_id)
+            if fire_timer(self.session_factory, timer_id, task_id, rule_name):
+                fired += 1
+        return fired
+
+    def _loop(self):
+        next_sync = 0.0
+        while not self._stop.is_set():
+            try:
+                if _wakeup.is_set() or time.monotonic() >= next_sync:
+                    _wakeup.clear()
+                    self.sync()
+                    next_sync = time.monotonic() + self.sync_interval
+                self.run_due()
+            except Exception as e:
+                print(f"[TIMER] [ERREUR] Planificateur : {e}")
+            wait = next_sync - time.monotonic()
+            if self._heap:
+                wait = min(wait, (self._heap[0][0] - to_naive_utc(get_utc_now())).total_seconds())
+            _wakeup.wait(max(wait, 0.05))
+
+def start(session_factory):
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = TimerScheduler(session_factory)
+    _scheduler.start()
+    return _scheduler
+
+def stop():
+    if _scheduler is not None:
+        _scheduler.stop()